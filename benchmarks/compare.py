@@ -0,0 +1,72 @@
+# compare.py
+#
+# Copyright 2022 Eglenelid Gamaliel Gutierrez Hernandez
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Compares two benchmark results and fails on regressions."""
+
+import argparse
+import json
+import sys
+
+# Slowdown of the median, in percent, reported as a regression
+DEFAULT_THRESHOLD = 10
+
+
+def load_results(path: str) -> dict:
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)["results"]
+
+
+def compare(base: dict, new: dict, threshold: float) -> list:
+    """Prints the change of every benchmark and returns the regressed names."""
+    regressions = []
+    for name in sorted(base.keys() | new.keys()):
+        base_result = base.get(name, {})
+        new_result = new.get(name, {})
+        if "median" not in base_result or "median" not in new_result:
+            print(f"{name:<50} {'missing or skipped':>32}")
+            continue
+
+        base_median = base_result["median"]
+        new_median = new_result["median"]
+        change = (new_median - base_median) * 100 / base_median if base_median else 0
+        regressed = change > threshold
+        if regressed:
+            regressions.append(name)
+
+        marker = "  REGRESSION" if regressed else ""
+        print(f"{name:<50} {base_median * 1000:10.1f} ms {new_median * 1000:10.1f} ms {change:+7.1f}%{marker}")
+
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare two benchmark results")
+    parser.add_argument("base", help="results of the reference run")
+    parser.add_argument("new", help="results of the run to check")
+    parser.add_argument(
+        "--threshold", type=float, default=DEFAULT_THRESHOLD, help="slowdown in percent reported as a regression"
+    )
+    arguments = parser.parse_args()
+
+    regressions = compare(load_results(arguments.base), load_results(arguments.new), arguments.threshold)
+    if regressions:
+        print(f"{len(regressions)} benchmarks regressed more than {arguments.threshold}%")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+# fixtures.py
+#
+# Copyright 2022 Eglenelid Gamaliel Gutierrez Hernandez
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Deterministic fixtures for the benchmarks.
+
+Every fixture is generated from a fixed seed, so two runs on two machines
+measure the same files. Fixtures are only written when missing.
+"""
+
+import argparse
+import os
+import random
+
+# Seed of every generated fixture
+SEED = 20220601
+
+# Number of entries of the generated workspace trees, by scale
+TREE_SIZES = {"small": [10_000], "full": [10_000, 100_000, 500_000]}
+# Size in MiB of the generated text files, by scale
+TEXT_SIZES = {"small": [1, 10], "full": [1, 10, 100, 500]}
+# Size in MiB of the generated single line files, by scale
+MINIFIED_SIZES = {"small": [1], "full": [1, 10]}
+
+# Entries of each generated folder, files and sub folders
+FOLDER_ENTRIES = 40
+FOLDER_SUBFOLDERS = 6
+
+WORDS = (
+    "self return import from class def value index buffer window file folder path open save search "
+    "result query cursor line text page view model node child parent item count size data error none"
+).split()
+EXTENSIONS = (".py", ".js", ".c", ".h", ".md", ".txt", ".json", ".rs")
+
+
+def make_line(rng: random.Random) -> str:
+    indent = "    " * rng.randrange(4)
+    return indent + " ".join(rng.choice(WORDS) for _ in range(rng.randrange(3, 14))) + "\n"
+
+
+def write_text_file(path: str, size: int, seed: int) -> None:
+    """Writes size bytes of source-like text lines."""
+    rng = random.Random(seed)
+    written = 0
+    with open(path, "w", encoding="utf-8") as file:
+        while written < size:
+            # Lines are produced in blocks, a line per write is too slow for 500 MiB
+            block = "".join(make_line(rng) for _ in range(1000))
+            block = block[: size - written]
+            file.write(block)
+            written += len(block)
+
+
+def write_minified_file(path: str, size: int, seed: int) -> None:
+    """Writes size bytes of minified JavaScript on a single line."""
+    rng = random.Random(seed)
+    written = 0
+    with open(path, "w", encoding="utf-8") as file:
+        while written < size:
+            block = "".join(
+                f"function {rng.choice(WORDS)}{index}(a,b){{return a.{rng.choice(WORDS)}+b*{index}}};"
+                for index in range(1000)
+            )
+            block = block[: size - written]
+            file.write(block)
+            written += len(block)
+
+
+def write_tree(root: str, entries: int, seed: int) -> None:
+    """Writes a workspace of small files, FOLDER_ENTRIES per folder, breadth first."""
+    rng = random.Random(seed)
+    os.makedirs(root, exist_ok=True)
+    pending = [root]
+    created = 0
+    while pending and created < entries:
+        folder = pending.pop(0)
+        for index in range(FOLDER_ENTRIES):
+            if created >= entries:
+                break
+            name = f"{rng.choice(WORDS)}_{rng.choice(WORDS)}_{index}"
+            if index < FOLDER_SUBFOLDERS:
+                os.mkdir(os.path.join(folder, name))
+                pending.append(os.path.join(folder, name))
+            else:
+                with open(os.path.join(folder, name + rng.choice(EXTENSIONS)), "w", encoding="utf-8") as file:
+                    file.writelines(make_line(rng) for _ in range(rng.randrange(5, 60)))
+            created += 1
+
+
+def get_fixtures(output: str, scale: str) -> dict:
+    """Generates the missing fixtures and returns their paths by name."""
+    os.makedirs(output, exist_ok=True)
+    fixtures = {}
+
+    for entries in TREE_SIZES[scale]:
+        path = os.path.join(output, f"tree-{entries}")
+        if not os.path.isdir(path):
+            print(f"Generating {path}", flush=True)
+            write_tree(path + ".partial", entries, SEED + entries)
+            os.rename(path + ".partial", path)
+        fixtures[f"tree-{entries}"] = path
+
+    for size in TEXT_SIZES[scale]:
+        path = os.path.join(output, f"text-{size}mb.py")
+        if not os.path.isfile(path):
+            print(f"Generating {path}", flush=True)
+            write_text_file(path + ".partial", size * 1024 * 1024, SEED + size)
+            os.rename(path + ".partial", path)
+        fixtures[f"text-{size}mb"] = path
+
+    for size in MINIFIED_SIZES[scale]:
+        path = os.path.join(output, f"minified-{size}mb.js")
+        if not os.path.isfile(path):
+            print(f"Generating {path}", flush=True)
+            write_minified_file(path + ".partial", size * 1024 * 1024, SEED - size)
+            os.rename(path + ".partial", path)
+        fixtures[f"minified-{size}mb"] = path
+
+    return fixtures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate the benchmark fixtures")
+    parser.add_argument("--output", default=os.path.join("benchmarks", "fixtures"), help="folder of the fixtures")
+    parser.add_argument("--scale", choices=sorted(TREE_SIZES), default="small", help="size of the fixtures")
+    arguments = parser.parse_args()
+    get_fixtures(arguments.output, arguments.scale)
+
+
+if __name__ == "__main__":
+    main()
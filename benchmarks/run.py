@@ -0,0 +1,325 @@
+# run.py
+#
+# Copyright 2022 Eglenelid Gamaliel Gutierrez Hernandez
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Runs the benchmarks and writes their results as JSON.
+
+The editor components are driven directly, on the default main context,
+without the application window. Benchmarks drawing frames need a display,
+run them under Xvfb (xvfb-run -a) or the broadway backend; without one
+they are reported as skipped.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Seconds after which a benchmark iteration is abandoned
+ITERATION_TIMEOUT = 600
+# Query typed one character at a time by the quick open benchmark
+QUICK_OPEN_QUERY = "windowfile"
+
+
+def prepare_environment() -> None:
+    """Compiles the settings schema and keeps the settings in memory.
+
+    Must run before GTK is imported, the user settings are never touched.
+    """
+    schema_dir = tempfile.mkdtemp(prefix="code-benchmark-schemas-")
+    subprocess.run(["glib-compile-schemas", "--targetdir", schema_dir, os.path.join(ROOT, "data")], check=True)
+    os.environ["GSETTINGS_SCHEMA_DIR"] = schema_dir
+    os.environ["GSETTINGS_BACKEND"] = "memory"
+
+
+def run_until(predicate, timeout: float = ITERATION_TIMEOUT) -> None:
+    """Iterates the default main context until predicate returns True."""
+    from gi.repository import GLib
+
+    context = GLib.MainContext.default()
+    deadline = time.perf_counter() + timeout
+    # Wakes the loop up regularly, so the predicate is checked even when idle
+    source_id = GLib.timeout_add(50, lambda: GLib.SOURCE_CONTINUE)
+    try:
+        while not predicate():
+            if time.perf_counter() > deadline:
+                raise TimeoutError("The benchmark iteration did not finish in time")
+            context.iteration(True)
+    finally:
+        GLib.source_remove(source_id)
+
+
+def bench_explorer(tree: str, expand_all: bool) -> float:
+    """Opens a folder in the file explorer model, optionally loading every sub folder."""
+    from gi.repository import Gio
+
+    from src.ignore import WorkspaceIgnore
+    from src.widgets import FileExplorerTreeModel
+
+    requested = set()
+    loaded = set()
+
+    # Folders finish loading once fully enumerated
+    class BenchmarkTreeModel(FileExplorerTreeModel):
+        def load_folder_files(self, node):
+            requested.add(node)
+            super().load_folder_files(node)
+
+        def finish_loading(self, node):
+            super().finish_loading(node)
+            loaded.add(node)
+            if expand_all:
+                for position in range(node.children.get_n_items()):
+                    child = node.children.get_item(position)
+                    if child.is_folder:
+                        self.load_folder(child)
+
+    start = time.perf_counter()
+    model = BenchmarkTreeModel(Gio.File.new_for_path(tree), WorkspaceIgnore(tree))
+    # Sub folders are requested as soon as their parent is loaded
+    run_until(lambda: len(loaded) == len(requested))
+    duration = time.perf_counter() - start
+    model.cancel()
+    return duration
+
+
+def bench_file_index_build(tree: str) -> float:
+    from src.file_index import FileIndex
+    from src.ignore import WorkspaceIgnore
+
+    ready = []
+    start = time.perf_counter()
+    FileIndex(WorkspaceIgnore(tree)).build(ready.append)
+    run_until(lambda: ready)
+    return time.perf_counter() - start
+
+
+def bench_quick_open(tree: str) -> dict:
+    """Times each keystroke of a query, to the first results and to the last ones."""
+    from src.file_index import FileIndex
+    from src.ignore import WorkspaceIgnore
+
+    ready = []
+    index = FileIndex(WorkspaceIgnore(tree))
+    index.build(ready.append)
+    run_until(lambda: ready)
+
+    first_results = []
+    all_results = []
+    for length in range(1, len(QUICK_OPEN_QUERY) + 1):
+        calls = []
+        start = time.perf_counter()
+        index.search(
+            QUICK_OPEN_QUERY[:length], 50, lambda paths, finished: calls.append((time.perf_counter(), finished))
+        )
+        run_until(lambda: calls and calls[-1][1])
+        first_results.append(calls[0][0] - start)
+        all_results.append(calls[-1][0] - start)
+
+    return {"first_results": max(first_results), "all_results": max(all_results)}
+
+
+def load_buffer(path: str):
+    """Streams a file into a new GtkSource.Buffer and returns it with the load time."""
+    from gi.repository import Gio, GtkSource
+
+    from src.loader import FileLoader
+
+    buffer = GtkSource.Buffer()
+    errors = []
+    start = time.perf_counter()
+    loader = FileLoader(Gio.File.new_for_path(path), buffer, lambda fraction: None, errors.append)
+    loader.start()
+    run_until(lambda: errors)
+    if errors[0] is not None:
+        raise errors[0]
+    return buffer, time.perf_counter() - start
+
+
+def bench_file_load(path: str) -> float:
+    return load_buffer(path)[1]
+
+
+def bench_save(path: str) -> float:
+    from gi.repository import Gio
+
+    from src.saver import BufferSaver
+
+    buffer, _duration = load_buffer(path)
+    with tempfile.TemporaryDirectory(prefix="code-benchmark-save-") as folder:
+        errors = []
+        start = time.perf_counter()
+        BufferSaver(Gio.File.new_for_path(os.path.join(folder, "saved")), buffer, False, errors.append).start()
+        run_until(lambda: errors)
+        duration = time.perf_counter() - start
+    if errors[0] is not None:
+        raise errors[0]
+    return duration
+
+
+def bench_open_to_paint(path: str, full_load: bool) -> float:
+    """Opens a file in a code page and times the first frame showing its text, or the whole file."""
+    from gi.repository import Gio, Gtk
+
+    from src.codeview import Codeview
+    from src.loader import FileLoader
+    from src.widgets import CodePage
+
+    window = Gtk.Window(default_width=1000, default_height=700)
+    window.present()
+    run_until(lambda: window.get_mapped())
+
+    painted = []
+    errors = []
+    loaded = []
+    start = time.perf_counter()
+    code_page = CodePage(Codeview())
+    window.set_child(code_page)
+    buffer = code_page.code_view.get_buffer()
+
+    # Frames are watched from the start, the text shows up while it streams in
+    def on_after_paint(clock):
+        if buffer.get_char_count() and (loaded or not full_load):
+            painted.append(time.perf_counter())
+
+    frame_clock = window.get_frame_clock()
+    handler_id = frame_clock.connect("after-paint", on_after_paint)
+    loader = FileLoader(Gio.File.new_for_path(path), buffer, code_page.show_progress, errors.append)
+    code_page.start_loading(loader)
+    if full_load:
+        run_until(lambda: errors)
+        code_page.finish_loading()
+        loaded.append(True)
+        code_page.queue_draw()
+    run_until(lambda: painted or (errors and errors[0] is not None))
+    frame_clock.disconnect(handler_id)
+    code_page.cancel_loading()
+    window.destroy()
+
+    if errors and errors[0] is not None:
+        raise errors[0]
+    return painted[0] - start
+
+
+def get_benchmarks(fixtures: dict) -> list:
+    """Returns the (name, function, needs display) benchmarks for the fixtures."""
+    benchmarks = []
+    for name, path in fixtures.items():
+        if name.startswith("tree-"):
+            benchmarks.append((f"explorer_open/{name}", lambda path=path: bench_explorer(path, False), False))
+            benchmarks.append((f"explorer_expand_all/{name}", lambda path=path: bench_explorer(path, True), False))
+            benchmarks.append((f"file_index_build/{name}", lambda path=path: bench_file_index_build(path), False))
+            benchmarks.append((f"quick_open_keystroke/{name}", lambda path=path: bench_quick_open(path), False))
+        else:
+            benchmarks.append((f"file_load/{name}", lambda path=path: bench_file_load(path), False))
+            benchmarks.append((f"save/{name}", lambda path=path: bench_save(path), False))
+            benchmarks.append((f"open_to_first_paint/{name}", lambda path=path: bench_open_to_paint(path, False), True))
+            benchmarks.append((f"open_to_loaded_paint/{name}", lambda path=path: bench_open_to_paint(path, True), True))
+    return benchmarks
+
+
+def summarize(runs: list) -> dict:
+    return {"runs": runs, "median": statistics.median(runs), "min": min(runs)}
+
+
+def get_metadata(scale: str, repeat: int) -> dict:
+    from gi.repository import Adw, Gtk, GtkSource
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "commit": commit,
+        "scale": scale,
+        "repeat": repeat,
+        "python": platform.python_version(),
+        "gtk": f"{Gtk.get_major_version()}.{Gtk.get_minor_version()}.{Gtk.get_micro_version()}",
+        "adwaita": f"{Adw.get_major_version()}.{Adw.get_minor_version()}.{Adw.get_micro_version()}",
+        "gtksourceview": f"{GtkSource.get_major_version()}.{GtkSource.get_minor_version()}",
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the benchmarks")
+    parser.add_argument(
+        "--fixtures", default=os.path.join(ROOT, "benchmarks", "fixtures"), help="folder of the fixtures"
+    )
+    parser.add_argument("--scale", choices=["small", "full"], default="small", help="size of the fixtures")
+    parser.add_argument("--repeat", type=int, default=3, help="iterations of each benchmark")
+    parser.add_argument("--filter", default="", help="only run the benchmarks whose name contains this text")
+    parser.add_argument("--output", help="results file, benchmarks/results/<date>.json by default")
+    arguments = parser.parse_args()
+
+    prepare_environment()
+    sys.path.insert(0, ROOT)
+
+    import gi
+
+    gi.require_version("Gtk", "4.0")
+    gi.require_version("Adw", "1")
+    gi.require_version("GtkSource", "5")
+    from gi.repository import Gdk
+
+    from benchmarks.fixtures import get_fixtures
+
+    fixtures = get_fixtures(arguments.fixtures, arguments.scale)
+    has_display = Gdk.Display.get_default() is not None
+
+    results = {}
+    for name, function, needs_display in get_benchmarks(fixtures):
+        if arguments.filter not in name:
+            continue
+        if needs_display and not has_display:
+            print(f"{name:<50} skipped, no display", flush=True)
+            results[name] = {"skipped": "no display"}
+            continue
+
+        runs = [function() for _ in range(arguments.repeat)]
+        if isinstance(runs[0], dict):
+            # Benchmarks measuring several values report each one
+            for key in runs[0]:
+                results[f"{name}/{key}"] = summarize([run[key] for run in runs])
+                print(f"{name + '/' + key:<50} {results[name + '/' + key]['median'] * 1000:10.1f} ms", flush=True)
+        else:
+            results[name] = summarize(runs)
+            print(f"{name:<50} {results[name]['median'] * 1000:10.1f} ms", flush=True)
+
+    output = arguments.output or os.path.join(
+        ROOT, "benchmarks", "results", datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + ".json"
+    )
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump({"metadata": get_metadata(arguments.scale, arguments.repeat), "results": results}, file, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
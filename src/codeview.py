@@ -0,0 +1,368 @@
+# codeview.py
+#
+# Copyright 2022 Eglenelid Gamaliel Gutierrez Hernandez
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+
+from gi.repository import Gio, GLib, GObject, Gtk, GtkSource
+
+from .config import get_config
+
+# Let GtkBuilder find the GtkSource widgets once the library is loaded
+GObject.type_register(GtkSource.View)
+
+# Undo levels kept for files opened in large file mode
+LARGE_FILE_UNDO_LEVELS = 10
+
+
+# Subclass GtkSource.View to add custom features.
+class Codeview(GtkSource.View):
+    def __init__(self) -> None:
+        super().__init__()
+
+        # The shared configuration keeps the style scheme of every view up to date
+        self.config = get_config()
+        self.config.add_view(self)
+
+        # Set GtkSource.View properties
+        self.set_show_line_numbers(True)
+        self.set_auto_indent(True)
+        self.set_highlight_current_line(True)
+        self.set_monospace(True)
+        self.set_top_margin(10)
+        self.set_bottom_margin(10)
+
+        self.file = None
+
+        # Large file mode, enabled when a file goes over the configured thresholds
+        self.large_file_mode = False
+        # Set once the user asks for the full features back on a large file
+        self.large_file_opt_out = False
+        self.default_max_undo_levels = self.get_buffer().get_max_undo_levels()
+
+    def release(self) -> None:
+        """Stops receiving the configuration changes once the view is dropped."""
+        self.config.remove_view(self)
+
+    def is_large_file(self, size: int, longest_line: int) -> bool:
+        settings = self.config.settings
+        size_threshold = settings.get_uint("large-file-size-threshold") * 1024
+        line_length_threshold = settings.get_uint("large-file-line-length-threshold")
+        return (0 < size_threshold <= size) or (0 < line_length_threshold <= longest_line)
+
+    def set_large_file_mode(self, enabled: bool) -> None:
+        self.large_file_mode = enabled
+        buffer = self.get_buffer()
+
+        # Turn off the features whose cost grows with the file size or line length
+        buffer.set_highlight_syntax(not enabled)
+        buffer.set_highlight_matching_brackets(not enabled)
+        self.set_highlight_current_line(not enabled)
+        self.set_auto_indent(not enabled)
+
+        # Keep the undo history bounded
+        buffer.set_max_undo_levels(LARGE_FILE_UNDO_LEVELS if enabled else self.default_max_undo_levels)
+
+
+# Milliseconds to wait after a keystroke before compiling the search
+FIND_DELAY = 150
+# Maximum time spent replacing on each main loop iteration
+REPLACE_TIME_BUDGET = 0.008
+
+
+# Find and replace bar of a code view, backed by a GtkSource.SearchContext.
+# The context counts the matches in the background, searches move between
+# matches asynchronously, and replace all works through the matches in
+# short slices inside a single user action, so it is undone at once. The
+# buffer is never replaced into while a save streams it, and the saves
+# requested during a replace all wait for it to finish.
+class FindBar(Gtk.Box):
+    def __init__(self, code_view: Codeview, save_queue) -> Gtk.Box:
+        super().__init__(orientation=Gtk.Orientation.VERTICAL, spacing=6)
+        self.set_margin_start(12)
+        self.set_margin_end(12)
+        self.set_margin_top(6)
+        self.set_margin_bottom(6)
+
+        self.code_view = code_view
+        self.save_queue = save_queue
+        self.search_settings = GtkSource.SearchSettings(wrap_around=True)
+        self.search_context = GtkSource.SearchContext(buffer=code_view.get_buffer(), settings=self.search_settings)
+        self.search_context.connect("notify::occurrences-count", lambda context, pspec: self.update_status())
+        self.cancellable = None
+        self.find_timeout_id = 0
+        self.replace_source_id = 0
+        self.replace_mark = None
+        self.replace_count = 0
+
+        # Search row
+        self.search_entry = Gtk.SearchEntry(hexpand=True, placeholder_text="Find")
+        self.search_entry.connect("changed", self.on_search_changed)
+        self.search_entry.connect("activate", lambda entry: self.find(forward=True))
+        self.search_entry.connect("next-match", lambda entry: self.find(forward=True))
+        self.search_entry.connect("previous-match", lambda entry: self.find(forward=False))
+        self.search_entry.connect("stop-search", lambda entry: self.close())
+        self.regex_button = Gtk.ToggleButton(label=".*", tooltip_text="Regular expression")
+        self.regex_button.connect("toggled", self.on_search_changed)
+        self.case_button = Gtk.ToggleButton(label="Aa", tooltip_text="Match case")
+        self.case_button.connect("toggled", self.on_search_changed)
+        previous_button = Gtk.Button(icon_name="go-up-symbolic", tooltip_text="Previous match")
+        previous_button.connect("clicked", lambda button: self.find(forward=False))
+        next_button = Gtk.Button(icon_name="go-down-symbolic", tooltip_text="Next match")
+        next_button.connect("clicked", lambda button: self.find(forward=True))
+        close_button = Gtk.Button(icon_name="window-close-symbolic", tooltip_text="Close")
+        close_button.connect("clicked", lambda button: self.close())
+        self.status_label = Gtk.Label(width_chars=12, xalign=1)
+        self.status_label.get_style_context().add_class("dim-label")
+
+        search_row = Gtk.Box(spacing=6)
+        for widget in (
+            self.search_entry,
+            self.status_label,
+            self.regex_button,
+            self.case_button,
+            previous_button,
+            next_button,
+            close_button,
+        ):
+            search_row.append(widget)
+        self.append(search_row)
+
+        # Replace row
+        self.replace_entry = Gtk.Entry(hexpand=True, placeholder_text="Replace")
+        self.replace_entry.connect("activate", lambda entry: self.replace())
+        self.replace_button = Gtk.Button(label="Replace")
+        self.replace_button.connect("clicked", lambda button: self.replace())
+        self.replace_all_button = Gtk.Button(label="Replace All")
+        self.replace_all_button.connect("clicked", lambda button: self.replace_all())
+
+        replace_row = Gtk.Box(spacing=6)
+        for widget in (self.replace_entry, self.replace_button, self.replace_all_button):
+            replace_row.append(widget)
+        self.append(replace_row)
+
+    def open(self) -> None:
+        # Search the selected text
+        buffer = self.code_view.get_buffer()
+        bounds = buffer.get_selection_bounds()
+        if bounds and bounds[0].get_line() == bounds[1].get_line():
+            self.search_entry.set_text(buffer.get_text(bounds[0], bounds[1], False))
+
+        self.set_visible(True)
+        self.search_context.set_highlight(True)
+        self.search_entry.grab_focus()
+        self.search_entry.select_region(0, -1)
+
+    def close(self) -> None:
+        self.cancel()
+        self.search_context.set_highlight(False)
+        self.set_visible(False)
+        self.code_view.grab_focus()
+
+    def cancel(self) -> None:
+        """Stops the running search and replace all."""
+        if self.find_timeout_id:
+            GLib.source_remove(self.find_timeout_id)
+            self.find_timeout_id = 0
+        if self.cancellable:
+            self.cancellable.cancel()
+            self.cancellable = None
+        if self.replace_source_id:
+            GLib.source_remove(self.replace_source_id)
+            self.replace_source_id = 0
+            self.finish_replace_all()
+
+    def on_search_changed(self, _widget) -> None:
+        # Compile the expression once the keystrokes settle
+        if self.find_timeout_id:
+            GLib.source_remove(self.find_timeout_id)
+        self.find_timeout_id = GLib.timeout_add(FIND_DELAY, self.on_find_timeout)
+
+    def on_find_timeout(self) -> bool:
+        self.find_timeout_id = 0
+        self.search_settings.set_regex_enabled(self.regex_button.get_active())
+        self.search_settings.set_case_sensitive(self.case_button.get_active())
+        self.search_settings.set_search_text(self.search_entry.get_text() or None)
+        self.update_status()
+
+        # Search as you type, from the start of the selection
+        buffer = self.code_view.get_buffer()
+        bounds = buffer.get_selection_bounds()
+        start = bounds[0] if bounds else buffer.get_iter_at_mark(buffer.get_insert())
+        self.find_from(start, forward=True)
+        return GLib.SOURCE_REMOVE
+
+    def find(self, forward: bool) -> None:
+        # Flush a pending search text first
+        if self.find_timeout_id:
+            GLib.source_remove(self.find_timeout_id)
+            self.on_find_timeout()
+            return
+
+        buffer = self.code_view.get_buffer()
+        bounds = buffer.get_selection_bounds()
+        if bounds:
+            self.find_from(bounds[1] if forward else bounds[0], forward)
+        else:
+            self.find_from(buffer.get_iter_at_mark(buffer.get_insert()), forward)
+
+    def find_from(self, start: Gtk.TextIter, forward: bool) -> None:
+        if not self.search_settings.get_search_text() or self.search_context.get_regex_error():
+            return
+
+        # Only the latest search moves the selection
+        if self.cancellable:
+            self.cancellable.cancel()
+        self.cancellable = Gio.Cancellable()
+        if forward:
+            self.search_context.forward_async(start, self.cancellable, self.on_find_finished, True)
+        else:
+            self.search_context.backward_async(start, self.cancellable, self.on_find_finished, False)
+
+    def on_find_finished(self, search_context: GtkSource.SearchContext, result, forward: bool) -> None:
+        try:
+            if forward:
+                found, match_start, match_end, _wrapped = search_context.forward_finish(result)
+            else:
+                found, match_start, match_end, _wrapped = search_context.backward_finish(result)
+        except GLib.Error as err:
+            # A cancelled search was replaced by a newer one, which keeps its cancellable
+            if not err.matches(Gio.io_error_quark(), Gio.IOErrorEnum.CANCELLED):
+                self.cancellable = None
+            return
+
+        self.cancellable = None
+        if found:
+            self.code_view.get_buffer().select_range(match_start, match_end)
+            self.code_view.scroll_to_mark(self.code_view.get_buffer().get_insert(), 0.0, True, 0.0, 0.5)
+        self.update_status()
+
+    def update_status(self) -> None:
+        if self.replace_source_id:
+            self.status_label.set_label(f"{self.replace_count} replaced")
+            return
+
+        error = self.search_context.get_regex_error()
+        if error is not None:
+            self.status_label.set_label("Invalid")
+            self.status_label.set_tooltip_text(error.message)
+            return
+        self.status_label.set_tooltip_text(None)
+
+        if not self.search_settings.get_search_text():
+            self.status_label.set_label("")
+            return
+
+        # The count is -1 until the background scan of the buffer is done
+        count = self.search_context.get_occurrences_count()
+        buffer = self.code_view.get_buffer()
+        bounds = buffer.get_selection_bounds()
+        position = self.search_context.get_occurrence_position(*bounds) if bounds else -1
+        if count < 0:
+            self.status_label.set_label("...")
+        elif position > 0:
+            self.status_label.set_label(f"{position} of {count}")
+        else:
+            self.status_label.set_label(f"{count} matches")
+
+    def replace(self) -> None:
+        # The replace all in progress owns the buffer until it is done
+        if self.replace_source_id:
+            return
+        if self.save_queue.is_saving():
+            self.status_label.set_label("Saving...")
+            return
+
+        buffer = self.code_view.get_buffer()
+        bounds = buffer.get_selection_bounds()
+        if bounds and self.search_context.get_occurrence_position(*bounds) > 0:
+            replacement = self.replace_entry.get_text()
+            try:
+                self.search_context.replace(bounds[0], bounds[1], replacement, -1)
+            except GLib.Error:
+                return
+        self.find(forward=True)
+
+    def replace_all(self) -> None:
+        if self.replace_source_id or not self.search_settings.get_search_text():
+            return
+        # The file being written must get the text as it was when the save started
+        if self.save_queue.is_saving():
+            self.status_label.set_label("Saving...")
+            return
+
+        # Every replacement joins a single undo action, the view and the saves are locked meanwhile
+        buffer = self.code_view.get_buffer()
+        buffer.begin_user_action()
+        self.code_view.set_editable(False)
+        self.save_queue.hold()
+        self.replace_button.set_sensitive(False)
+        self.replace_all_button.set_sensitive(False)
+        # Rescanning the matches after every replacement is wasted work
+        self.search_context.set_highlight(False)
+
+        # Right gravity keeps the mark after each replacement text
+        self.replace_mark = buffer.create_mark(None, buffer.get_start_iter(), False)
+        self.replace_count = 0
+        self.replace_source_id = GLib.idle_add(self.on_replace_all_idle, self.replace_entry.get_text())
+
+    def on_replace_all_idle(self, replacement: str) -> bool:
+        buffer = self.code_view.get_buffer()
+        deadline = time.perf_counter() + REPLACE_TIME_BUDGET
+        while time.perf_counter() < deadline:
+            position = buffer.get_iter_at_mark(self.replace_mark)
+            found, match_start, match_end, wrapped = self.search_context.forward(position)
+            if not found or wrapped or match_start.compare(position) < 0:
+                self.replace_source_id = 0
+                self.finish_replace_all()
+                return GLib.SOURCE_REMOVE
+
+            empty_match = match_start.equal(match_end)
+            buffer.move_mark(self.replace_mark, match_end)
+            try:
+                self.search_context.replace(match_start, match_end, replacement, -1)
+            except GLib.Error:
+                self.replace_source_id = 0
+                self.finish_replace_all()
+                return GLib.SOURCE_REMOVE
+            self.replace_count += 1
+
+            # Step over empty matches, they would be found again at the same place
+            if empty_match:
+                position = buffer.get_iter_at_mark(self.replace_mark)
+                if not position.forward_char():
+                    self.replace_source_id = 0
+                    self.finish_replace_all()
+                    return GLib.SOURCE_REMOVE
+                buffer.move_mark(self.replace_mark, position)
+
+        self.update_status()
+        return GLib.SOURCE_CONTINUE
+
+    def finish_replace_all(self) -> None:
+        buffer = self.code_view.get_buffer()
+        buffer.delete_mark(self.replace_mark)
+        self.replace_mark = None
+        buffer.end_user_action()
+
+        self.code_view.set_editable(True)
+        self.replace_button.set_sensitive(True)
+        self.replace_all_button.set_sensitive(True)
+        self.search_context.set_highlight(self.get_visible())
+        self.status_label.set_label(f"{self.replace_count} replaced")
+
+        # Write the saves requested meanwhile, they lock the view again
+        self.save_queue.release()
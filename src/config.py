@@ -0,0 +1,122 @@
+# config.py
+#
+# Copyright 2022 Eglenelid Gamaliel Gutierrez Hernandez
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import fnmatch
+import os
+import re
+import weakref
+
+from gi.repository import Gio, GLib
+
+SCHEMA_ID = "dev.eglenelidgamaliel.code"
+
+_config = None
+
+
+def get_config():
+    """Returns the configuration shared by the whole application."""
+    global _config
+    if _config is None:
+        _config = EditorConfig()
+    return _config
+
+
+# Single settings object and resolved resources shared by every window and
+# view. The style scheme and the languages are looked up once and cached,
+# and the code views are updated in a single pass on idle when the
+# settings change, instead of each view watching the settings on its own.
+class EditorConfig:
+    def __init__(self) -> None:
+        self.settings = Gio.Settings(schema_id=SCHEMA_ID)
+        self.settings.connect("changed", self.on_settings_changed)
+
+        # Code views to update, dropped views are forgotten on their own
+        self.views = weakref.WeakSet()
+        self.pending_keys = set()
+        self.flush_source_id = 0
+
+        self._style_scheme = None
+        # Language of each (extension or name, content type)
+        self._languages = {}
+        # Matches the file names a language is known by, like meson.build
+        self._name_pattern = None
+
+    def get_style_scheme(self):
+        if self._style_scheme is None:
+            from gi.repository import GtkSource
+
+            style_scheme_id = self.settings.get_string("code-view-style-scheme")
+            self._style_scheme = GtkSource.StyleSchemeManager.get_default().get_scheme(style_scheme_id)
+        return self._style_scheme
+
+    def get_language_key(self, path: str) -> str:
+        """Returns what the language of a file is guessed from, "*" and its extension or its name."""
+        name = os.path.basename(path)
+        extension = os.path.splitext(name)[1]
+        if not extension or self.get_name_pattern().fullmatch(name):
+            return name
+        return f"*{extension}"
+
+    def get_name_pattern(self):
+        if self._name_pattern is None:
+            from gi.repository import GtkSource
+
+            # Every glob that is more than an extension must be matched on the whole name
+            manager = GtkSource.LanguageManager.get_default()
+            patterns = []
+            for language_id in manager.get_language_ids():
+                for glob in manager.get_language(language_id).get_globs() or []:
+                    if not re.fullmatch(r"\*\.[^*?\[.]+", glob):
+                        patterns.append(fnmatch.translate(glob))
+            self._name_pattern = re.compile("|".join(patterns) or "(?!)")
+        return self._name_pattern
+
+    def guess_language(self, path: str, content_type=None):
+        """Returns the GtkSource.Language of a file, or None."""
+        key = (self.get_language_key(path), content_type)
+        if key not in self._languages:
+            from gi.repository import GtkSource
+
+            # Guess from a name only made of the key, any file sharing it gets the same answer
+            name = f"file{key[0][1:]}" if key[0].startswith("*") else key[0]
+            self._languages[key] = GtkSource.LanguageManager.get_default().guess_language(name, content_type)
+        return self._languages[key]
+
+    def add_view(self, code_view) -> None:
+        self.views.add(code_view)
+        code_view.get_buffer().set_style_scheme(self.get_style_scheme())
+
+    def remove_view(self, code_view) -> None:
+        self.views.discard(code_view)
+
+    def on_settings_changed(self, settings: Gio.Settings, key: str) -> None:
+        # Bursts of changes are applied once
+        self.pending_keys.add(key)
+        if not self.flush_source_id:
+            self.flush_source_id = GLib.idle_add(self.flush_changes)
+
+    def flush_changes(self) -> bool:
+        self.flush_source_id = 0
+        keys, self.pending_keys = self.pending_keys, set()
+
+        if "code-view-style-scheme" in keys:
+            self._style_scheme = None
+            style_scheme = self.get_style_scheme()
+            for code_view in list(self.views):
+                code_view.get_buffer().set_style_scheme(style_scheme)
+
+        return GLib.SOURCE_REMOVE
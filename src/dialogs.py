@@ -0,0 +1,70 @@
+# dialogs.py
+#
+# Copyright 2022 Eglenelid Gamaliel Gutierrez Hernandez
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from gi.repository import Adw, Gio, Gtk, GtkSource
+
+from .config import get_config
+
+
+# About dialog
+class AboutDialog(Gtk.AboutDialog):
+    def __init__(self, parent):
+        Gtk.AboutDialog.__init__(self)
+        self.props.program_name = "Code"
+        self.props.version = "0.0.1"
+        self.props.authors = ["Eglenelid Gamaliel Gutierrez Hernandez"]
+        self.props.copyright = "2022 Eglenelid Gamaliel Gutierrez Hernandez"
+        self.props.logo_icon_name = "dev.eglenelidgamaliel.code"
+        self.props.modal = True
+        self.set_transient_for(parent)
+
+
+# Preferences dialog
+@Gtk.Template(resource_path="/dev/eglenelidgamaliel/code/gtk/preferences_window.ui")
+class PreferencesWindow(Adw.PreferencesWindow):
+    __gtype_name__ = "PreferencesWindow"
+
+    preferences_style_group = Gtk.Template.Child()
+    workspace_excludes_entry = Gtk.Template.Child()
+    workspace_max_file_size_spin = Gtk.Template.Child()
+
+    def __init__(self, window):
+        Adw.PreferencesWindow.__init__(self)
+
+        self.props.modal = True
+        self.set_transient_for(window)
+
+        self.settings = get_config().settings
+
+        style_chooser = GtkSource.StyleSchemeChooserWidget()
+        style_chooser.connect("notify::style-scheme", self.on_scheme_changed)
+
+        self.preferences_style_group.add(style_chooser)
+
+        # Workspace scanning
+        self.workspace_excludes_entry.set_text(", ".join(self.settings.get_strv("workspace-excludes")))
+        self.workspace_excludes_entry.connect("changed", self.on_workspace_excludes_changed)
+        self.settings.bind(
+            "workspace-max-file-size", self.workspace_max_file_size_spin, "value", Gio.SettingsBindFlags.DEFAULT
+        )
+
+    def on_scheme_changed(self, widget, param):
+        self.settings.set_string("code-view-style-scheme", widget.get_style_scheme().get_id())
+
+    def on_workspace_excludes_changed(self, entry):
+        excludes = [pattern.strip() for pattern in entry.get_text().split(",")]
+        self.settings.set_strv("workspace-excludes", [pattern for pattern in excludes if pattern])
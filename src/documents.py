@@ -0,0 +1,140 @@
+# documents.py
+#
+# Copyright 2022 Eglenelid Gamaliel Gutierrez Hernandez
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import zlib
+from collections import OrderedDict
+
+# Characters of text kept by the content cache
+CONTENT_CACHE_SIZE = 32 * 1024 * 1024
+# Files bigger than this are never cached
+CONTENT_CACHE_ENTRY_SIZE = 1024 * 1024
+# Bytes sampled at the start of the file to tell text from binary content
+BINARY_SAMPLE_SIZE = 8192
+
+
+def get_canonical_path(path: str) -> str:
+    """Returns the path used to tell if two paths are the same document."""
+    return os.path.realpath(path)
+
+
+def get_file_stamp(path: str):
+    """Returns the (mtime, size) pair used to validate cached contents, or None."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def is_binary(sample: bytes) -> bool:
+    if b"\0" in sample:
+        return True
+    try:
+        sample.decode("utf-8")
+    except UnicodeDecodeError as err:
+        # A character cut at the end of the sample is not a sign of binary content
+        return err.start < len(sample) - 3
+    return False
+
+
+# Maps the canonical path of every open file to its tab, so opening a file
+# that is already open focuses its tab instead of reading it again.
+class DocumentRegistry:
+    def __init__(self) -> None:
+        self._pages = {}
+
+    def get(self, path: str):
+        return self._pages.get(get_canonical_path(path))
+
+    def register(self, path: str, page) -> None:
+        self.unregister(page)
+        self._pages[get_canonical_path(path)] = page
+
+    def unregister(self, page) -> None:
+        for path in [path for path, registered_page in self._pages.items() if registered_page is page]:
+            del self._pages[path]
+
+
+# Bounded LRU cache of recently read file contents.
+# Entries are validated against the file modification time and size, so a
+# file changed on disk is always read again.
+class ContentCache:
+    def __init__(self, max_size: int = CONTENT_CACHE_SIZE, max_entry_size: int = CONTENT_CACHE_ENTRY_SIZE) -> None:
+        self.max_size = max_size
+        self.max_entry_size = max_entry_size
+        self.size = 0
+        self._entries = OrderedDict()
+
+    def get(self, path: str, stamp):
+        """Returns the cached (text, longest_line) of path if still valid, or None."""
+        path = get_canonical_path(path)
+        entry = self._entries.get(path)
+        if entry is None:
+            return None
+
+        if stamp is None or entry[0] != stamp:
+            self._remove(path)
+            return None
+
+        self._entries.move_to_end(path)
+        return entry[1], entry[2]
+
+    def put(self, path: str, stamp, text: str, longest_line: int) -> None:
+        if stamp is None or len(text) > self.max_entry_size:
+            return
+
+        path = get_canonical_path(path)
+        self._remove(path)
+        self._entries[path] = (stamp, text, longest_line)
+        self.size += len(text)
+
+        # Evict the least recently used entries
+        while self.size > self.max_size:
+            _path, (_stamp, evicted_text, _longest_line) = self._entries.popitem(last=False)
+            self.size -= len(evicted_text)
+
+    def _remove(self, path: str) -> None:
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+
+# What is left of a tab once its code view is dropped to save memory.
+# Clean files are read again from disk, modified buffers keep their text
+# compressed, since it exists nowhere else.
+class HibernatedDocument:
+    def __init__(self, path, cursor: int = 0, top: int = 0, text=None, modified: bool = False) -> None:
+        # Path of the file, None for untitled tabs
+        self.path = path
+        # Character offsets of the cursor and of the first visible line
+        self.cursor = cursor
+        self.top = top
+        self.modified = modified
+        self.compressed_text = None
+        # Bytes of the kept text, compared against the large file threshold
+        self.size = 0
+        if text is not None:
+            data = text.encode("utf-8")
+            self.size = len(data)
+            self.compressed_text = zlib.compress(data, 1)
+
+    def get_text(self):
+        """Returns the text kept by the document, or None if it must be read from its file."""
+        if self.compressed_text is None:
+            return None
+        return zlib.decompress(self.compressed_text).decode("utf-8")
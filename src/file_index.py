@@ -0,0 +1,236 @@
+# file_index.py
+#
+# Copyright 2022 Eglenelid Gamaliel Gutierrez Hernandez
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import heapq
+import os
+import re
+import threading
+import time
+from bisect import bisect_right
+
+from gi.repository import GLib
+
+from . import tracing
+from .ignore import walk_workspace
+
+# Maximum time spent matching on each main loop iteration
+SEARCH_TIME_BUDGET = 0.008
+# Number of characters of the index matched between two time checks
+SEARCH_CHUNK_SIZE = 64 * 1024
+# Characters that start a new word inside a path
+WORD_SEPARATORS = "/_-. "
+
+
+def score_path(query: str, path: str, name_start: int) -> int:
+    """Scores how well a lowercased path matches a fuzzy query.
+
+    Consecutive characters, characters at the start of a word and
+    characters inside the file name score higher, shorter paths win ties.
+    """
+    score = 0
+
+    # Strongly prefer the query as a plain substring of the file name
+    position = path.find(query, name_start)
+    if position == name_start:
+        score += 150
+    elif position >= 0:
+        score += 100
+
+    previous = -2
+    start = 0
+    for char in query:
+        index = path.find(char, start)
+        if index == previous + 1:
+            score += 8
+        elif index == 0 or path[index - 1] in WORD_SEPARATORS:
+            score += 6
+        if index >= name_start:
+            score += 2
+        previous = index
+        start = index + 1
+
+    return score - len(path) // 8
+
+
+# Prebuilt index of the workspace file paths for the quick open finder.
+# All the lowercased relative paths are joined into a single string, so a
+# query is matched with one regular expression scan instead of a Python
+# loop over every file.
+class FileIndex:
+    def __init__(self, ignore) -> None:
+        self.ignore = ignore
+        self.folder_path = ignore.folder_path
+        self.paths = []
+        self.text = ""
+        self.line_starts = []
+        self.ready = False
+        self.stale = False
+
+        self._cancel_event = threading.Event()
+
+    def build(self, callback=None) -> None:
+        """Walks the workspace on a worker thread and calls callback when done."""
+        thread = threading.Thread(target=self._build_thread, args=(callback,), daemon=True)
+        thread.start()
+
+    def cancel(self) -> None:
+        self._cancel_event.set()
+
+    def _build_thread(self, callback) -> None:
+        with tracing.span("Scan workspace", "scan"):
+            paths = [
+                self.ignore.get_relative_path(entry.path) for entry in walk_workspace(self.ignore, self._cancel_event)
+            ]
+
+        if not self._cancel_event.is_set():
+            GLib.idle_add(self._on_build_finished, paths, callback)
+
+    def _on_build_finished(self, paths, callback) -> bool:
+        if self._cancel_event.is_set():
+            return GLib.SOURCE_REMOVE
+
+        self.set_paths(paths)
+        if callback:
+            callback(self)
+        return GLib.SOURCE_REMOVE
+
+    def set_paths(self, paths) -> None:
+        lowered_paths = [path.lower() for path in paths]
+        self.paths = paths
+        self.text = "".join(f"{path}\n" for path in lowered_paths)
+
+        # Offset of every path inside the joined text
+        self.line_starts = []
+        offset = 0
+        for path in lowered_paths:
+            self.line_starts.append(offset)
+            offset += len(path) + 1
+
+        self.ready = True
+        self.stale = False
+
+    def update(self, added_files, removed_paths) -> None:
+        """Applies the file explorer changes to the index.
+
+        The joined search text is only rebuilt by the next search, so bursts
+        of changes do not rebuild it once per batch. The paths list is
+        replaced, never changed in place, since running searches read it.
+        """
+        if not self.ready:
+            return
+
+        paths = self.paths
+        if removed_paths:
+            removed = {os.path.relpath(path, self.folder_path) for path in removed_paths}
+            removed_folders = tuple(f"{path}/" for path in removed)
+            paths = [path for path in paths if path not in removed and not path.startswith(removed_folders)]
+
+        self.paths = paths + [os.path.relpath(path, self.folder_path) for path in added_files]
+        self.stale = True
+
+    def get_absolute_path(self, relative_path: str) -> str:
+        return os.path.join(self.folder_path, relative_path)
+
+    def search(self, query: str, limit: int, callback):
+        """Starts a cancellable search and returns its FileIndexSearch.
+
+        The index is scanned in time-bounded slices from the main loop, after
+        each slice callback receives the best `limit` relative paths so far
+        and whether the whole index was scanned.
+        """
+        if self.stale:
+            self.set_paths(self.paths)
+
+        search = FileIndexSearch(self, query, limit, callback)
+        search.start()
+        return search
+
+
+# A running search over a FileIndex, only the best results are kept.
+# The search keeps the paths and text of the index as they were when it
+# started, so updates applied meanwhile never shift its results.
+class FileIndexSearch:
+    def __init__(self, index: FileIndex, query: str, limit: int, callback) -> None:
+        self.paths = index.paths
+        self.text = index.text
+        self.line_starts = index.line_starts
+        self.query = query.lower()
+        self.limit = limit
+        self.callback = callback
+
+        # Match the query characters in order, taking the first occurrence of
+        # each one so the expression never needs to backtrack
+        parts = [re.escape(self.query[0])]
+        for char in self.query[1:]:
+            parts.append(f"[^\n{re.escape(char)}]*{re.escape(char)}")
+        self.pattern = re.compile("".join(parts))
+
+        self._position = 0
+        self._results = []
+        self._source_id = 0
+
+    def start(self) -> None:
+        self._source_id = GLib.idle_add(self._on_idle)
+
+    def cancel(self) -> None:
+        if self._source_id:
+            GLib.source_remove(self._source_id)
+            self._source_id = 0
+
+    def _on_idle(self) -> bool:
+        text = self.text
+        deadline = time.perf_counter() + SEARCH_TIME_BUDGET
+
+        with tracing.span("Quick open slice"):
+            while self._position < len(text):
+                # Always stop a slice at the end of a line
+                end = text.find("\n", min(self._position + SEARCH_CHUNK_SIZE, len(text) - 1)) + 1
+                self._match_slice(text, self._position, end)
+                self._position = end
+
+                if time.perf_counter() > deadline:
+                    break
+
+        # Report the best results found so far, so the first ones show up
+        # after a single slice even when the whole index takes longer
+        finished = self._position >= len(text)
+        results = sorted(self._results, key=lambda item: (-item[0], item[1]))
+        self.callback([self.paths[index] for _score, index in results], finished)
+
+        if finished:
+            self._source_id = 0
+            return GLib.SOURCE_REMOVE
+        return GLib.SOURCE_CONTINUE
+
+    def _match_slice(self, text: str, start: int, end: int) -> None:
+        query = self.query
+        line_starts = self.line_starts
+        results = self._results
+        line_end = start
+        for match in self.pattern.finditer(text, start, end):
+            # Only the first match of each line is scored
+            if match.start() < line_end:
+                continue
+            line_start = text.rfind("\n", 0, match.start()) + 1
+            line_end = text.index("\n", match.end())
+            path = text[line_start:line_end]
+
+            score = score_path(query, path, path.rfind("/") + 1)
+            if len(results) < self.limit:
+                heapq.heappush(results, (score, bisect_right(line_starts, line_start) - 1))
+            elif score > results[0][0]:
+                heapq.heapreplace(results, (score, bisect_right(line_starts, line_start) - 1))
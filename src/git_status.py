@@ -0,0 +1,250 @@
+# git_status.py
+#
+# Copyright 2022 Eglenelid Gamaliel Gutierrez Hernandez
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import subprocess
+import sys
+import threading
+
+from gi.repository import Gio, GLib
+
+from . import tracing
+
+# Milliseconds to wait after a change before running git again, bursts run it once
+GIT_STATUS_DELAY = 300
+# Files of the git folder whose changes mean the status changed
+GIT_WATCHED_FILES = ("index", "HEAD")
+
+# Status letters shown in the file explorer
+STATUS_MODIFIED = "M"
+STATUS_ADDED = "A"
+STATUS_DELETED = "D"
+STATUS_RENAMED = "R"
+STATUS_CONFLICTED = "U"
+STATUS_UNTRACKED = "?"
+
+# Letter of each porcelain change code, type changes show as modifications
+CHANGE_STATUSES = {
+    "M": STATUS_MODIFIED,
+    "T": STATUS_MODIFIED,
+    "A": STATUS_ADDED,
+    "D": STATUS_DELETED,
+    "R": STATUS_RENAMED,
+    "C": STATUS_ADDED,
+}
+
+
+def parse_porcelain_v2(data: bytes) -> dict:
+    """Returns the status letter of every changed path of `git status --porcelain=v2 -z`.
+
+    Paths are relative to the repository root, untracked folders end with a
+    slash and stand for every file inside them.
+    """
+    statuses = {}
+    fields = data.split(b"\0")
+    index = 0
+    while index < len(fields):
+        field = fields[index]
+        index += 1
+        if not field:
+            continue
+
+        kind = field[:1]
+        if kind == b"1":
+            parts = field.split(b" ", 8)
+        elif kind == b"2":
+            parts = field.split(b" ", 9)
+            # The original path of a rename follows in its own field
+            index += 1
+        elif kind == b"u":
+            statuses[os.fsdecode(field.split(b" ", 10)[10])] = STATUS_CONFLICTED
+            continue
+        elif kind == b"?":
+            statuses[os.fsdecode(field[2:])] = STATUS_UNTRACKED
+            continue
+        else:
+            continue
+
+        # The work tree change is what the user sees, the staged one otherwise
+        index_change, work_tree_change = parts[1].decode()
+        change = work_tree_change if work_tree_change != "." else index_change
+        statuses[os.fsdecode(parts[-1])] = CHANGE_STATUSES.get(change, STATUS_MODIFIED)
+    return statuses
+
+
+# Git status of a workspace, read by running git in a subprocess on a worker
+# thread. Only the changed paths are listed by git, so the cached map stays
+# small even in repositories with hundreds of thousands of tracked files.
+# The status is read again when the index or HEAD of the repository change,
+# or when refresh is called, and changed_callback is called once per run
+# that changed any status.
+class GitStatusProvider:
+    def __init__(self, folder_path: str, changed_callback) -> None:
+        self.folder_path = folder_path
+        self.changed_callback = changed_callback
+
+        # Status letter of every changed absolute path
+        self.statuses = {}
+        # Absolute paths of the untracked folders and of the folders holding changes
+        self.untracked_folders = set()
+        self.changed_folders = set()
+
+        self.monitor = None
+        self.refresh_source_id = 0
+        self.running = False
+        self.pending = False
+        self.closed = False
+
+    def start(self) -> None:
+        self.run()
+
+    def close(self) -> None:
+        self.closed = True
+        if self.monitor:
+            self.monitor.cancel()
+            self.monitor = None
+        if self.refresh_source_id:
+            GLib.source_remove(self.refresh_source_id)
+            self.refresh_source_id = 0
+
+    def refresh(self) -> None:
+        """Reads the status again shortly, after a file is saved or changed."""
+        if not self.refresh_source_id and not self.closed:
+            self.refresh_source_id = GLib.timeout_add(GIT_STATUS_DELAY, self.on_refresh_timeout)
+
+    def on_refresh_timeout(self) -> bool:
+        self.refresh_source_id = 0
+        self.run()
+        return GLib.SOURCE_REMOVE
+
+    def run(self) -> None:
+        # A single git process at a time, the changes seen meanwhile run it once more
+        if self.running:
+            self.pending = True
+            return
+
+        self.running = True
+        thread = threading.Thread(target=self._status_thread, daemon=True)
+        thread.start()
+
+    def get_status(self, path: str, is_folder: bool = False):
+        """Returns the status letter of a path, or None if it is unchanged."""
+        status = self.statuses.get(path)
+        if status is not None:
+            return status
+        if is_folder and path in self.changed_folders:
+            return STATUS_MODIFIED
+
+        # Files of untracked folders are not listed one by one
+        if self.untracked_folders:
+            parent = os.path.dirname(path)
+            while len(parent) > 1:
+                if parent in self.untracked_folders:
+                    return STATUS_UNTRACKED
+                parent = os.path.dirname(parent)
+        return None
+
+    def _status_thread(self) -> None:
+        # Left to None by an unexpected error, the previous status is kept
+        result = (None, None)
+        try:
+            with tracing.span("Git status", "git"):
+                try:
+                    git_folders = [
+                        os.fsdecode(line)
+                        for line in subprocess.run(
+                            ["git", "rev-parse", "--show-toplevel", "--absolute-git-dir"],
+                            cwd=self.folder_path,
+                            capture_output=True,
+                            check=True,
+                        ).stdout.splitlines()
+                    ]
+                    # Only the workspace is listed, optional locks would write the
+                    # index and wake the monitor up again
+                    output = subprocess.run(
+                        ["git", "--no-optional-locks", "status", "--porcelain=v2", "-z", "--", "."],
+                        cwd=self.folder_path,
+                        capture_output=True,
+                        check=True,
+                    ).stdout
+                except (OSError, subprocess.CalledProcessError):
+                    # Not a repository, or git is not installed
+                    git_folders = None
+                    output = b""
+
+                statuses = {}
+                if git_folders:
+                    # Git reports resolved paths, the explorer uses the workspace path as opened
+                    root = git_folders[0]
+                    real_folder_path = os.path.realpath(self.folder_path)
+                    for path, status in parse_porcelain_v2(output).items():
+                        path = os.path.join(root, path)
+                        if path.startswith(f"{real_folder_path}/"):
+                            path = self.folder_path + path[len(real_folder_path) :]
+                        statuses[path] = status
+                result = (git_folders, statuses)
+        finally:
+            # Always handed back, so running is reset and the next run can start
+            GLib.idle_add(self._on_status_finished, *result)
+
+    def _on_status_finished(self, git_folders, statuses) -> bool:
+        self.running = False
+        if self.closed:
+            return GLib.SOURCE_REMOVE
+
+        # A failed run keeps the previous status
+        if statuses is not None:
+            self.apply_statuses(git_folders, statuses)
+
+        if self.pending:
+            self.pending = False
+            self.refresh()
+        return GLib.SOURCE_REMOVE
+
+    def apply_statuses(self, git_folders, statuses) -> None:
+        if git_folders and self.monitor is None:
+            self.start_monitoring(git_folders[1])
+
+        untracked_folders = {path.rstrip("/") for path in statuses if path.endswith("/")}
+        statuses = {path.rstrip("/"): status for path, status in statuses.items()}
+        changed_folders = set()
+        for path in statuses:
+            parent = os.path.dirname(path)
+            while len(parent) > 1 and parent not in changed_folders:
+                changed_folders.add(parent)
+                parent = os.path.dirname(parent)
+
+        # Most runs change nothing, the rows are only decorated again when needed
+        if statuses != self.statuses or untracked_folders != self.untracked_folders:
+            self.statuses = statuses
+            self.untracked_folders = untracked_folders
+            self.changed_folders = changed_folders
+            self.changed_callback()
+
+    def start_monitoring(self, git_folder: str) -> None:
+        # The index and HEAD are replaced by renaming lock files, watch the folder
+        try:
+            self.monitor = Gio.File.new_for_path(git_folder).monitor_directory(Gio.FileMonitorFlags.WATCH_MOVES, None)
+        except GLib.Error as err:
+            print(f"The git folder could not be monitored: {err}", file=sys.stderr)
+            return
+        self.monitor.connect("changed", self.on_git_folder_changed)
+
+    def on_git_folder_changed(self, monitor, file: Gio.File, other_file, event_type) -> None:
+        names = {file.get_basename(), other_file.get_basename() if other_file else None}
+        if names.intersection(GIT_WATCHED_FILES):
+            self.refresh()
@@ -0,0 +1,126 @@
+# hibernation.py
+#
+# Copyright 2022 Eglenelid Gamaliel Gutierrez Hernandez
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+
+from gi.repository import Adw, Gio, GLib
+
+from .documents import HibernatedDocument
+from .widgets import CodePage
+
+# Seconds to wait after the tabs change before checking the memory budget
+HIBERNATE_CHECK_DELAY = 5
+# Rough memory used by a buffer for each character, including its tags and undo history
+BYTES_PER_CHARACTER = 8
+# Rough memory used by a code view and its buffer regardless of the text
+VIEW_OVERHEAD = 256 * 1024
+
+
+def estimate_page_memory(code_page: CodePage) -> int:
+    return VIEW_OVERHEAD + code_page.code_view.get_buffer().get_char_count() * BYTES_PER_CHARACTER
+
+
+# Keeps the memory used by the code views of the tabs under a budget.
+# When the budget is exceeded, the tabs selected the longest time ago drop
+# their code view: clean files keep only their path and cursor position,
+# modified buffers keep their text compressed. A hibernated tab is rebuilt
+# by restore_callback when it is selected again.
+class TabHibernator:
+    def __init__(self, tab_view: Adw.TabView, settings: Gio.Settings, content_cache, restore_callback) -> None:
+        self.tab_view = tab_view
+        self.settings = settings
+        # Clean buffers are put in the content cache, to be rebuilt without reading them again
+        self.content_cache = content_cache
+        # Called with the Adw.TabPage to rebuild
+        self.restore_callback = restore_callback
+        self.check_source_id = 0
+
+        tab_view.connect("notify::selected-page", self.on_selected_page_changed)
+        tab_view.connect("page-attached", lambda tab_view, page, position: self.queue_check())
+
+    def get_budget(self) -> int:
+        return self.settings.get_uint("tab-memory-budget") * 1024 * 1024
+
+    def queue_check(self) -> None:
+        if not self.check_source_id and self.get_budget():
+            self.check_source_id = GLib.timeout_add_seconds(HIBERNATE_CHECK_DELAY, self.on_check)
+
+    def on_selected_page_changed(self, tab_view: Adw.TabView, _pspec) -> None:
+        page = tab_view.get_selected_page()
+        if page is None:
+            return
+
+        code_page = page.get_child()
+        if isinstance(code_page, CodePage):
+            code_page.last_selected = time.monotonic()
+            if code_page.hibernated is not None:
+                self.restore_callback(page)
+        self.queue_check()
+
+    def can_hibernate(self, page: Adw.TabPage) -> bool:
+        code_page = page.get_child()
+        return (
+            isinstance(code_page, CodePage)
+            and code_page.code_view is not None
+            and not page.get_selected()
+            and code_page.loader is None
+            and not (
+                code_page.save_queue is not None and (code_page.save_queue.is_saving() or code_page.save_queue.held)
+            )
+        )
+
+    def on_check(self) -> bool:
+        self.check_source_id = 0
+
+        awake_pages = []
+        used_memory = 0
+        for position in range(self.tab_view.get_n_pages()):
+            page = self.tab_view.get_nth_page(position)
+            code_page = page.get_child()
+            if isinstance(code_page, CodePage) and code_page.code_view is not None:
+                used_memory += estimate_page_memory(code_page)
+                awake_pages.append(page)
+
+        # Hibernate the least recently selected tabs until the views fit
+        budget = self.get_budget()
+        awake_pages.sort(key=lambda page: page.get_child().last_selected)
+        for page in awake_pages:
+            if used_memory <= budget:
+                break
+            if self.can_hibernate(page):
+                used_memory -= estimate_page_memory(page.get_child())
+                self.hibernate(page)
+
+        return GLib.SOURCE_REMOVE
+
+    def hibernate(self, page: Adw.TabPage) -> None:
+        code_page = page.get_child()
+        code_view = code_page.code_view
+        buffer = code_view.get_buffer()
+        path = code_view.file.get_path() if code_view.file else None
+        cursor = buffer.get_iter_at_mark(buffer.get_insert()).get_offset()
+        top = code_page.get_top_offset()
+        text = buffer.get_text(buffer.get_start_iter(), buffer.get_end_iter(), False)
+
+        if path is not None and code_page.file_stamp and code_page.is_clean():
+            # The file on disk holds the text, the cache may avoid reading it again
+            self.content_cache.put(path, code_page.file_stamp, text, code_page.longest_line)
+            document = HibernatedDocument(path, cursor, top)
+        else:
+            document = HibernatedDocument(path, cursor, top, text, buffer.get_modified())
+
+        code_page.hibernate(document)
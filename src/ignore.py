@@ -0,0 +1,238 @@
+# ignore.py
+#
+# Copyright 2022 Eglenelid Gamaliel Gutierrez Hernandez
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import re
+
+from gi.repository import Gio, GLib
+
+# Files holding ignore rules, later files take precedence over earlier ones
+IGNORE_FILE_NAMES = (".gitignore", ".ignore")
+
+
+def translate_glob(glob: str) -> str:
+    """Translates a .gitignore glob into a regular expression."""
+    regex = []
+    index = 0
+    length = len(glob)
+    while index < length:
+        char = glob[index]
+        if glob.startswith("**/", index) and (index == 0 or glob[index - 1] == "/"):
+            # Leading or middle "**/" matches zero or more folders
+            regex.append("(?:.*/)?")
+            index += 3
+            continue
+        if glob.startswith("**", index) and index + 2 == length and (index == 0 or glob[index - 1] == "/"):
+            # Trailing "/**" matches everything inside
+            regex.append(".*")
+            index += 2
+            continue
+
+        if char == "*":
+            regex.append("[^/]*")
+        elif char == "?":
+            regex.append("[^/]")
+        elif char == "\\" and index + 1 < length:
+            index += 1
+            regex.append(re.escape(glob[index]))
+        elif char == "[":
+            end = glob.find("]", index + 2)
+            if end < 0:
+                regex.append(re.escape(char))
+            else:
+                characters = glob[index + 1 : end].replace("\\", "\\\\")
+                if characters.startswith("!"):
+                    characters = "^" + characters[1:]
+                regex.append(f"[{characters}]")
+                index = end
+        else:
+            regex.append(re.escape(char))
+        index += 1
+
+    return "".join(regex)
+
+
+def compile_rules(lines) -> list:
+    """Compiles .gitignore lines into groups of (regex, negate, folder_only).
+
+    Consecutive rules with the same outcome share a single regular
+    expression, the groups keep the file order so the last match wins.
+    """
+    groups = []
+    for line in lines:
+        line = line.rstrip("\n").rstrip(" ")
+        if not line or line.startswith("#"):
+            continue
+
+        negate = line.startswith("!")
+        if negate or line.startswith("\\"):
+            line = line[1:]
+
+        folder_only = line.endswith("/")
+        line = line.rstrip("/")
+        if not line:
+            continue
+
+        # Patterns with a slash are relative to the ignore file folder,
+        # the others match a name at any depth
+        regex = translate_glob(line.lstrip("/"))
+        if "/" not in line:
+            regex = f"(?:.*/)?{regex}"
+
+        if groups and groups[-1][1:] == (negate, folder_only):
+            groups[-1][0].append(regex)
+        else:
+            groups.append(([regex], negate, folder_only))
+
+    return [
+        (re.compile("|".join(f"(?:{regex})" for regex in regexes)), negate, folder_only)
+        for regexes, negate, folder_only in groups
+    ]
+
+
+def match_rules(rules: list, relative_path: str, is_folder: bool):
+    """Returns True if ignored, False if re-included and None if no rule matches."""
+    for regex, negate, folder_only in reversed(rules):
+        if folder_only and not is_folder:
+            continue
+        if regex.fullmatch(relative_path):
+            return not negate
+    return None
+
+
+# Ignore matcher shared by every workspace walker.
+# It honors the .gitignore and .ignore files of each folder, read once and
+# cached, plus the user exclude list, which always wins.
+class WorkspaceIgnore:
+    def __init__(self, folder_path: str, excludes=(), max_file_size: int = 0) -> None:
+        self.folder_path = folder_path.rstrip("/")
+        self.exclude_rules = compile_rules(excludes)
+        # Size in bytes over which files are not read by content walkers, 0 disables it
+        self.max_file_size = max_file_size
+
+        self._folder_rules = {}
+
+    @classmethod
+    def new_from_settings(cls, folder_path: str, settings):
+        return cls(
+            folder_path,
+            settings.get_strv("workspace-excludes"),
+            settings.get_uint("workspace-max-file-size") * 1024,
+        )
+
+    def get_relative_path(self, path: str) -> str:
+        return path[len(self.folder_path) + 1 :]
+
+    def get_relative_folder(self, path: str) -> str:
+        return self.get_relative_path(path) if path != self.folder_path else ""
+
+    def has_folder_rules(self, path: str) -> bool:
+        return self.get_relative_folder(path) in self._folder_rules
+
+    def load_folder_rules_async(self, path: str, cancellable, callback=None) -> None:
+        """Reads the ignore files of a folder without blocking the main loop.
+
+        The rules are cached, replacing the previous ones only once read,
+        then callback is called. Worker threads read the files with
+        get_folder_rules instead.
+        """
+        relative_folder = self.get_relative_folder(path)
+        contents = {}
+
+        def on_load_contents(file, result, file_name):
+            try:
+                _success, data, _etag = file.load_contents_finish(result)
+                contents[file_name] = data.decode("utf-8")
+            except (GLib.Error, UnicodeError):
+                contents[file_name] = ""
+
+            if len(contents) < len(IGNORE_FILE_NAMES) or cancellable.is_cancelled():
+                return
+            lines = []
+            for name in IGNORE_FILE_NAMES:
+                lines.extend(contents[name].splitlines())
+            self._folder_rules[relative_folder] = compile_rules(lines)
+            if callback:
+                callback()
+
+        for file_name in IGNORE_FILE_NAMES:
+            Gio.File.new_for_path(os.path.join(path, file_name)).load_contents_async(
+                cancellable, on_load_contents, file_name
+            )
+
+    def get_folder_rules(self, relative_folder: str) -> list:
+        rules = self._folder_rules.get(relative_folder)
+        if rules is None:
+            lines = []
+            for file_name in IGNORE_FILE_NAMES:
+                try:
+                    with open(os.path.join(self.folder_path, relative_folder, file_name), encoding="utf-8") as file:
+                        lines.extend(file)
+                except (OSError, UnicodeError):
+                    continue
+            rules = compile_rules(lines)
+            self._folder_rules[relative_folder] = rules
+        return rules
+
+    def is_ignored(self, path: str, is_folder: bool) -> bool:
+        relative_path = self.get_relative_path(path)
+        if match_rules(self.exclude_rules, relative_path, is_folder):
+            return True
+
+        # The closest ignore file with a matching rule decides
+        parent = relative_path
+        while parent:
+            parent = parent.rpartition("/")[0]
+            rules = self.get_folder_rules(parent)
+            if rules:
+                result = match_rules(rules, relative_path[len(parent) + 1 :] if parent else relative_path, is_folder)
+                if result is not None:
+                    return result
+
+        return False
+
+    def is_too_large(self, size: int) -> bool:
+        return 0 < self.max_file_size < size
+
+
+def walk_workspace(ignore: WorkspaceIgnore, cancel_event=None):
+    """Yields an os.DirEntry for every workspace file that is not ignored.
+
+    Ignored folders are pruned before they are enumerated. Meant to run on
+    a worker thread, the walk stops early once cancel_event is set.
+    """
+    pending = [ignore.folder_path]
+    while pending:
+        if cancel_event is not None and cancel_event.is_set():
+            return
+
+        try:
+            with os.scandir(pending.pop()) as entries:
+                for entry in entries:
+                    if entry.name.startswith("."):
+                        continue
+
+                    is_folder = entry.is_dir(follow_symlinks=False)
+                    if ignore.is_ignored(entry.path, is_folder):
+                        continue
+
+                    if is_folder:
+                        pending.append(entry.path)
+                    elif entry.is_file():
+                        yield entry
+        except OSError:
+            continue
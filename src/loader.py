@@ -0,0 +1,147 @@
+# loader.py
+#
+# Copyright 2022 Eglenelid Gamaliel Gutierrez Hernandez
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import codecs
+
+from gi.repository import Gio, GLib, Gtk
+
+from . import tracing
+
+# Number of bytes read from the file on each iteration
+LOAD_CHUNK_SIZE = 256 * 1024
+
+
+# Streams a file into a Gtk.TextBuffer.
+# The file is read in fixed size chunks and decoded incrementally, so a
+# multi-byte character split between two chunks is decoded once complete.
+# Each chunk is inserted from an idle callback and the next one is only
+# requested afterwards, so at most one chunk is held in memory.
+class FileLoader:
+    def __init__(self, file: Gio.File, buffer: Gtk.TextBuffer, progress_callback, finished_callback) -> None:
+        self.file = file
+        self.buffer = buffer
+        # Called with the loaded fraction, or None when the size is unknown
+        self.progress_callback = progress_callback
+        # Called with None on success or with the error that stopped the load
+        self.finished_callback = finished_callback
+
+        self.cancellable = Gio.Cancellable()
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.stream = None
+        self.size = 0
+        self.bytes_read = 0
+        self.idle_source_id = 0
+
+        # Length of the longest line seen so far and of the line still being read
+        self.longest_line = 0
+        self.line_length = 0
+        self.trace_id = 0
+
+    def start(self) -> None:
+        self.trace_id = tracing.async_begin("Load file", path=self.file.get_path())
+        self.file.read_async(GLib.PRIORITY_DEFAULT, self.cancellable, self.on_read)
+
+    def cancel(self) -> None:
+        """Stops loading, the callbacks are not called afterwards."""
+        self.cancellable.cancel()
+        if self.idle_source_id:
+            GLib.source_remove(self.idle_source_id)
+            self.idle_source_id = 0
+        self.close_stream()
+
+    def close_stream(self) -> None:
+        if self.stream:
+            self.stream.close_async(GLib.PRIORITY_DEFAULT, None, None, None)
+            self.stream = None
+
+    def finish(self, error) -> None:
+        self.close_stream()
+        tracing.async_end("Load file", self.trace_id, bytes=self.bytes_read, failed=error is not None)
+        self.finished_callback(error)
+
+    def on_read(self, file: Gio.File, result) -> None:
+        try:
+            self.stream = file.read_finish(result)
+        except GLib.Error as err:
+            if not self.cancellable.is_cancelled():
+                self.finish(err)
+            return
+
+        self.stream.query_info_async(
+            Gio.FILE_ATTRIBUTE_STANDARD_SIZE, GLib.PRIORITY_DEFAULT, self.cancellable, self.on_query_info
+        )
+
+    def on_query_info(self, stream: Gio.FileInputStream, result) -> None:
+        try:
+            self.size = stream.query_info_finish(result).get_size()
+        except GLib.Error:
+            if self.cancellable.is_cancelled():
+                return
+
+        self.read_next_chunk()
+
+    def read_next_chunk(self) -> None:
+        self.stream.read_bytes_async(LOAD_CHUNK_SIZE, GLib.PRIORITY_DEFAULT, self.cancellable, self.on_read_bytes)
+
+    def on_read_bytes(self, stream: Gio.InputStream, result) -> None:
+        try:
+            data = stream.read_bytes_finish(result).get_data()
+        except GLib.Error as err:
+            if not self.cancellable.is_cancelled():
+                self.finish(err)
+            return
+
+        # An empty read means the end of the file, flush the decoder
+        try:
+            with tracing.span("Decode chunk", bytes=len(data)):
+                text = self.decoder.decode(data, final=not data)
+                self.measure_lines(text)
+        except UnicodeError as err:
+            self.finish(err)
+            return
+
+        self.bytes_read += len(data)
+        self.idle_source_id = GLib.idle_add(self.on_insert_chunk, text, not data)
+
+    def measure_lines(self, text: str) -> None:
+        lines = text.split("\n")
+        # The first piece continues the line left open by the previous chunk
+        self.line_length += len(lines[0])
+        if len(lines) > 1:
+            self.longest_line = max(self.longest_line, self.line_length, *map(len, lines[1:-1]))
+            self.line_length = len(lines[-1])
+        self.longest_line = max(self.longest_line, self.line_length)
+
+    def on_insert_chunk(self, text: str, last: bool) -> bool:
+        self.idle_source_id = 0
+
+        # Report before inserting, so the view can degrade before it renders the chunk
+        self.progress_callback(self.bytes_read / self.size if self.size else None)
+
+        # Loading the file is not something the user can undo
+        if text:
+            with tracing.span("Insert chunk", characters=len(text)):
+                self.buffer.begin_irreversible_action()
+                self.buffer.insert(self.buffer.get_end_iter(), text)
+                self.buffer.end_irreversible_action()
+
+        if last:
+            self.finish(None)
+        else:
+            self.read_next_chunk()
+
+        return GLib.SOURCE_REMOVE
@@ -16,6 +16,10 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import sys
+import time
+
+# Start of the first phase reported by --profile-startup
+START_TIME = time.perf_counter()
 
 import gi
 
@@ -23,18 +27,44 @@ gi.require_version("Gtk", "4.0")
 gi.require_version("Adw", "1")
 gi.require_version("GtkSource", "5")
 
-from gi.repository import Adw, Gdk, Gio, GObject, Gtk, GtkSource
-
-from .window import AboutDialog, CodeWindow, PreferencesWindow
+from gi.repository import Adw, Gdk, Gio, GLib, Gtk
 
-GObject.type_register(GtkSource.View)
+from . import tracing
+from .config import get_config
+from .profiler import StartupProfiler
 
 
 class CodeApplication(Adw.Application):
-    """The main application singleton class."""
+    """The main application singleton class.
+
+    Only what the greeter needs is loaded before the first frame, the
+    editor, the dialogs and GtkSource are imported when first used.
+    """
+
+    def __init__(self, profiler=None):
+        super().__init__(application_id="dev.eglenelidgamaliel.code", flags=Gio.ApplicationFlags.HANDLES_OPEN)
+
+        self.profiler = profiler
+        self.profile_startup = False
+        self.add_main_option(
+            "profile-startup",
+            0,
+            GLib.OptionFlags.NONE,
+            GLib.OptionArg.NONE,
+            "Print the time to the first frame of each startup phase and quit",
+            None,
+        )
+
+        if self.profiler:
+            self.profiler.mark("Application")
+
+    def do_handle_local_options(self, options):
+        self.profile_startup = options.contains("profile-startup")
+        # Keep going with the default handling
+        return -1
 
-    def __init__(self):
-        super().__init__(application_id="dev.eglenelidgamaliel.code", flags=Gio.ApplicationFlags.FLAGS_NONE)
+    def do_startup(self):
+        Adw.Application.do_startup(self)
 
         # Add application actions
         self.create_action("about", self.on_about_action)
@@ -47,17 +77,28 @@ class CodeApplication(Adw.Application):
         self.set_accels_for_action("win.new_file", ["<Ctrl>n"])
         self.set_accels_for_action("win.open_file", ["<Ctrl>o"])
         self.set_accels_for_action("win.open_folder", ["<Ctrl><Shift>o"])
+        self.set_accels_for_action("win.quick_open", ["<Ctrl>p"])
+        self.set_accels_for_action("win.project_search", ["<Ctrl><Shift>f"])
+        self.set_accels_for_action("win.go_to_symbol", ["<Ctrl>t"])
         # Edit actions
+        self.set_accels_for_action("win.find", ["<Ctrl>f"])
         self.set_accels_for_action("win.save", ["<Ctrl>s"])
         self.set_accels_for_action("win.save_as", ["<Ctrl><Shift>s"])
+        self.set_accels_for_action("win.save_all", ["<Ctrl><Alt>s"])
         # Application actions
         self.set_accels_for_action("app.preferences", ["<Ctrl>comma"])
         self.set_accels_for_action("app.quit", ["<Ctrl>q"])
 
-        # Set the application custom css
+        # Set the application custom css, the display only exists once started
         css = b"""
-            treeview.navigation-sidebar {border-radius: 5px; padding: 2px 2px 2px 2px;}
-            treeview.navigation-sidebar > *:hover {background-color: @headerbar_bg_color;}
+            listview.navigation-sidebar {border-radius: 5px; padding: 2px 2px 2px 2px;}
+            listview.navigation-sidebar > row:hover {background-color: @headerbar_bg_color;}
+            .large-file-banner {background-color: alpha(@accent_bg_color, 0.15); padding: 6px 12px;}
+            label.git-status {font-weight: bold; margin-right: 6px;}
+            label.git-modified {color: @warning_color;}
+            label.git-added, label.git-untracked {color: @success_color;}
+            label.git-renamed {color: @accent_color;}
+            label.git-conflicted {color: @error_color;}
         """
         style_provider = Gtk.CssProvider()
         style_provider.load_from_data(css)
@@ -65,24 +106,88 @@ class CodeApplication(Adw.Application):
             Gdk.Display.get_default(), style_provider, Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION
         )
 
+        # Trace the hot paths when asked by the settings or the environment
+        tracing.enable_from_environment()
+        if get_config().settings.get_boolean("tracing-enabled"):
+            tracing.enable()
+
+        if self.profiler:
+            self.profiler.mark("Startup")
+
+    def do_shutdown(self):
+        # Let the journal writer finish, a journal removed on quit must not come back
+        from .recovery import wait_for_journal_writes
+        from .search import shutdown_pool
+
+        shutdown_pool()
+        wait_for_journal_writes()
+        tracing.write()
+        Adw.Application.do_shutdown(self)
+
     def do_activate(self):
         """Called when the application is activated.
 
         We raise the application's main window, creating it if
         necessary.
         """
+        self.get_window().present()
+
+    def do_open(self, files, n_files, hint):
+        """Called with the files given on the command line.
+
+        When the app is already running, the files given to a new
+        invocation are forwarded over D-Bus and opened here at once.
+        """
+        win = self.get_window()
+        win.open_files(files)
+        win.present()
+
+    def get_window(self):
+        """Returns the main window, creating it if necessary."""
         win = self.props.active_window
         if not win:
+            from .window import CodeWindow
+
+            if self.profiler:
+                self.profiler.mark("Window import")
             win = CodeWindow(application=self)
-        win.present()
+            if self.profiler:
+                self.profiler.mark("Window")
+            win.restore_session()
+            if self.profiler:
+                self.profiler.mark("Session")
+            win.offer_recovery()
+            tracing.watch_frames(win)
+
+            if self.profile_startup and self.profiler:
+                win.connect("map", self.on_window_map)
+        return win
+
+    def on_window_map(self, win):
+        if self.profiler is None:
+            return
+        self.profiler.mark("Present")
+        frame_clock = win.get_frame_clock()
+        self.after_paint_handler_id = frame_clock.connect("after-paint", self.on_first_frame)
+
+    def on_first_frame(self, frame_clock):
+        frame_clock.disconnect(self.after_paint_handler_id)
+        self.profiler.mark("Draw")
+        self.profiler.report()
+        self.profiler = None
+        self.quit()
 
     def on_about_action(self, widget, _):
         """Callback for the app.about action."""
+        from .dialogs import AboutDialog
+
         about = AboutDialog(self.props.active_window)
         about.present()
 
     def on_preferences_action(self, widget, _):
         """Callback for the app.preferences action."""
+        from .dialogs import PreferencesWindow
+
         about = PreferencesWindow(self.props.active_window)
         about.present()
 
@@ -103,10 +208,18 @@ class CodeApplication(Adw.Application):
 
     def on_quit(self, _, _2):
         """Callback for the app.quit action."""
+        from .window import CodeWindow
+
+        for window in self.get_windows():
+            if isinstance(window, CodeWindow):
+                window.save_session()
+                window.discard_journals()
         self.quit()
 
 
 def main(version):
     """The application's entry point."""
-    app = CodeApplication()
+    profiler = StartupProfiler(START_TIME)
+    profiler.mark("Imports")
+    app = CodeApplication(profiler)
     return app.run(sys.argv)
@@ -0,0 +1,49 @@
+# profiler.py
+#
+# Copyright 2022 Eglenelid Gamaliel Gutierrez Hernandez
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import time
+
+# Milliseconds the startup should take to draw its first frame
+STARTUP_BUDGET = 500
+
+
+# Records how long each startup phase takes until the first frame is drawn.
+# Phases are closed by mark(), in the order they run, and are only reported
+# when the app is started with --profile-startup.
+class StartupProfiler:
+    def __init__(self, start: float) -> None:
+        # time.perf_counter() value at which the first phase started
+        self.start = start
+        self.last = start
+        self.phases = []
+
+    def mark(self, phase: str) -> None:
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def report(self, file=sys.stderr) -> bool:
+        """Prints the phase durations and returns True if the startup fits the budget."""
+        total = (self.last - self.start) * 1000
+        for phase, duration in self.phases:
+            print(f"{phase:<16}{duration * 1000:8.1f} ms", file=file)
+        print(f"{'First frame':<16}{total:8.1f} ms (budget {STARTUP_BUDGET} ms)", file=file)
+        if total > STARTUP_BUDGET:
+            print(f"Startup is {total - STARTUP_BUDGET:.1f} ms over budget", file=file)
+            return False
+        return True
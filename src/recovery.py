@@ -0,0 +1,346 @@
+# recovery.py
+#
+# Copyright 2022 Eglenelid Gamaliel Gutierrez Hernandez
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+import queue
+import sys
+import threading
+import uuid
+
+from gi.repository import GLib
+
+from . import tracing
+from .documents import get_file_stamp
+
+# Bumped when the journal format changes, older journals are ignored
+JOURNAL_VERSION = 1
+# Milliseconds to wait after an edit before handing the records to the writer
+JOURNAL_FLUSH_DELAY = 1000
+# Bytes of records written after which the journal is replaced by a snapshot
+# of the buffer, or the size of the buffer if bigger, so a snapshot never
+# costs more than the records it replaces
+JOURNAL_COMPACT_SIZE = 1024 * 1024
+# Extension of the journal files
+JOURNAL_SUFFIX = ".journal"
+
+_writer = None
+
+
+def get_journal_folder() -> str:
+    return os.path.join(GLib.get_user_data_dir(), "dev.eglenelidgamaliel.code", "recovery")
+
+
+def get_journal_writer():
+    """Returns the writer thread shared by every journal, starting it if needed."""
+    global _writer
+    if _writer is None:
+        _writer = JournalWriter()
+    return _writer
+
+
+def wait_for_journal_writes() -> None:
+    """Blocks until every queued journal write is done, on shutdown."""
+    if _writer is not None:
+        _writer.jobs.join()
+
+
+def list_journals() -> list:
+    """Returns the paths of the journals left by a previous run."""
+    folder = get_journal_folder()
+    try:
+        names = os.listdir(folder)
+    except OSError:
+        return []
+    return [os.path.join(folder, name) for name in sorted(names) if name.endswith(JOURNAL_SUFFIX)]
+
+
+def read_journal(journal_path: str):
+    """Returns the header and the records of a journal.
+
+    Raises ValueError when the journal can not be read.
+    """
+    try:
+        with open(journal_path, encoding="utf-8") as file:
+            lines = file.read().split("\n")
+    except (OSError, UnicodeDecodeError) as err:
+        raise ValueError(f"The journal could not be read: {err}") from err
+
+    try:
+        header = json.loads(lines[0])
+    except ValueError as err:
+        raise ValueError("The journal has no header") from err
+    if not isinstance(header, dict) or header.get("version") != JOURNAL_VERSION:
+        raise ValueError("The journal has an unknown format")
+
+    if not isinstance(header.get("path"), (str, type(None))):
+        raise ValueError("The journal has an unknown format")
+
+    records = []
+    for line in lines[1:]:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            # The last record may have been cut by the crash
+            break
+        if not is_valid_record(record):
+            raise ValueError("The journal is damaged")
+        records.append(record)
+    return header, records
+
+
+def is_valid_record(record) -> bool:
+    if not isinstance(record, list) or not record:
+        return False
+    if record[0] == "i":
+        return len(record) == 3 and isinstance(record[1], int) and isinstance(record[2], str)
+    if record[0] == "d":
+        return len(record) == 3 and isinstance(record[1], int) and isinstance(record[2], int)
+    if record[0] == "s":
+        return len(record) == 2 and isinstance(record[1], str)
+    return False
+
+
+def replay_journal(header: dict, records, buffer) -> None:
+    """Rebuilds the text of a journal read by read_journal in a buffer.
+
+    Edits are replayed onto the last snapshot, or onto the file the
+    journal started from, which must not have changed since. The buffer
+    tree makes each edit cheap, even on big files. Raises ValueError when
+    the text can not be rebuilt.
+    """
+    # Only the edits after the last snapshot matter
+    snapshots = [index for index, record in enumerate(records) if record[0] == "s"]
+    if snapshots:
+        text = records[snapshots[-1]][1]
+        records = records[snapshots[-1] + 1 :]
+    elif header["path"] is None:
+        text = ""
+    else:
+        stamp = get_file_stamp(header["path"])
+        if stamp is None or list(stamp) != header.get("stamp"):
+            raise ValueError("The file changed since the journal started")
+        try:
+            # Line endings are kept as they are, the offsets count every character
+            with open(header["path"], encoding="utf-8", newline="") as file:
+                text = file.read()
+        except (OSError, UnicodeDecodeError) as err:
+            raise ValueError(f"The file could not be read: {err}") from err
+
+    with tracing.span("Replay journal", records=len(records)):
+        buffer.set_text(text)
+        for record in records:
+            kind, offset = record[0], record[1]
+            if not 0 <= offset <= buffer.get_char_count():
+                raise ValueError("The journal does not match the file")
+            if kind == "i":
+                buffer.insert(buffer.get_iter_at_offset(offset), record[2])
+            elif kind == "d":
+                buffer.delete(buffer.get_iter_at_offset(offset), buffer.get_iter_at_offset(offset + record[2]))
+
+
+def remove_journal(journal_path: str) -> None:
+    get_journal_writer().jobs.put(("remove", journal_path, None))
+
+
+# Writes the journals on a single worker thread, in the order the jobs were
+# queued, so the main loop never waits for the disk.
+class JournalWriter:
+    def __init__(self) -> None:
+        self.jobs = queue.Queue()
+        self._thread = threading.Thread(target=self._write_thread, daemon=True)
+        self._thread.start()
+
+    def _write_thread(self) -> None:
+        while True:
+            kind, path, data = self.jobs.get()
+            try:
+                with tracing.span("Write journal", "recovery", kind=kind):
+                    if kind == "append":
+                        os.makedirs(os.path.dirname(path), exist_ok=True)
+                        with open(path, "a", encoding="utf-8") as file:
+                            file.write(data)
+                    elif kind == "snapshot":
+                        # Written to a temporary file and renamed, a crash never leaves half a snapshot
+                        header, text = data
+                        os.makedirs(os.path.dirname(path), exist_ok=True)
+                        GLib.file_set_contents(path, (header + json.dumps(["s", text]) + "\n").encode("utf-8"))
+                    elif kind == "remove" and os.path.exists(path):
+                        os.remove(path)
+            except (OSError, GLib.Error) as err:
+                print(f"The recovery journal could not be written: {err}", file=sys.stderr)
+            finally:
+                self.jobs.task_done()
+
+
+# Append-only log of the edits made to a buffer since it matched its file.
+# The insert-text and delete-range signals are turned into compact records,
+# consecutive typing or deleting being merged into a single record, and the
+# records are handed to the writer thread a moment after the last edit. Once
+# enough records are written the log is replaced by a snapshot of the text.
+# Nothing is written for buffers that are never edited.
+class DocumentJournal:
+    def __init__(self, path=None, stamp=None) -> None:
+        self.journal_path = os.path.join(get_journal_folder(), f"{uuid.uuid4().hex}{JOURNAL_SUFFIX}")
+        # File the edits apply to and its stamp when it matched the buffer, None when untitled
+        self.path = path
+        self.stamp = stamp
+
+        self.buffer = None
+        self.handler_ids = []
+        self.flush_source_id = 0
+
+        # Record being extended by consecutive edits, and the records to write.
+        # Records are ["i", offset, text], ["d", offset, length] and ["s", text]
+        self.current = None
+        self.records = []
+        # Bytes of records written since the journal started or was last compacted
+        self.written_size = 0
+        # Whether the journal file was started
+        self.started = False
+
+    @classmethod
+    def resume(cls, journal_path: str, header: dict, records):
+        """Returns a journal going on with the file of a recovered one."""
+        stamp = header.get("stamp")
+        journal = cls(header["path"], tuple(stamp) if stamp else None)
+        journal.journal_path = journal_path
+        journal.started = True
+        try:
+            journal.written_size = os.path.getsize(journal_path)
+        except OSError:
+            journal.written_size = 0
+        return journal
+
+    def attach(self, buffer) -> None:
+        """Starts recording the edits of a buffer holding the journal text."""
+        self.detach()
+        self.buffer = buffer
+        self.handler_ids = [
+            buffer.connect("insert-text", self.on_insert_text),
+            buffer.connect("delete-range", self.on_delete_range),
+        ]
+
+    def detach(self) -> None:
+        if self.buffer is None:
+            return
+
+        for handler_id in self.handler_ids:
+            self.buffer.disconnect(handler_id)
+        self.handler_ids = []
+        self.buffer = None
+        self.flush()
+
+    def reset(self, path, stamp) -> None:
+        """Forgets the edits once the buffer matches the file again, after a save or a reload."""
+        self.cancel_flush()
+        self.current = None
+        self.records = []
+        self.path = path
+        self.stamp = stamp
+        if self.started:
+            remove_journal(self.journal_path)
+            self.started = False
+        self.written_size = 0
+
+    def discard(self) -> None:
+        """Removes the journal, when the document is closed on purpose."""
+        # The pending records would only be written to be removed
+        self.current = None
+        self.records = []
+        self.detach()
+        self.reset(None, None)
+
+    def snapshot(self, text: str) -> None:
+        """Replaces the journal with the whole text, so it no longer depends on the file."""
+        self.cancel_flush()
+        self.current = None
+        self.records = []
+        self.written_size = 0
+        self.started = True
+        # Encoding a big text is left to the writer thread as well
+        get_journal_writer().jobs.put(("snapshot", self.journal_path, (self.get_header(), text)))
+
+    def get_header(self) -> str:
+        stamp = list(self.stamp) if self.stamp else None
+        return json.dumps({"version": JOURNAL_VERSION, "path": self.path, "stamp": stamp}) + "\n"
+
+    def encode(self, records) -> str:
+        return "".join(json.dumps(record) + "\n" for record in records)
+
+    def on_insert_text(self, buffer, location, text: str, length: int) -> None:
+        offset = location.get_offset()
+        current = self.current
+        if current is not None and current[0] == "i" and current[1] + len(current[2]) == offset:
+            current[2] += text
+        else:
+            self.push(["i", offset, text])
+
+    def on_delete_range(self, buffer, start, end) -> None:
+        start_offset = start.get_offset()
+        end_offset = end.get_offset()
+        current = self.current
+        if current is not None and current[0] == "d" and current[1] == end_offset:
+            # Backspace extends the deletion backwards
+            current[1] = start_offset
+            current[2] += end_offset - start_offset
+        elif current is not None and current[0] == "d" and current[1] == start_offset:
+            # Delete extends it forwards
+            current[2] += end_offset - start_offset
+        else:
+            self.push(["d", start_offset, end_offset - start_offset])
+
+    def push(self, record) -> None:
+        if self.current is not None:
+            self.records.append(self.current)
+        self.current = record
+        if not self.flush_source_id:
+            self.flush_source_id = GLib.timeout_add(JOURNAL_FLUSH_DELAY, self.on_flush_timeout)
+
+    def on_flush_timeout(self) -> bool:
+        self.flush_source_id = 0
+        self.flush()
+        return GLib.SOURCE_REMOVE
+
+    def cancel_flush(self) -> None:
+        if self.flush_source_id:
+            GLib.source_remove(self.flush_source_id)
+            self.flush_source_id = 0
+
+    def flush(self) -> None:
+        """Hands the pending records to the writer thread."""
+        self.cancel_flush()
+        if self.current is not None:
+            self.records.append(self.current)
+            self.current = None
+        if not self.records:
+            return
+
+        data = self.encode(self.records)
+
+        # Too many records make the replay slow, start over from the current text
+        buffer = self.buffer
+        if buffer is not None and self.written_size + len(data) > max(JOURNAL_COMPACT_SIZE, buffer.get_char_count()):
+            self.snapshot(buffer.get_text(buffer.get_start_iter(), buffer.get_end_iter(), False))
+            return
+
+        if not self.started:
+            data = self.get_header() + data
+            self.started = True
+        self.written_size += len(data)
+        self.records = []
+        get_journal_writer().jobs.put(("append", self.journal_path, data))
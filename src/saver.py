@@ -0,0 +1,214 @@
+# saver.py
+#
+# Copyright 2022 Eglenelid Gamaliel Gutierrez Hernandez
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from gi.repository import Gio, GLib, Gtk
+
+from . import tracing
+
+# Number of buffer lines encoded and written on each iteration
+SAVE_CHUNK_LINES = 4096
+# Maximum characters of a chunk, long lines are cut into several chunks
+SAVE_CHUNK_CHARACTERS = 1024 * 1024
+
+
+# Streams a Gtk.TextBuffer into a file.
+# The buffer is encoded and written one range of lines at a time, cut
+# inside lines longer than a chunk, so only a chunk of its text is ever
+# copied. The file is written through
+# Gio.File.replace_async, which writes to a temporary file and renames it
+# over the target when the stream is closed, so a failed save never leaves
+# a truncated file behind.
+class BufferSaver:
+    def __init__(self, file: Gio.File, buffer: Gtk.TextBuffer, make_backup: bool, finished_callback) -> None:
+        self.file = file
+        self.buffer = buffer
+        self.make_backup = make_backup
+        # Called with None on success or with the error that stopped the save
+        self.finished_callback = finished_callback
+
+        self.cancellable = Gio.Cancellable()
+        self.stream = None
+        # Character offset of the next chunk
+        self.offset = 0
+        self.pending_data = b""
+        self.trace_id = 0
+
+    def start(self) -> None:
+        self.trace_id = tracing.async_begin("Save file", path=self.file.get_path())
+        self.file.replace_async(
+            None,
+            self.make_backup,
+            Gio.FileCreateFlags.NONE,
+            GLib.PRIORITY_DEFAULT,
+            self.cancellable,
+            self.on_replace,
+        )
+
+    def finish(self, error) -> None:
+        if error is not None and self.stream:
+            # Closing a replace stream with a cancelled cancellable drops the
+            # temporary file and leaves the original file untouched
+            self.cancellable.cancel()
+            self.stream.close_async(GLib.PRIORITY_DEFAULT, self.cancellable, None, None)
+        self.stream = None
+        tracing.async_end("Save file", self.trace_id, failed=True)
+        self.finished_callback(error)
+
+    def on_replace(self, file: Gio.File, result) -> None:
+        try:
+            self.stream = file.replace_finish(result)
+        except GLib.Error as err:
+            self.finish(err)
+            return
+
+        self.write_next_chunk()
+
+    def write_next_chunk(self) -> None:
+        start = self.buffer.get_iter_at_offset(self.offset)
+        if start.is_end():
+            self.stream.close_async(GLib.PRIORITY_DEFAULT, self.cancellable, self.on_close)
+            return
+
+        # Encode the next range of lines only, or part of a long line
+        end = start.copy()
+        end.forward_lines(SAVE_CHUNK_LINES)
+        if end.get_offset() - self.offset > SAVE_CHUNK_CHARACTERS:
+            end = self.buffer.get_iter_at_offset(self.offset + SAVE_CHUNK_CHARACTERS)
+        self.offset = end.get_offset()
+
+        with tracing.span("Encode chunk"):
+            self.pending_data = self.buffer.get_text(start, end, False).encode("utf-8")
+        self.write_pending_data()
+
+    def write_pending_data(self) -> None:
+        self.stream.write_bytes_async(
+            GLib.Bytes.new(self.pending_data), GLib.PRIORITY_DEFAULT, self.cancellable, self.on_write
+        )
+
+    def on_write(self, stream: Gio.OutputStream, result) -> None:
+        try:
+            written = stream.write_bytes_finish(result)
+        except GLib.Error as err:
+            self.finish(err)
+            return
+
+        # Streams may accept only part of the data
+        self.pending_data = self.pending_data[written:]
+        if self.pending_data:
+            self.write_pending_data()
+        else:
+            self.write_next_chunk()
+
+    def on_close(self, stream: Gio.OutputStream, result) -> None:
+        try:
+            stream.close_finish(result)
+        except GLib.Error as err:
+            self.stream = None
+            tracing.async_end("Save file", self.trace_id, failed=True)
+            self.finished_callback(err)
+            return
+
+        self.stream = None
+        tracing.async_end("Save file", self.trace_id)
+        self.finished_callback(None)
+
+
+# Serializes the saves of one document.
+# Saves requested while a write is in flight are coalesced into a single
+# follow-up write, which is skipped when it would write the same content to
+# the same file again. The view stays read-only while a write is running,
+# so every write takes the latest content of the buffer. While held, by a
+# replace all editing the buffer, saves wait for the queue to be released.
+class SaveQueue:
+    def __init__(self, code_view) -> None:
+        self.code_view = code_view
+        self.saver = None
+
+        # Latest request made while writing, and the callbacks waiting for it
+        self.pending_file = None
+        self.pending_make_backup = False
+        self.pending_callbacks = []
+        self.held = False
+
+    def is_saving(self) -> bool:
+        return self.saver is not None
+
+    def hold(self) -> None:
+        """Defers the saves until release is called, the buffer is being edited."""
+        self.held = True
+
+    def release(self) -> None:
+        self.held = False
+        if self.saver is None and self.pending_callbacks:
+            pending_file, pending_make_backup, pending_callbacks = (
+                self.pending_file,
+                self.pending_make_backup,
+                self.pending_callbacks,
+            )
+            self.pending_file = None
+            self.pending_make_backup = False
+            self.pending_callbacks = []
+            self.start(pending_file, pending_make_backup, pending_callbacks)
+
+    def save(self, file: Gio.File, make_backup: bool, callback) -> None:
+        """Saves the buffer into file, callback receives the file and the error."""
+        if self.saver or self.held:
+            self.pending_file = file
+            self.pending_make_backup = make_backup
+            self.pending_callbacks.append(callback)
+            return
+
+        self.start(file, make_backup, [callback])
+
+    def start(self, file: Gio.File, make_backup: bool, callbacks) -> None:
+        self.code_view.set_editable(False)
+        self.saver = BufferSaver(
+            file,
+            self.code_view.get_buffer(),
+            make_backup,
+            lambda error: self.on_finished(file, callbacks, error),
+        )
+        self.saver.start()
+
+    def on_finished(self, file: Gio.File, callbacks, error) -> None:
+        self.saver = None
+
+        # The buffer is being edited, the pending request is written once released
+        if self.held:
+            for callback in callbacks:
+                callback(file, error)
+            return
+
+        pending_file, pending_callbacks = self.pending_file, self.pending_callbacks
+        pending_make_backup = self.pending_make_backup
+        self.pending_file = None
+        self.pending_make_backup = False
+        self.pending_callbacks = []
+
+        # The buffer could not change during the write, so the pending request
+        # only needs its own write for another target or after a failure
+        if pending_callbacks and (error is not None or not pending_file.equal(file)):
+            self.start(pending_file, pending_make_backup, pending_callbacks)
+            pending_callbacks = []
+
+        for callback in callbacks:
+            callback(file, error)
+        for callback in pending_callbacks:
+            callback(pending_file, None)
+
+        if not self.saver:
+            self.code_view.set_editable(True)
@@ -0,0 +1,269 @@
+# search.py
+#
+# Copyright 2022 Eglenelid Gamaliel Gutierrez Hernandez
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import mmap
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from gi.repository import GLib
+
+from . import tracing
+from .documents import BINARY_SAMPLE_SIZE, is_binary
+from .ignore import walk_workspace
+
+# Files sent to a worker process at once
+SEARCH_CHUNK_FILES = 64
+# Bytes sent to a worker process at once, a chunk closes at whichever limit comes first
+SEARCH_CHUNK_SIZE = 16 * 1024 * 1024
+# Matches reported for a single file
+MAX_FILE_MATCHES = 1000
+# Matches reported for a whole search, it stops once reached
+MAX_MATCHES = 10000
+# Characters of a matching line sent back to the results
+MAX_LINE_LENGTH = 200
+# Milliseconds between two batches of results added to the results panel
+RESULTS_INTERVAL = 100
+
+_pool = None
+# Number of the last search started, and of the last one cancelled, shared with
+# the worker processes so they stop between two files of a cancelled search
+_last_generation = 0
+_cancelled_generation = None
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """Returns the worker processes shared by every search, started on first use."""
+    global _pool, _cancelled_generation
+    if _pool is None:
+        # Workers come from a clean server process, forking the GTK process is unsafe
+        context = multiprocessing.get_context("forkserver")
+        _cancelled_generation = context.Value("Q", 0)
+        _pool = ProcessPoolExecutor(
+            os.cpu_count(),
+            mp_context=context,
+            initializer=init_worker,
+            initargs=(_cancelled_generation,),
+        )
+    return _pool
+
+
+def init_worker(cancelled_generation) -> None:
+    global _cancelled_generation
+    _cancelled_generation = cancelled_generation
+
+
+def cancel_generation(generation: int) -> None:
+    """Makes the workers drop the files of every search up to generation."""
+    if _cancelled_generation is None:
+        return
+    with _cancelled_generation.get_lock():
+        _cancelled_generation.value = max(_cancelled_generation.value, generation)
+
+
+def shutdown_pool() -> None:
+    """Stops the worker processes on quit, without finishing the running searches."""
+    global _pool
+    if _pool is None:
+        return
+    cancel_generation(_last_generation)
+    _pool.shutdown(wait=False, cancel_futures=True)
+    _pool = None
+
+
+def compile_query(query: str, use_regex: bool):
+    """Compiles a query into a bytes regular expression.
+
+    Queries without uppercase characters match case insensitively.
+    Raises re.error for invalid regular expressions.
+    """
+    pattern = query if use_regex else re.escape(query)
+    flags = re.MULTILINE
+    if query == query.lower():
+        flags |= re.IGNORECASE
+    return re.compile(pattern.encode("utf-8"), flags)
+
+
+def search_files(paths, pattern: bytes, flags: int, generation: int = 0) -> list:
+    """Returns the (path, line number, line) matches of pattern in the files.
+
+    Runs in the worker processes. Each file is memory mapped and matched as
+    bytes, binary files are skipped, only the first match of a line counts.
+    The remaining files are skipped once the search generation is cancelled.
+    """
+    regex = re.compile(pattern, flags)
+    matches = []
+    for path in paths:
+        if _cancelled_generation is not None and _cancelled_generation.value >= generation > 0:
+            break
+        try:
+            with open(path, "rb") as file:
+                if os.fstat(file.fileno()).st_size == 0:
+                    continue
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    if is_binary(data[:BINARY_SAMPLE_SIZE]):
+                        continue
+                    matches.extend(search_data(path, data, regex))
+        except (OSError, ValueError):
+            continue
+    return matches
+
+
+def search_data(path: str, data, regex) -> list:
+    matches = []
+    line_number = 1
+    counted = 0
+    position = 0
+    while len(matches) < MAX_FILE_MATCHES:
+        match = regex.search(data, position)
+        if match is None:
+            break
+
+        line_start = data.rfind(b"\n", 0, match.start()) + 1
+        line_end = data.find(b"\n", match.end())
+        if line_end < 0:
+            line_end = len(data)
+
+        # Lines are only counted between two matches, mmap has no count()
+        line_number += data[counted:line_start].count(b"\n")
+        counted = line_start
+
+        line = data[line_start : min(line_end, line_start + MAX_LINE_LENGTH * 4)]
+        matches.append((path, line_number, line.decode("utf-8", "replace").strip()[:MAX_LINE_LENGTH]))
+
+        # Continue on the next line
+        position = line_end + 1
+    return matches
+
+
+# One workspace search.
+# A coordinator thread walks the workspace and sends chunks of files to the
+# worker processes, keeping only a few chunks in flight. Matches are queued
+# and handed to the main loop in batches, so the results panel updates a
+# few times per second whatever the match rate is.
+class WorkspaceSearch:
+    def __init__(self, ignore, regex, results_callback, finished_callback) -> None:
+        self.ignore = ignore
+        self.regex = regex
+        # Called with a list of (path, line number, line) matches
+        self.results_callback = results_callback
+        # Called with the number of matches and True if the match limit was reached
+        self.finished_callback = finished_callback
+
+        self.match_count = 0
+        self.truncated = False
+        self._pending = []
+        self._lock = threading.Lock()
+        self._cancel_event = threading.Event()
+        self._finished = False
+        self._timeout_id = 0
+
+        global _last_generation
+        _last_generation += 1
+        self.generation = _last_generation
+
+    def start(self) -> None:
+        thread = threading.Thread(target=self._search_thread, daemon=True)
+        thread.start()
+        self._timeout_id = GLib.timeout_add(RESULTS_INTERVAL, self._on_results_timeout)
+
+    def cancel(self) -> None:
+        """Stops the search, the callbacks are not called afterwards."""
+        self._cancel_event.set()
+        cancel_generation(self.generation)
+        if self._timeout_id:
+            GLib.source_remove(self._timeout_id)
+            self._timeout_id = 0
+
+    def _get_chunks(self):
+        paths = []
+        size = 0
+        for entry in walk_workspace(self.ignore, self._cancel_event):
+            try:
+                file_size = entry.stat().st_size
+            except OSError:
+                continue
+            if self.ignore.is_too_large(file_size):
+                continue
+
+            paths.append(entry.path)
+            size += file_size
+            if len(paths) >= SEARCH_CHUNK_FILES or size >= SEARCH_CHUNK_SIZE:
+                yield paths
+                paths = []
+                size = 0
+        if paths:
+            yield paths
+
+    def _search_thread(self) -> None:
+        with tracing.span("Workspace search", "search", pattern=self.regex.pattern.decode("utf-8", "replace")):
+            self._search_chunks()
+
+        with self._lock:
+            self._finished = True
+
+    def _search_chunks(self) -> None:
+        pool = get_pool()
+        max_in_flight = (os.cpu_count() or 1) * 2
+        futures = set()
+
+        for paths in self._get_chunks():
+            futures.add(pool.submit(search_files, paths, self.regex.pattern, self.regex.flags, self.generation))
+            if len(futures) >= max_in_flight:
+                done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                self._collect(done)
+            if self._cancel_event.is_set():
+                break
+
+        while futures and not self._cancel_event.is_set():
+            done, futures = wait(futures, return_when=FIRST_COMPLETED)
+            self._collect(done)
+
+        # Chunks not started yet are dropped
+        for future in futures:
+            future.cancel()
+
+    def _collect(self, done) -> None:
+        for future in done:
+            try:
+                matches = future.result()
+            except Exception:
+                continue
+
+            with self._lock:
+                matches = matches[: MAX_MATCHES - self.match_count]
+                self._pending.extend(matches)
+                self.match_count += len(matches)
+                if self.match_count >= MAX_MATCHES:
+                    self.truncated = True
+                    self._cancel_event.set()
+                    cancel_generation(self.generation)
+
+    def _on_results_timeout(self) -> bool:
+        with self._lock:
+            pending, self._pending = self._pending, []
+            finished = self._finished
+
+        if pending:
+            self.results_callback(pending)
+        if finished:
+            self._timeout_id = 0
+            self.finished_callback(self.match_count, self.truncated)
+            return GLib.SOURCE_REMOVE
+        return GLib.SOURCE_CONTINUE
@@ -0,0 +1,87 @@
+# session.py
+#
+# Copyright 2022 Eglenelid Gamaliel Gutierrez Hernandez
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+import sys
+
+from gi.repository import GLib
+
+# Bumped when the session format changes, older sessions are ignored
+SESSION_VERSION = 1
+# Keys of a saved tab
+TAB_KEYS = ("path", "cursor", "top")
+
+
+def get_session_path() -> str:
+    return os.path.join(GLib.get_user_data_dir(), "dev.eglenelidgamaliel.code", "session.json")
+
+
+def load_session():
+    """Returns the saved session, or None if there is no usable one.
+
+    A session is a dict with the "workspace" folder path or None, the
+    "tabs" list of {"path", "cursor", "top"} dicts and the "selected" tab
+    index.
+    """
+    try:
+        with open(get_session_path(), encoding="utf-8") as file:
+            session = json.load(file)
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(session, dict) or session.get("version") != SESSION_VERSION:
+        return None
+
+    # A hand edited or damaged session loses its bad parts only
+    if not isinstance(session.get("workspace"), str):
+        session["workspace"] = None
+    tabs = session.get("tabs") if isinstance(session.get("tabs"), list) else []
+    selected = session.get("selected")
+    session["tabs"] = []
+    session["selected"] = 0
+    for index, tab in enumerate(tabs):
+        if not is_valid_tab(tab):
+            continue
+        # The selected tab keeps its selection at its new position
+        if index == selected:
+            session["selected"] = len(session["tabs"])
+        session["tabs"].append(tab)
+    return session
+
+
+def is_valid_tab(tab) -> bool:
+    if not isinstance(tab, dict) or not isinstance(tab.get("path"), str):
+        return False
+    if not set(tab).issubset(TAB_KEYS):
+        return False
+    for key in ("cursor", "top"):
+        offset = tab.get(key, 0)
+        if not isinstance(offset, int) or isinstance(offset, bool) or offset < 0:
+            return False
+    return True
+
+
+def save_session(workspace, tabs, selected: int) -> None:
+    session = {"version": SESSION_VERSION, "workspace": workspace, "tabs": tabs, "selected": selected}
+    path = get_session_path()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written to a temporary file and renamed, a crash never leaves half a session
+        GLib.file_set_contents(path, json.dumps(session).encode("utf-8"))
+    except (OSError, GLib.Error) as err:
+        print(f"The session could not be saved: {err}", file=sys.stderr)
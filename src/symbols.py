@@ -0,0 +1,380 @@
+# symbols.py
+#
+# Copyright 2022 Eglenelid Gamaliel Gutierrez Hernandez
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import ast
+import os
+import queue
+import re
+import sqlite3
+import sys
+import threading
+
+from gi.repository import GLib
+
+from . import tracing
+from .config import get_config
+from .ignore import walk_workspace
+
+# Version of the symbols extracted, a new one drops the cached index
+SYMBOLS_VERSION = 2
+# Files parsed between two commits of the index
+INDEX_BATCH_SIZE = 200
+
+# Definitions found by regular expressions, by GtkSource language id.
+# Each expression has a "name" group and is matched on the whole file.
+SYMBOL_PATTERNS = {
+    "c": [("function", r"^[A-Za-z_][\w \t\*]*?\b(?P<name>[A-Za-z_]\w*)\s*\([^;{}]{0,500}\)\s*\{")],
+    "chdr": [("type", r"^\s*(?:typedef\s+)?(?:struct|union|enum)\s+(?P<name>[A-Za-z_]\w*)")],
+    "cpp": [
+        ("class", r"^\s*(?:class|struct|namespace)\s+(?P<name>[A-Za-z_]\w*)"),
+        ("function", r"^[A-Za-z_][\w \t\*&:<>]*?\b(?P<name>[A-Za-z_][\w:~]*)\s*\([^;{}]{0,500}\)\s*(?:const\s*)?\{"),
+    ],
+    "go": [
+        ("function", r"^func\s+(?:\([^)]*\)\s*)?(?P<name>[A-Za-z_]\w*)"),
+        ("type", r"^type\s+(?P<name>[A-Za-z_]\w*)"),
+    ],
+    "java": [
+        ("class", r"^\s*(?:[a-z]+\s+)*(?:class|interface|enum|record)\s+(?P<name>[A-Za-z_]\w*)"),
+        (
+            "method",
+            r"^\s+(?:(?:public|protected|private|static|final|abstract|synchronized)\s+)+"
+            r"[\w<>\[\], ]+\s+(?P<name>[A-Za-z_]\w*)\s*\(",
+        ),
+    ],
+    "js": [
+        ("class", r"^\s*(?:export\s+)?(?:default\s+)?class\s+(?P<name>[A-Za-z_$][\w$]*)"),
+        ("function", r"^\s*(?:export\s+)?(?:default\s+)?(?:async\s+)?function\s*\*?\s*(?P<name>[A-Za-z_$][\w$]*)"),
+        (
+            "function",
+            r"^\s*(?:export\s+)?(?:const|let|var)\s+(?P<name>[A-Za-z_$][\w$]*)\s*=\s*"
+            r"(?:async\s+)?(?:function|\([^)]*\)\s*=>|[A-Za-z_$][\w$]*\s*=>)",
+        ),
+    ],
+    "lua": [("function", r"^\s*(?:local\s+)?function\s+(?P<name>[\w.:]+)")],
+    "php": [
+        ("class", r"^\s*(?:abstract\s+|final\s+)?(?:class|interface|trait)\s+(?P<name>\w+)"),
+        ("function", r"^\s*(?:(?:public|protected|private|static|abstract|final)\s+)*function\s+(?P<name>\w+)"),
+    ],
+    "ruby": [
+        ("class", r"^\s*(?:class|module)\s+(?P<name>[A-Z][\w:]*)"),
+        ("method", r"^\s*def\s+(?:self\.)?(?P<name>[\w?!=]+)"),
+    ],
+    "rust": [
+        (
+            "function",
+            r"^\s*(?:pub(?:\([^)]*\))?\s+)?(?:const\s+|async\s+|unsafe\s+|extern\s+\"[^\"]*\"\s+)*"
+            r"fn\s+(?P<name>\w+)",
+        ),
+        ("type", r"^\s*(?:pub(?:\([^)]*\))?\s+)?(?:struct|enum|trait|type|union|mod)\s+(?P<name>\w+)"),
+    ],
+    "sh": [("function", r"^\s*(?:function\s+)?(?P<name>[\w.-]+)\s*\(\)\s*\{")],
+    "vala": [
+        (
+            "class",
+            r"^\s*(?:public\s+|private\s+|internal\s+)?(?:abstract\s+)?"
+            r"(?:class|interface|struct|enum|namespace)\s+(?P<name>\w+)",
+        )
+    ],
+}
+# Languages sharing the expressions of another one
+SYMBOL_PATTERNS["cpphdr"] = SYMBOL_PATTERNS["cpp"]
+SYMBOL_PATTERNS["typescript"] = SYMBOL_PATTERNS["js"]
+SYMBOL_PATTERNS["csharp"] = SYMBOL_PATTERNS["java"]
+
+_compiled_patterns = {}
+
+
+def get_index_path() -> str:
+    return os.path.join(GLib.get_user_cache_dir(), "dev.eglenelidgamaliel.code", "symbols.sqlite")
+
+
+def extract_python_symbols(text: str) -> list:
+    """Returns the (name, kind, line) definitions of Python source code."""
+    symbols = []
+    pending = [(node, False) for node in ast.parse(text).body]
+    while pending:
+        node, in_class = pending.pop()
+        if isinstance(node, ast.ClassDef):
+            symbols.append((node.name, "class", node.lineno))
+            pending.extend((child, True) for child in node.body)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            symbols.append((node.name, "method" if in_class else "function", node.lineno))
+            pending.extend((child, False) for child in node.body)
+    return symbols
+
+
+def extract_symbols(text: str, language_id) -> list:
+    """Returns the (name, kind, line) definitions of a file, an empty list for unknown languages."""
+    if language_id == "python3" or language_id == "python":
+        try:
+            return extract_python_symbols(text)
+        except (SyntaxError, ValueError):
+            return []
+
+    patterns = _compiled_patterns.get(language_id)
+    if patterns is None:
+        patterns = [(kind, re.compile(pattern, re.MULTILINE)) for kind, pattern in SYMBOL_PATTERNS.get(language_id, [])]
+        _compiled_patterns[language_id] = patterns
+
+    symbols = []
+    for kind, regex in patterns:
+        # Matches come in order, the lines are only counted since the previous one
+        line = 1
+        position = 0
+        for match in regex.finditer(text):
+            start = match.start("name")
+            line += text.count("\n", position, start)
+            position = start
+            symbols.append((match.group("name"), kind, line))
+    return symbols
+
+
+def connect(path: str) -> sqlite3.Connection:
+    connection = sqlite3.connect(path, timeout=10)
+    # Readers keep working while the indexer writes
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+# Workspace symbol index persisted in an SQLite database.
+# Files are keyed by path, modification time and size, so reopening a
+# workspace only parses the files that changed since the last time. Every
+# write runs on a single worker thread, searches run on their own thread
+# with a separate connection, the main loop only receives the results.
+# While the workspace is open, files are parsed again when saved from the
+# editor or when written in a folder the file explorer has loaded. Files
+# written by other programs in folders never expanded are not watched, to
+# keep the number of monitors low, they are caught up on the next build.
+class SymbolIndex:
+    def __init__(self, ignore, index_path=None) -> None:
+        self.ignore = ignore
+        self.folder_path = ignore.folder_path
+        self.index_path = index_path or get_index_path()
+
+        # Languages are guessed by the shared configuration on the main thread,
+        # its name patterns are compiled here so the worker can build the keys
+        self.config = get_config()
+        self.config.get_name_pattern()
+        # Language id of each language key, as guessed by the configuration
+        self.languages = {}
+        self.ready = False
+
+        self._jobs = queue.Queue()
+        self._cancel_event = threading.Event()
+        self._search_generation = 0
+
+    def build(self, callback=None) -> None:
+        """Brings the index up to date with the workspace, callback is called when done."""
+        thread = threading.Thread(target=self._worker_thread, daemon=True)
+        thread.start()
+        self._jobs.put((self._build, callback))
+
+    def update(self, changed_paths, removed_paths) -> None:
+        """Parses again the changed files and forgets the removed files and folders."""
+        self._jobs.put((lambda connection: self._update(connection, changed_paths, removed_paths), None))
+
+    def cancel(self) -> None:
+        self._cancel_event.set()
+        self._search_generation += 1
+        self._jobs.put(None)
+
+    def search(self, query: str, limit: int, callback) -> None:
+        """Calls callback with the (path, line, name, kind) symbols containing query.
+
+        Only the callback of the latest search is called.
+        """
+        self._search_generation += 1
+        generation = self._search_generation
+        thread = threading.Thread(target=self._search_thread, args=(query, limit, callback, generation), daemon=True)
+        thread.start()
+
+    def _worker_thread(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            connection = connect(self.index_path)
+            connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime INTEGER, size INTEGER, version INTEGER);
+                CREATE TABLE IF NOT EXISTS symbols (path TEXT, name TEXT, kind TEXT, line INTEGER);
+                CREATE INDEX IF NOT EXISTS symbols_path ON symbols (path);
+                """
+            )
+        except (OSError, sqlite3.Error) as err:
+            print(f"The symbol index could not be opened: {err}", file=sys.stderr)
+            return
+
+        while not self._cancel_event.is_set():
+            job = self._jobs.get()
+            if job is None:
+                break
+            function, callback = job
+            try:
+                function(connection)
+            except sqlite3.Error as err:
+                print(f"The symbol index could not be updated: {err}", file=sys.stderr)
+                continue
+            if callback and not self._cancel_event.is_set():
+                GLib.idle_add(self._on_job_finished, callback)
+
+        connection.close()
+
+    def _on_job_finished(self, callback) -> bool:
+        if not self._cancel_event.is_set():
+            callback(self)
+        return GLib.SOURCE_REMOVE
+
+    def _resolve_languages(self, paths) -> None:
+        """Guesses the language of the new language keys on the main thread.
+
+        GtkSource.LanguageManager is not thread safe, so the worker waits for
+        the main loop to resolve every new key in a single call, one path of
+        each key being enough to guess it.
+        """
+        keys = {}
+        for path in paths:
+            key = self.config.get_language_key(path)
+            if key not in self.languages:
+                keys.setdefault(key, path)
+        if not keys:
+            return
+
+        done = threading.Event()
+
+        def resolve():
+            for key, path in keys.items():
+                language = self.config.guess_language(path)
+                self.languages[key] = language.get_id() if language else None
+            done.set()
+            return GLib.SOURCE_REMOVE
+
+        GLib.idle_add(resolve)
+        while not done.wait(0.1):
+            if self._cancel_event.is_set():
+                return
+
+    def _get_language(self, path: str):
+        return self.languages.get(self.config.get_language_key(path))
+
+    def _build(self, connection: sqlite3.Connection) -> None:
+        # Files of this workspace already in the index
+        prefix = f"{self.folder_path}/"
+        indexed = {
+            path: (mtime, size, version)
+            for path, mtime, size, version in connection.execute(
+                "SELECT path, mtime, size, version FROM files WHERE substr(path, 1, ?) = ?", (len(prefix), prefix)
+            )
+        }
+
+        changed = []
+        seen = set()
+        for entry in walk_workspace(self.ignore, self._cancel_event):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            if self.ignore.is_too_large(stat.st_size):
+                continue
+            seen.add(entry.path)
+            if indexed.get(entry.path) != (stat.st_mtime_ns, stat.st_size, SYMBOLS_VERSION):
+                changed.append(entry.path)
+
+        if self._cancel_event.is_set():
+            return
+
+        removed = [path for path in indexed if path not in seen]
+        self._forget(connection, removed)
+        self._index_files(connection, changed)
+        self.ready = True
+
+    def _update(self, connection: sqlite3.Connection, changed_paths, removed_paths) -> None:
+        removed = []
+        for removed_path in removed_paths:
+            # Removed folders take their files with them
+            removed.append(removed_path)
+            removed.extend(
+                path
+                for (path,) in connection.execute(
+                    "SELECT path FROM files WHERE substr(path, 1, ?) = ?", (len(removed_path) + 1, f"{removed_path}/")
+                )
+            )
+        self._forget(connection, removed)
+        self._index_files(connection, [path for path in changed_paths if path.startswith(f"{self.folder_path}/")])
+
+    def _forget(self, connection: sqlite3.Connection, paths) -> None:
+        with connection:
+            connection.executemany("DELETE FROM files WHERE path = ?", ((path,) for path in paths))
+            connection.executemany("DELETE FROM symbols WHERE path = ?", ((path,) for path in paths))
+
+    def _index_files(self, connection: sqlite3.Connection, paths) -> None:
+        self._resolve_languages(paths)
+
+        for start in range(0, len(paths), INDEX_BATCH_SIZE):
+            if self._cancel_event.is_set():
+                return
+
+            files = []
+            symbols = []
+            for path in paths[start : start + INDEX_BATCH_SIZE]:
+                try:
+                    stat = os.stat(path)
+                    language_id = self._get_language(path)
+                    # Files of unknown languages are recorded so they are not read again
+                    if language_id == "python3" or language_id == "python" or language_id in SYMBOL_PATTERNS:
+                        with open(path, encoding="utf-8") as file:
+                            text = file.read()
+                        symbols.extend(
+                            (path, name, kind, line) for name, kind, line in extract_symbols(text, language_id)
+                        )
+                except (OSError, UnicodeError):
+                    continue
+                files.append((path, stat.st_mtime_ns, stat.st_size, SYMBOLS_VERSION))
+
+            # Each batch replaces the previous symbols of its files in one transaction
+            tracing.counter("Symbols", "scan", files=len(files), symbols=len(symbols))
+            with connection:
+                connection.executemany("DELETE FROM symbols WHERE path = ?", ((file[0],) for file in files))
+                connection.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", files)
+                connection.executemany("INSERT INTO symbols VALUES (?, ?, ?, ?)", symbols)
+
+    def _search_thread(self, query: str, limit: int, callback, generation: int) -> None:
+        prefix = f"{self.folder_path}/"
+        pattern = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        try:
+            connection = connect(self.index_path)
+            try:
+                # Names starting with the query come first, then the shortest names
+                results = connection.execute(
+                    """
+                    SELECT path, line, name, kind FROM symbols
+                    WHERE name LIKE ? ESCAPE '\\' AND substr(path, 1, ?) = ?
+                    ORDER BY instr(lower(name), lower(?)) != 1, length(name)
+                    LIMIT ?
+                    """,
+                    (pattern, len(prefix), prefix, query, limit),
+                ).fetchall()
+            finally:
+                connection.close()
+        except sqlite3.Error:
+            results = []
+
+        GLib.idle_add(self._on_search_finished, results, callback, generation)
+
+    def _on_search_finished(self, results, callback, generation: int) -> bool:
+        if generation == self._search_generation:
+            callback(results)
+        return GLib.SOURCE_REMOVE
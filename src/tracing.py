@@ -0,0 +1,190 @@
+# tracing.py
+#
+# Copyright 2022 Eglenelid Gamaliel Gutierrez Hernandez
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from gi.repository import GLib
+
+# Environment variable turning tracing on, set to the output file or to 1
+TRACE_ENVIRONMENT_VARIABLE = "CODE_TRACE"
+# Milliseconds between two main loop heartbeats
+HEARTBEAT_INTERVAL = 10
+# Milliseconds a heartbeat may be late before it is recorded as a stall
+STALL_THRESHOLD = 50
+
+enabled = False
+output_path = None
+
+_events = []
+_async_ids = itertools.count(1)
+_heartbeat_time = 0.0
+
+
+def now() -> float:
+    """Returns the current time in microseconds, the trace event unit."""
+    return time.perf_counter() * 1_000_000
+
+
+def enable(path=None) -> None:
+    """Starts recording events, written to path or to the user cache folder."""
+    global enabled, output_path
+    if enabled:
+        return
+
+    enabled = True
+    output_path = path or os.path.join(
+        GLib.get_user_cache_dir(), "dev.eglenelidgamaliel.code", f"trace-{os.getpid()}.json"
+    )
+    _events.append({"name": "process_name", "ph": "M", "pid": os.getpid(), "args": {"name": "Code"}})
+    start_stall_sampling()
+
+
+def enable_from_environment() -> None:
+    value = os.environ.get(TRACE_ENVIRONMENT_VARIABLE)
+    if value:
+        enable(None if value == "1" else value)
+
+
+def _add_event(name: str, phase: str, category: str, args, **fields) -> None:
+    # list.append is atomic, worker threads record events without a lock
+    event = {"name": name, "cat": category, "ph": phase, "pid": os.getpid(), "tid": threading.get_ident()}
+    if args:
+        event["args"] = args
+    event.update(fields)
+    _events.append(event)
+
+
+@contextmanager
+def _span(name: str, category: str, args):
+    start = now()
+    try:
+        yield
+    finally:
+        _add_event(name, "X", category, args, ts=start, dur=now() - start)
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_no_span = _NoSpan()
+
+
+def span(name: str, category: str = "code", **args):
+    """Returns a context manager recording the time spent inside it."""
+    if not enabled:
+        return _no_span
+    return _span(name, category, args)
+
+
+def async_begin(name: str, category: str = "code", **args) -> int:
+    """Starts a span ending in another callback, returns the id to pass to async_end."""
+    if not enabled:
+        return 0
+    span_id = next(_async_ids)
+    _add_event(name, "b", category, args, ts=now(), id=span_id)
+    return span_id
+
+
+def async_end(name: str, span_id: int, category: str = "code", **args) -> None:
+    if enabled and span_id:
+        _add_event(name, "e", category, args, ts=now(), id=span_id)
+
+
+def counter(name: str, category: str = "code", **values) -> None:
+    if enabled:
+        _add_event(name, "C", category, values, ts=now())
+
+
+def instant(name: str, category: str = "code", **args) -> None:
+    if enabled:
+        _add_event(name, "i", category, args, ts=now(), s="t")
+
+
+def start_stall_sampling() -> None:
+    """Records the main loop iterations late by more than STALL_THRESHOLD.
+
+    A stall shows up as a span covering the time the main loop was busy,
+    under the spans of the code that kept it busy.
+    """
+    global _heartbeat_time
+    _heartbeat_time = now()
+    GLib.timeout_add(HEARTBEAT_INTERVAL, _on_heartbeat)
+
+
+def _on_heartbeat() -> bool:
+    global _heartbeat_time
+    current = now()
+    late = (current - _heartbeat_time) / 1000 - HEARTBEAT_INTERVAL
+    if late > STALL_THRESHOLD:
+        _add_event(
+            "Main loop stall",
+            "X",
+            "stall",
+            {"late_ms": round(late, 1)},
+            ts=_heartbeat_time,
+            dur=current - _heartbeat_time,
+        )
+    _heartbeat_time = current
+    return GLib.SOURCE_CONTINUE if enabled else GLib.SOURCE_REMOVE
+
+
+def watch_frames(widget) -> None:
+    """Records the time between the frames drawn for widget, once it is mapped."""
+    if not enabled:
+        return
+
+    last_frame = [0.0]
+    watching = [False]
+
+    def on_after_paint(frame_clock):
+        current = now()
+        if last_frame[0]:
+            counter("Frame time", "frame", ms=round((current - last_frame[0]) / 1000, 2))
+        last_frame[0] = current
+
+    def on_map(widget):
+        if not watching[0]:
+            watching[0] = True
+            widget.get_frame_clock().connect("after-paint", on_after_paint)
+
+    widget.connect("map", on_map)
+
+
+def write() -> None:
+    """Writes the recorded events as a Chrome trace event JSON file."""
+    if not enabled:
+        return
+
+    try:
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        with open(output_path, "w", encoding="utf-8") as file:
+            json.dump({"traceEvents": list(_events), "displayTimeUnit": "ms"}, file)
+    except OSError as err:
+        print(f"The trace could not be written: {err}", file=sys.stderr)
+        return
+    print(f"Trace written to {output_path}", file=sys.stderr)
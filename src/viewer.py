@@ -0,0 +1,337 @@
+# viewer.py
+#
+# Copyright 2022 Eglenelid Gamaliel Gutierrez Hernandez
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import mmap
+import threading
+from array import array
+from bisect import bisect_left
+
+from gi.repository import GLib, Gtk
+
+from .documents import BINARY_SAMPLE_SIZE, is_binary
+
+# Bytes covered by each entry of the sparse line index
+INDEX_BLOCK_SIZE = 1024 * 1024
+# Bytes shown per row in the hex view
+HEX_ROW_SIZE = 16
+# Bytes of a single line that are rendered, longer lines are cut
+MAX_RENDERED_LINE = 4096
+# Lines moved by each mouse wheel step
+SCROLL_LINES = 3
+# Milliseconds between two updates of the indexing progress
+INDEX_PROGRESS_INTERVAL = 250
+
+
+# Sparse line offset index of a memory mapped file.
+# Instead of one offset per line, it keeps the number of the first line of
+# every fixed size block, so its size only grows with the file size over
+# INDEX_BLOCK_SIZE. It is built on a worker thread.
+class LineIndex:
+    def __init__(self, data) -> None:
+        self.data = data
+        # Line number at the start of each indexed block
+        self.block_lines = array("Q", [0])
+        self.complete = False
+
+        self._cancel_event = threading.Event()
+        self._thread = threading.Thread(target=self._build_thread, daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def cancel(self) -> None:
+        self._cancel_event.set()
+
+    def get_indexed_size(self) -> int:
+        return min((len(self.block_lines) - 1) * INDEX_BLOCK_SIZE, len(self.data))
+
+    def _build_thread(self) -> None:
+        size = len(self.data)
+        line = 0
+        try:
+            for offset in range(0, size, INDEX_BLOCK_SIZE):
+                if self._cancel_event.is_set():
+                    return
+                line += self.data[offset : offset + INDEX_BLOCK_SIZE].count(b"\n")
+                self.block_lines.append(line)
+        except ValueError:
+            # The map was closed along with the viewer
+            return
+        self.complete = True
+
+    def get_line_count(self) -> int:
+        """Number of lines indexed so far."""
+        return self.block_lines[-1] + 1
+
+    def get_line_offset(self, line: int):
+        """Returns the byte offset of a zero based line, None if not indexed yet."""
+        if line > self.block_lines[-1]:
+            if not self.complete:
+                return None
+            line = self.block_lines[-1]
+
+        # The newline ending the previous line is in the last block starting before it
+        block = max(bisect_left(self.block_lines, line) - 1, 0)
+        offset = block * INDEX_BLOCK_SIZE
+        for _ in range(line - self.block_lines[block]):
+            offset = self.data.find(b"\n", offset) + 1
+        return offset
+
+    def get_line_number(self, offset: int):
+        """Returns the zero based line holding a byte offset, None if not indexed yet."""
+        block = offset // INDEX_BLOCK_SIZE
+        if block >= len(self.block_lines) - 1:
+            return None
+        start = block * INDEX_BLOCK_SIZE
+        return self.block_lines[block] + self.data[start:offset].count(b"\n")
+
+
+# Subclass Gtk.TextView to render again when the visible rows change.
+class ViewerTextView(Gtk.TextView):
+    def __init__(self, resize_callback) -> Gtk.TextView:
+        super().__init__(editable=False, cursor_visible=False, monospace=True)
+        self.resize_callback = resize_callback
+        self.allocated_height = 0
+
+    def do_size_allocate(self, width: int, height: int, baseline: int) -> None:
+        Gtk.TextView.do_size_allocate(self, width, height, baseline)
+        # Changing the text while allocating is not allowed, render on idle
+        if height != self.allocated_height:
+            self.allocated_height = height
+            GLib.idle_add(self.on_resized)
+
+    def on_resized(self) -> bool:
+        self.resize_callback()
+        return GLib.SOURCE_REMOVE
+
+
+# Read-only viewer for files too big or not valid for a text buffer.
+# The file is memory mapped and only the lines that fit on screen are
+# decoded and rendered, so opening it takes constant time and memory.
+# Binary content is shown as a hex dump.
+class LargeFileViewer(Gtk.Box):
+    def __init__(self, file, hex_mode=None) -> Gtk.Box:
+        super().__init__(orientation=Gtk.Orientation.VERTICAL)
+
+        # Viewer pages have no code view to save
+        self.code_view = None
+        self.file = file
+
+        self._file_object = open(file.get_path(), "rb")
+        try:
+            self.data = mmap.mmap(self._file_object.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files can not be mapped
+            self.data = b""
+
+        if hex_mode is None:
+            hex_mode = is_binary(self.data[:BINARY_SAMPLE_SIZE])
+
+        self.line_index = LineIndex(self.data)
+        self.line_index.start()
+
+        # Toolbar with the go to line entry, the indexing status and the hex toggle
+        toolbar = Gtk.Box(spacing=12)
+        toolbar.set_margin_start(12)
+        toolbar.set_margin_end(12)
+        toolbar.set_margin_top(6)
+        toolbar.set_margin_bottom(6)
+
+        self.line_entry = Gtk.Entry(placeholder_text="Go to line...", input_purpose=Gtk.InputPurpose.DIGITS)
+        self.line_entry.connect("activate", self.on_line_entry_activate)
+        toolbar.append(self.line_entry)
+
+        self.status_label = Gtk.Label(hexpand=True, xalign=0)
+        toolbar.append(self.status_label)
+
+        self.hex_button = Gtk.ToggleButton(label="Hex", active=hex_mode)
+        self.hex_button.connect("toggled", self.on_hex_toggled)
+        toolbar.append(self.hex_button)
+        self.append(toolbar)
+
+        # Only the visible window of the file is ever put into the text view
+        self.text_view = ViewerTextView(self.render)
+        self.text_view.set_top_margin(10)
+        self.text_view.set_left_margin(10)
+        self.scrolled_window = Gtk.ScrolledWindow(hexpand=True, vexpand=True, vscrollbar_policy=Gtk.PolicyType.EXTERNAL)
+        self.scrolled_window.set_child(self.text_view)
+
+        # The scrollbar position is a byte offset in text mode and a row in hex mode
+        self.adjustment = Gtk.Adjustment()
+        self.adjustment.connect("value-changed", self.on_adjustment_value_changed)
+        scrollbar = Gtk.Scrollbar(orientation=Gtk.Orientation.VERTICAL, adjustment=self.adjustment)
+
+        content = Gtk.Box(vexpand=True)
+        content.append(self.scrolled_window)
+        content.append(scrollbar)
+        self.append(content)
+
+        scroll_controller = Gtk.EventControllerScroll(flags=Gtk.EventControllerScrollFlags.VERTICAL)
+        scroll_controller.connect("scroll", self.on_scroll)
+        self.text_view.add_controller(scroll_controller)
+
+        # Offset of the first rendered line
+        self.top_offset = 0
+        # Fraction of a line scrolled by touchpads and not applied yet
+        self.scroll_remainder = 0.0
+        self.hex_mode = hex_mode
+        self.set_hex_mode(hex_mode)
+
+        self.progress_source_id = GLib.timeout_add(INDEX_PROGRESS_INTERVAL, self.on_index_progress)
+        self.on_index_progress()
+
+    def close(self) -> None:
+        self.line_index.cancel()
+        if self.progress_source_id:
+            GLib.source_remove(self.progress_source_id)
+            self.progress_source_id = 0
+
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self._file_object.close()
+
+    def get_visible_rows(self) -> int:
+        _width, line_height = self.text_view.create_pango_layout("0").get_pixel_size()
+        return max(1, self.scrolled_window.get_height() // max(line_height, 1))
+
+    def set_hex_mode(self, hex_mode: bool) -> None:
+        self.hex_mode = hex_mode
+        size = len(self.data)
+        if hex_mode:
+            self.adjustment.configure(self.top_offset // HEX_ROW_SIZE, 0, size // HEX_ROW_SIZE + 1, 1, 32, 1)
+        else:
+            self.adjustment.configure(self.top_offset, 0, size + 1, 1024, 64 * 1024, 1)
+        self.render()
+
+    def find_line_start(self, offset: int) -> int:
+        if offset <= 0:
+            return 0
+        if self.data[offset - 1 : offset] == b"\n":
+            return offset
+        # Snap forward to the next line, or back to the last line start
+        next_line = self.data.find(b"\n", offset)
+        if next_line < 0:
+            return self.data.rfind(b"\n", 0, offset) + 1
+        return next_line + 1
+
+    def move_lines(self, offset: int, lines: int) -> int:
+        if lines > 0:
+            for _ in range(lines):
+                next_line = self.data.find(b"\n", offset)
+                if next_line < 0 or next_line + 1 >= len(self.data):
+                    break
+                offset = next_line + 1
+        else:
+            for _ in range(-lines):
+                if offset <= 0:
+                    break
+                offset = self.data.rfind(b"\n", 0, offset - 1) + 1
+        return offset
+
+    def scroll_to_offset(self, offset: int) -> None:
+        self.top_offset = offset
+        self.adjustment.set_value(offset // HEX_ROW_SIZE if self.hex_mode else offset)
+        self.render()
+
+    def render(self) -> None:
+        rows = self.get_visible_rows()
+        if self.hex_mode:
+            text = self.render_hex(rows)
+        else:
+            text = self.render_text(rows)
+        self.text_view.get_buffer().set_text(text)
+
+    def render_text(self, rows: int) -> str:
+        lines = []
+        offset = self.top_offset
+        for _ in range(rows):
+            if offset >= len(self.data):
+                break
+            end = self.data.find(b"\n", offset)
+            if end < 0:
+                end = len(self.data)
+            lines.append(self.data[offset : min(end, offset + MAX_RENDERED_LINE)].decode("utf-8", "replace"))
+            offset = end + 1
+        return "\n".join(lines)
+
+    def render_hex(self, rows: int) -> str:
+        lines = []
+        offset = self.top_offset - self.top_offset % HEX_ROW_SIZE
+        for _ in range(rows):
+            if offset >= len(self.data):
+                break
+            row = self.data[offset : offset + HEX_ROW_SIZE]
+            hex_bytes = " ".join(f"{byte:02x}" for byte in row)
+            printable = "".join(chr(byte) if 32 <= byte < 127 else "." for byte in row)
+            lines.append(f"{offset:010x}  {hex_bytes:<{HEX_ROW_SIZE * 3}} {printable}")
+            offset += HEX_ROW_SIZE
+        return "\n".join(lines)
+
+    def on_adjustment_value_changed(self, adjustment) -> None:
+        value = int(adjustment.get_value())
+        if self.hex_mode:
+            offset = value * HEX_ROW_SIZE
+            if offset // HEX_ROW_SIZE == self.top_offset // HEX_ROW_SIZE:
+                return
+        else:
+            if value == self.top_offset:
+                return
+            offset = self.find_line_start(value)
+        self.top_offset = offset
+        self.render()
+
+    def on_scroll(self, controller, dx, dy) -> bool:
+        # Smooth scrolling sends small deltas, they add up until they make a line
+        lines = dy * SCROLL_LINES + self.scroll_remainder
+        steps = int(lines)
+        self.scroll_remainder = lines - steps
+        if not steps:
+            return True
+        if self.hex_mode:
+            row = max(0, self.top_offset // HEX_ROW_SIZE + steps)
+            self.scroll_to_offset(min(row * HEX_ROW_SIZE, max(len(self.data) - 1, 0)))
+        else:
+            self.scroll_to_offset(self.move_lines(self.top_offset, steps))
+        return True
+
+    def on_hex_toggled(self, button) -> None:
+        self.set_hex_mode(button.get_active())
+
+    def on_line_entry_activate(self, entry) -> None:
+        try:
+            line = int(entry.get_text()) - 1
+        except ValueError:
+            return
+
+        offset = self.line_index.get_line_offset(max(line, 0))
+        if offset is None:
+            self.status_label.set_label("That line is not indexed yet")
+            return
+
+        self.hex_button.set_active(False)
+        self.scroll_to_offset(offset)
+
+    def on_index_progress(self) -> bool:
+        line_index = self.line_index
+        if line_index.complete:
+            self.status_label.set_label(f"{line_index.get_line_count()} lines")
+            self.progress_source_id = 0
+            return GLib.SOURCE_REMOVE
+
+        percentage = line_index.get_indexed_size() * 100 // max(len(self.data), 1)
+        self.status_label.set_label(f"Indexing lines... {percentage}%")
+        return GLib.SOURCE_CONTINUE
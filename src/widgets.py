@@ -15,93 +15,738 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from pathlib import Path
+import os
+import sys
+import time
 
-from gi.repository import Gio, Gtk, GtkSource
+from gi.repository import Gio, GLib, GObject, Gtk, Pango
 
+from . import tracing
+from .git_status import (
+    STATUS_ADDED,
+    STATUS_CONFLICTED,
+    STATUS_DELETED,
+    STATUS_MODIFIED,
+    STATUS_RENAMED,
+    STATUS_UNTRACKED,
+    GitStatusProvider,
+)
+from .ignore import IGNORE_FILE_NAMES
+from .saver import SaveQueue
 
-# Subclass GtkSource.View to add custom features.
-class Codeview(GtkSource.View):
-    def __init__(self) -> None:
+
+# Subclass Gtk.Box to hold a code view and its status on a tab.
+# Hibernated pages have no code view, only the HibernatedDocument needed
+# to build it again.
+class CodePage(Gtk.Box):
+    def __init__(self, code_view) -> Gtk.Box:
+        super().__init__(orientation=Gtk.Orientation.VERTICAL)
+
+        self.code_view = code_view
+        self.hibernated = None
+        # Last time the tab was selected, used to hibernate the oldest tabs first
+        self.last_selected = time.monotonic()
+        # Line to show once the code view is loaded
+        self.pending_line = None
+        # FindBar of the code view, created when first shown
+        self.find_bar = None
+        # FileLoader streaming the file into the code view, if any
+        self.loader = None
+        # SaveQueue writing the code view, created on the first save
+        self.save_queue = None
+        # Modification time and size of the file when it was read or saved
+        self.file_stamp = None
+        # Longest line of the file when it was read
+        self.longest_line = 0
+        # DocumentJournal recording the unsaved edits, for crash recovery
+        self.journal = None
+        # Set once the tab is closed, saves still running must not bring it back
+        self.closed = False
+
+        # Loading progress, shown while the file is streamed into the buffer
+        self.progress_bar = Gtk.ProgressBar(hexpand=True, valign=Gtk.Align.CENTER)
+        self.cancel_button = Gtk.Button(label="Cancel")
+        self.progress_box = Gtk.Box(spacing=12, visible=False)
+        self.progress_box.set_margin_start(12)
+        self.progress_box.set_margin_end(12)
+        self.progress_box.set_margin_top(6)
+        self.progress_box.set_margin_bottom(6)
+        self.progress_box.append(self.progress_bar)
+        self.progress_box.append(self.cancel_button)
+        self.append(self.progress_box)
+
+        # Large file mode banner, lets the user turn the features back on.
+        # Built like an Adw.Banner, which needs a newer libadwaita than the GNOME 42 runtime
+        large_file_box = Gtk.Box(spacing=12, css_classes=["large-file-banner"])
+        large_file_box.append(
+            Gtk.Label(
+                label="Large file: highlighting and other features are turned off", wrap=True, xalign=0, hexpand=True
+            )
+        )
+        enable_features_button = Gtk.Button(label="Enable Features", valign=Gtk.Align.CENTER)
+        enable_features_button.connect("clicked", self.on_enable_features_clicked)
+        large_file_box.append(enable_features_button)
+        self.large_file_bar = Gtk.Revealer(child=large_file_box, reveal_child=False)
+        self.append(self.large_file_bar)
+
+        # Create a new scrolled window to hold the editor
+        self.scrolled_window = Gtk.ScrolledWindow(vexpand=True)
+        self.scrolled_window.set_child(code_view)
+        self.append(self.scrolled_window)
+
+    def get_save_queue(self) -> SaveQueue:
+        if self.save_queue is None:
+            self.save_queue = SaveQueue(self.code_view)
+        return self.save_queue
+
+    def start_loading(self, loader) -> None:
+        self.loader = loader
+        self.code_view.set_editable(False)
+        self.progress_box.set_visible(True)
+        loader.start()
+
+    def show_progress(self, fraction) -> None:
+        # Degrade the view as soon as the file goes over a large file threshold
+        code_view = self.code_view
+        if (
+            not code_view.large_file_mode
+            and not code_view.large_file_opt_out
+            and code_view.is_large_file(self.loader.size, self.loader.longest_line)
+        ):
+            self.enable_large_file_mode()
+
+        if fraction is None:
+            self.progress_bar.pulse()
+        else:
+            self.progress_bar.set_fraction(min(fraction, 1.0))
+
+    def enable_large_file_mode(self) -> None:
+        self.code_view.set_large_file_mode(True)
+        self.large_file_bar.set_reveal_child(True)
+
+    def is_clean(self) -> bool:
+        """Checks if the buffer holds exactly the contents of its file."""
+        return (
+            self.loader is None
+            and not (self.save_queue is not None and self.save_queue.is_saving())
+            and not self.code_view.get_buffer().get_modified()
+        )
+
+    def finish_loading(self) -> None:
+        if self.loader:
+            self.longest_line = self.loader.longest_line
+        self.loader = None
+        self.code_view.set_editable(True)
+        self.progress_box.set_visible(False)
+
+    def cancel_loading(self) -> None:
+        if self.loader:
+            self.loader.cancel()
+            self.loader = None
+
+    def close(self) -> None:
+        self.closed = True
+        self.cancel_loading()
+        self.drop_find_bar()
+        if self.journal is not None:
+            self.journal.discard()
+
+    def show_find_bar(self) -> None:
+        if self.find_bar is None:
+            from .codeview import FindBar
+
+            self.find_bar = FindBar(self.code_view, self.get_save_queue())
+            self.insert_child_after(self.find_bar, self.large_file_bar)
+        self.find_bar.open()
+
+    def drop_find_bar(self) -> None:
+        if self.find_bar is not None:
+            self.find_bar.cancel()
+            self.remove(self.find_bar)
+            self.find_bar = None
+
+    def get_top_offset(self) -> int:
+        """Returns the offset of the first visible character."""
+        rect = self.code_view.get_visible_rect()
+        _valid, top = self.code_view.get_iter_at_location(rect.x, rect.y)
+        return top.get_offset()
+
+    def place_cursor(self, cursor: int, top: int) -> None:
+        buffer = self.code_view.get_buffer()
+        buffer.place_cursor(buffer.get_iter_at_offset(cursor))
+        # Marks are scrolled to once the lines are measured
+        mark = buffer.create_mark(None, buffer.get_iter_at_offset(top), True)
+        self.code_view.scroll_to_mark(mark, 0.0, True, 0.0, 0.0)
+        buffer.delete_mark(mark)
+
+    def go_to_line(self, line: int) -> None:
+        """Moves the cursor to the start of a line, counted from 1."""
+        self.pending_line = line
+        if self.code_view is not None and self.loader is None:
+            self.go_to_pending_line()
+
+    def go_to_pending_line(self) -> None:
+        if self.pending_line is None:
+            return
+
+        buffer = self.code_view.get_buffer()
+        _valid, line_iter = buffer.get_iter_at_line(self.pending_line - 1)
+        buffer.place_cursor(line_iter)
+        self.code_view.scroll_to_mark(buffer.get_insert(), 0.0, True, 0.0, 0.5)
+        self.pending_line = None
+
+    def hibernate(self, document) -> None:
+        """Drops the code view, the document is used to rebuild it later."""
+        self.hibernated = document
+        self.drop_find_bar()
+        # The journal goes on once the text is back in a new view
+        if self.journal is not None:
+            self.journal.detach()
+        self.code_view.release()
+        self.scrolled_window.set_child(None)
+        self.code_view = None
+        self.save_queue = None
+        self.large_file_bar.set_reveal_child(False)
+
+    def restore(self, code_view):
+        """Shows a new code view in a hibernated page and returns its document."""
+        document = self.hibernated
+        self.hibernated = None
+        self.code_view = code_view
+        self.scrolled_window.set_child(code_view)
+        return document
+
+    def on_enable_features_clicked(self, button) -> None:
+        self.code_view.large_file_opt_out = True
+        self.code_view.set_large_file_mode(False)
+        self.large_file_bar.set_reveal_child(False)
+
+
+# Attributes requested when enumerating a folder
+FILE_ATTRIBUTES = "standard::name,standard::type"
+# Number of files requested from the enumerator on each iteration
+ENUMERATE_BATCH_SIZE = 200
+# Milliseconds between two batched updates of the monitored folders, one frame
+MONITOR_FLUSH_INTERVAL = 16
+
+
+# Style class of the git status label for each status letter
+GIT_STATUS_CSS_CLASSES = {
+    STATUS_MODIFIED: "git-modified",
+    STATUS_ADDED: "git-added",
+    STATUS_DELETED: "git-modified",
+    STATUS_RENAMED: "git-renamed",
+    STATUS_CONFLICTED: "git-conflicted",
+    STATUS_UNTRACKED: "git-untracked",
+}
+
+
+# Compact record for a file explorer entry.
+# Only the interned name and a reference to the parent are kept, the full
+# path is rebuilt on demand so the tree does not hold a path string per row.
+class FileExplorerNode(GObject.Object):
+    __gtype_name__ = "FileExplorerNode"
+
+    def __init__(self, name: str, parent=None, is_folder: bool = False) -> None:
         super().__init__()
+        self.name = sys.intern(name)
+        self.parent = parent
+        self.is_folder = is_folder
+        # Gio.ListStore with the children, created when the row is first shown
+        self.children = None
+        # Set once the folder is expanded and its files are enumerated
+        self.loaded = False
 
-        # Get the application settings
-        self.settings = Gio.Settings(schema_id="dev.eglenelidgamaliel.code")
+    def get_path(self) -> str:
+        names = []
+        node = self
+        while node is not None:
+            names.append(node.name)
+            node = node.parent
+        # The root name is an absolute path, which may be "/" itself
+        return os.path.join(*reversed(names))
 
-        # Connect to the settings style-scheme change signal
-        self.settings.connect("changed::code-view-style-scheme", self.on_style_scheme_changed)
-        self.on_style_scheme_changed(self.settings, "code-view-style-scheme")
+    def is_inside(self, folder) -> bool:
+        node = self
+        while node is not None:
+            if node is folder:
+                return True
+            node = node.parent
+        return False
 
-        # Set GtkSource.View properties
-        self.set_show_line_numbers(True)
-        self.set_auto_indent(True)
-        self.set_highlight_current_line(True)
-        self.set_monospace(True)
-        self.set_top_margin(10)
-        self.set_bottom_margin(10)
 
-        self.file = None
+# Lazily enumerated folder tree exposed through a Gtk.TreeListModel.
+class FileExplorerTreeModel:
+    def __init__(self, folder: Gio.File, ignore, files_changed_callback=None, contents_changed_callback=None) -> None:
+        # Shared ignore matcher, ignored folders are never enumerated
+        self.ignore = ignore
 
-    def on_style_scheme_changed(self, settings: Gio.Settings, key: str) -> None:
-        style_scheme_id = settings.get_string("code-view-style-scheme")
-        style_scheme = GtkSource.StyleSchemeManager.get_default().get_scheme(style_scheme_id)
-        self.get_buffer().set_style_scheme(style_scheme)
+        # Cancelled when the folder is closed, stops every pending enumeration
+        self.cancellable = Gio.Cancellable()
 
+        # Every loaded folder is monitored, the changes are applied once per frame
+        self.monitors = {}
+        self.pending_changes = {}
+        self.flush_source_id = 0
+        # Folders being enumerated, their changes wait until the enumeration is done
+        self.enumerating = set()
+        # Created files whose type is being queried, by (folder, name)
+        self.pending_queries = {}
+        # Created files whose type is known, waiting for the next flush, by folder and name
+        self.resolved_files = {}
+        self.files_changed_callback = files_changed_callback
+        # Called with the paths of the files of monitored folders written since the last flush
+        self.contents_changed_callback = contents_changed_callback
+        self.changed_contents = set()
 
-# Subclass Gtk.TreeStore to add custom features.
-class FileExplorerTreeStore(Gtk.TreeStore):
-    def __init__(self, folder) -> Gtk.TreeStore:
-        super().__init__(str, str)
-        self.create_folder_files(Path(folder.get_path()))
+        # The root node holds the absolute folder path as its name
+        self.root = FileExplorerNode(folder.get_path(), is_folder=True)
 
-    def create_folder_files(self, folder_path: Path, parent=None):
-        for file in folder_path.iterdir():
-            if file.name.startswith("."):
-                continue
-            elif file.is_dir():
-                sub_folder = self.append(parent, [file.name, str(file)])
-                self.create_folder_files(file, sub_folder)
-            elif file.is_file():
-                self.append(parent, [file.name, str(file)])
+        # Only the top level is enumerated, sub folders are filled when expanded
+        self.tree_list_model = Gtk.TreeListModel.new(
+            self.get_children_model(self.root), False, False, self.get_children_model
+        )
+        self.load_folder(self.root)
 
+    def get_children_model(self, node: FileExplorerNode):
+        # Called for every shown folder row to know if it is expandable,
+        # the folder is only enumerated by load_folder once expanded
+        if not node.is_folder:
+            return None
 
-# Subclass Gtk.TreeView to add custom features.
-class FileExplorerView(Gtk.TreeView):
-    def __init__(self, folder, file_explorer_search) -> Gtk.TreeView:
-        self.model = FileExplorerTreeStore(folder)
+        if node.children is None:
+            node.children = Gio.ListStore(item_type=FileExplorerNode)
 
-        super().__init__(model=self.model)
+        return node.children
 
-        # Set Gtk.TreeView properties
-        self.set_enable_tree_lines(True)
-        self.set_headers_visible(False)
-        self.set_fixed_height_mode(True)
+    def load_folder(self, node: FileExplorerNode) -> None:
+        if node.loaded:
+            return
 
-        # Search
-        self.set_enable_search(True)
-        self.set_search_entry(file_explorer_search)
-        self.set_search_equal_func(self.search_function)
-        self.set_search_column(0)
+        node.loaded = True
+        self.get_children_model(node)
+        self.load_folder_files(node)
 
-        self.get_style_context().add_class("navigation-sidebar")
+    def load_folder_files(self, node: FileExplorerNode) -> None:
+        # Monitor first, so no change made during the enumeration is missed
+        self.enumerating.add(node)
+        self.start_monitoring(node)
 
-        for i, column_title in enumerate(["Files"]):
-            renderer = Gtk.CellRendererText()
-            column = Gtk.TreeViewColumn(column_title, renderer, text=i)
-            column.set_property("sizing", Gtk.TreeViewColumnSizing.FIXED)
-            self.append_column(column)
-
-    def search_function(self, model, column, key, rowiter):
-        row = model[rowiter]
-        if key.lower() in list(row)[column - 1].lower():
-            return False  # Search matches
-
-        # Search in child rows.  If one of the rows matches, expand the row so that it will be open in later checks.
-        for inner in row.iterchildren():
-            if key.lower() in list(inner)[column - 1].lower():
-                self.expand_to_path(row.path)
-                break
+        # The ignore files of the folder are read before filtering its entries,
+        # the rules of the folders above it were read when they were loaded
+        if self.ignore.has_folder_rules(node.get_path()):
+            self.enumerate_folder(node)
         else:
-            self.collapse_row(row.path)
+            self.ignore.load_folder_rules_async(node.get_path(), self.cancellable, lambda: self.enumerate_folder(node))
+
+    def enumerate_folder(self, node: FileExplorerNode) -> None:
+        Gio.File.new_for_path(node.get_path()).enumerate_children_async(
+            FILE_ATTRIBUTES,
+            Gio.FileQueryInfoFlags.NONE,
+            GLib.PRIORITY_DEFAULT,
+            self.cancellable,
+            self.on_enumerate_children,
+            node,
+        )
+
+    def cancel(self) -> None:
+        self.cancellable.cancel()
+
+        for monitor in self.monitors.values():
+            monitor.cancel()
+        self.monitors.clear()
+
+        self.pending_changes.clear()
+        self.pending_queries.clear()
+        self.resolved_files.clear()
+        if self.flush_source_id:
+            GLib.source_remove(self.flush_source_id)
+            self.flush_source_id = 0
+
+    def start_monitoring(self, node: FileExplorerNode) -> None:
+        try:
+            monitor = Gio.File.new_for_path(node.get_path()).monitor_directory(
+                Gio.FileMonitorFlags.WATCH_MOVES, self.cancellable
+            )
+        except GLib.Error:
+            return
+
+        monitor.connect("changed", self.on_folder_changed, node)
+        self.monitors[node] = monitor
+
+    def stop_monitoring(self, folder: FileExplorerNode) -> None:
+        # Stop watching the removed folder and every loaded folder inside it
+        for node in [node for node in self.monitors if node.is_inside(folder)]:
+            self.monitors.pop(node).cancel()
+            self.pending_changes.pop(node, None)
+            self.resolved_files.pop(node, None)
+
+    def on_folder_changed(self, monitor, file: Gio.File, other_file, event_type, node: FileExplorerNode) -> None:
+        # Reload the rules of a folder whose ignore files are edited, the old ones are used meanwhile
+        if file.get_basename() in IGNORE_FILE_NAMES:
+            self.ignore.load_folder_rules_async(node.get_path(), self.cancellable)
+
+        if event_type in (Gio.FileMonitorEvent.CREATED, Gio.FileMonitorEvent.MOVED_IN):
+            self.queue_change(node, file.get_basename(), True)
+        elif event_type in (Gio.FileMonitorEvent.DELETED, Gio.FileMonitorEvent.MOVED_OUT):
+            self.queue_change(node, file.get_basename(), False)
+        elif event_type == Gio.FileMonitorEvent.RENAMED:
+            self.queue_change(node, file.get_basename(), False)
+            self.queue_change(node, other_file.get_basename(), True)
+        elif event_type == Gio.FileMonitorEvent.CHANGES_DONE_HINT and self.contents_changed_callback:
+            path = os.path.join(node.get_path(), file.get_basename())
+            if not file.get_basename().startswith(".") and not self.ignore.is_ignored(path, False):
+                self.changed_contents.add(path)
+                self.queue_flush()
+
+    def queue_change(self, node: FileExplorerNode, name: str, exists: bool) -> None:
+        # Only the last event of each name matters, bursts collapse into one change
+        self.pending_changes.setdefault(node, {})[name] = exists
+        self.queue_flush()
+
+    def queue_flush(self) -> None:
+        if not self.flush_source_id:
+            self.flush_source_id = GLib.timeout_add(MONITOR_FLUSH_INTERVAL, self.flush_pending_changes)
+
+    def flush_pending_changes(self) -> bool:
+        self.flush_source_id = 0
+
+        # The changes of the folders still being enumerated are applied once they are done
+        pending_changes = {
+            node: changes for node, changes in self.pending_changes.items() if node not in self.enumerating
+        }
+        for node in pending_changes:
+            del self.pending_changes[node]
+        resolved_files, self.resolved_files = self.resolved_files, {}
+
+        added_files = []
+        removed_paths = []
+        for node in pending_changes.keys() | resolved_files.keys():
+            store = node.children
+            folder_path = node.get_path()
+            positions = {store.get_item(position).name: position for position in range(store.get_n_items())}
+
+            removed_positions = []
+            for name, exists in pending_changes.get(node, {}).items():
+                if name.startswith("."):
+                    continue
+
+                if exists and name not in positions:
+                    # The type of the new file is queried without blocking the frame
+                    self.query_created_file(node, name)
+                elif not exists:
+                    # A file removed while its type is queried, or before it is inserted, is never added
+                    self.pending_queries.pop((node, name), None)
+                    resolved_files.get(node, {}).pop(name, None)
+                    if name in positions:
+                        removed_positions.append(positions[name])
+                        removed_paths.append(os.path.join(folder_path, name))
+                        self.stop_monitoring(store.get_item(positions[name]))
+
+            new_nodes = []
+            for name, file_type in resolved_files.get(node, {}).items():
+                path = os.path.join(folder_path, name)
+                if name in positions or self.ignore.is_ignored(path, file_type == Gio.FileType.DIRECTORY):
+                    continue
+                if file_type == Gio.FileType.DIRECTORY:
+                    new_nodes.append(FileExplorerNode(name, node, is_folder=True))
+                elif file_type == Gio.FileType.REGULAR:
+                    new_nodes.append(FileExplorerNode(name, node))
+                    added_files.append(path)
+
+            # Remove runs of contiguous rows from the end so the positions stay valid
+            removed_positions.sort(reverse=True)
+            while removed_positions:
+                end = removed_positions.pop(0)
+                start = end
+                while removed_positions and removed_positions[0] == start - 1:
+                    start = removed_positions.pop(0)
+                store.splice(start, end - start + 1, [])
+
+            # Insert every new entry of the folder with a single items-changed emission
+            if new_nodes:
+                store.splice(store.get_n_items(), 0, new_nodes)
+
+        if self.files_changed_callback and (added_files or removed_paths):
+            self.files_changed_callback(added_files, removed_paths)
+
+        changed_paths, self.changed_contents = list(self.changed_contents), set()
+        if self.contents_changed_callback and changed_paths:
+            self.contents_changed_callback(changed_paths)
+
+        return GLib.SOURCE_REMOVE
+
+    def query_created_file(self, node: FileExplorerNode, name: str) -> None:
+        key = (node, name)
+        if key in self.pending_queries:
+            return
+
+        # Each query gets its own token, so a removed and created again file only counts the last one
+        token = object()
+        self.pending_queries[key] = token
+        Gio.File.new_for_path(os.path.join(node.get_path(), name)).query_info_async(
+            "standard::type",
+            Gio.FileQueryInfoFlags.NOFOLLOW_SYMLINKS,
+            GLib.PRIORITY_DEFAULT,
+            self.cancellable,
+            self.on_query_created_file,
+            (key, token),
+        )
+
+    def on_query_created_file(self, file: Gio.File, result, data) -> None:
+        key, token = data
+        try:
+            file_info = file.query_info_finish(result)
+        except GLib.Error:
+            # Removed before it could be queried, or the folder was closed
+            if self.pending_queries.get(key) is token:
+                del self.pending_queries[key]
+            return
+
+        if self.pending_queries.get(key) is not token:
+            return
+        del self.pending_queries[key]
+
+        node, name = key
+        if node in self.monitors:
+            self.resolved_files.setdefault(node, {})[name] = file_info.get_file_type()
+            self.queue_flush()
+
+    def finish_loading(self, node: FileExplorerNode) -> None:
+        """Applies the changes seen while the folder was being enumerated."""
+        self.enumerating.discard(node)
+        if node in self.pending_changes:
+            self.queue_flush()
+
+    def on_enumerate_children(self, folder: Gio.File, result, node: FileExplorerNode) -> None:
+        try:
+            enumerator = folder.enumerate_children_finish(result)
+        except GLib.Error:
+            self.finish_loading(node)
+            return
+
+        enumerator.next_files_async(
+            ENUMERATE_BATCH_SIZE, GLib.PRIORITY_DEFAULT, self.cancellable, self.on_next_files, node
+        )
+
+    def on_next_files(self, enumerator: Gio.FileEnumerator, result, node: FileExplorerNode) -> None:
+        try:
+            files_info = enumerator.next_files_finish(result)
+        except GLib.Error:
+            files_info = None
+
+        # The enumeration finished, failed or was cancelled
+        if not files_info:
+            enumerator.close_async(GLib.PRIORITY_DEFAULT, None, None, None)
+            self.finish_loading(node)
+            return
+
+        with tracing.span("Populate folder", files=len(files_info)):
+            new_nodes = []
+            folder_path = node.get_path()
+            for file_info in files_info:
+                name = file_info.get_name()
+                if name.startswith("."):
+                    continue
+
+                file_type = file_info.get_file_type()
+                if self.ignore.is_ignored(os.path.join(folder_path, name), file_type == Gio.FileType.DIRECTORY):
+                    continue
+
+                if file_type == Gio.FileType.DIRECTORY:
+                    new_nodes.append(FileExplorerNode(name, node, is_folder=True))
+                elif file_type == Gio.FileType.REGULAR:
+                    new_nodes.append(FileExplorerNode(name, node))
+
+            # Insert the whole batch with a single items-changed emission
+            node.children.splice(node.children.get_n_items(), 0, new_nodes)
+
+        enumerator.next_files_async(
+            ENUMERATE_BATCH_SIZE, GLib.PRIORITY_DEFAULT, self.cancellable, self.on_next_files, node
+        )
+
+
+# Subclass Gtk.ListView to add custom features.
+# Row widgets are recycled by the list view, so only the visible rows exist.
+class FileExplorerView(Gtk.ListView):
+    __gtype_name__ = "FileExplorerView"
+
+    # Emitted with the added file paths and the removed file or folder paths,
+    # and with the paths of the files written
+    __gsignals__ = {
+        "files-changed": (GObject.SignalFlags.RUN_FIRST, None, (object, object)),
+        "contents-changed": (GObject.SignalFlags.RUN_FIRST, None, (object,)),
+    }
+
+    def __init__(self, folder, ignore) -> Gtk.ListView:
+        # Rows are decorated with the git status of their file, only the bound rows are updated
+        self.bound_items = set()
+        self.git_status = GitStatusProvider(folder.get_path(), self.on_git_status_changed)
+        self.git_status.start()
+
+        self.model = FileExplorerTreeModel(folder, ignore, self.on_files_changed, self.on_contents_changed)
+        self.selection = Gtk.SingleSelection(model=self.model.tree_list_model, autoselect=False, can_unselect=True)
+
+        factory = Gtk.SignalListItemFactory()
+        factory.connect("setup", self.on_factory_setup)
+        factory.connect("bind", self.on_factory_bind)
+        factory.connect("unbind", self.on_factory_unbind)
+
+        super().__init__(model=self.selection, factory=factory)
+
+        # Handler of the expanded property of each bound row, folders are enumerated when expanded
+        self.expanded_handler_ids = {}
+
+        # Expand and collapse folders when a row is activated
+        self.connect("activate", self.on_activate)
+
+        self.get_style_context().add_class("navigation-sidebar")
+
+    def get_selection(self) -> Gtk.SingleSelection:
+        return self.selection
+
+    def close(self) -> None:
+        self.model.cancel()
+        self.git_status.close()
+
+    def on_files_changed(self, added_files, removed_paths) -> None:
+        self.git_status.refresh()
+        self.emit("files-changed", added_files, removed_paths)
+
+    def on_contents_changed(self, changed_paths) -> None:
+        self.git_status.refresh()
+        self.emit("contents-changed", changed_paths)
+
+    def on_git_status_changed(self) -> None:
+        # Decorate the visible rows in a single pass, the others are decorated when bound
+        for list_item in self.bound_items:
+            self.decorate_row(list_item)
+
+    def on_factory_setup(self, factory, list_item) -> None:
+        box = Gtk.Box(spacing=6)
+        box.append(Gtk.Label(xalign=0, hexpand=True, ellipsize=Pango.EllipsizeMode.END))
+        box.append(Gtk.Label(css_classes=["git-status"]))
+        expander = Gtk.TreeExpander(child=box)
+        list_item.set_child(expander)
+
+    def on_factory_bind(self, factory, list_item) -> None:
+        row = list_item.get_item()
+        expander = list_item.get_child()
+        expander.set_list_row(row)
+        expander.get_child().get_first_child().set_label(row.get_item().name)
+        self.decorate_row(list_item)
+        self.bound_items.add(list_item)
+        if row.get_item().is_folder:
+            self.expanded_handler_ids[list_item] = row.connect("notify::expanded", self.on_row_expanded)
+            self.on_row_expanded(row)
+
+    def on_factory_unbind(self, factory, list_item) -> None:
+        self.bound_items.discard(list_item)
+        handler_id = self.expanded_handler_ids.pop(list_item, None)
+        if handler_id is not None:
+            list_item.get_item().disconnect(handler_id)
+        list_item.get_child().set_list_row(None)
+
+    def on_row_expanded(self, row, _pspec=None) -> None:
+        if row.get_expanded():
+            self.model.load_folder(row.get_item())
+
+    def decorate_row(self, list_item) -> None:
+        node = list_item.get_item().get_item()
+        status = self.git_status.get_status(node.get_path(), node.is_folder)
+        status_label = list_item.get_child().get_child().get_last_child()
+        status_label.set_label(status or "")
+        status_label.set_css_classes(["git-status", GIT_STATUS_CSS_CLASSES[status]] if status else ["git-status"])
+
+    def on_activate(self, list_view, position: int) -> None:
+        row = self.model.tree_list_model.get_item(position)
+        if row.is_expandable():
+            row.set_expanded(not row.get_expanded())
+
+
+# Subclass Gtk.ListView to show the quick open finder results.
+class QuickOpenView(Gtk.ListView):
+    def __init__(self) -> Gtk.ListView:
+        # Only the best results of a search are ever materialized
+        self.results = Gtk.StringList()
+        self.selection = Gtk.SingleSelection(model=self.results, autoselect=False, can_unselect=True)
+
+        factory = Gtk.SignalListItemFactory()
+        factory.connect("setup", self.on_factory_setup)
+        factory.connect("bind", self.on_factory_bind)
+
+        super().__init__(model=self.selection, factory=factory)
+
+        self.get_style_context().add_class("navigation-sidebar")
+
+    def get_selection(self) -> Gtk.SingleSelection:
+        return self.selection
+
+    def get_first_result(self):
+        if self.results.get_n_items() == 0:
+            return None
+        return self.results.get_string(0)
+
+    def set_results(self, relative_paths) -> None:
+        self.results.splice(0, self.results.get_n_items(), relative_paths)
+
+    def on_factory_setup(self, factory, list_item) -> None:
+        list_item.set_child(Gtk.Label(xalign=0, ellipsize=Pango.EllipsizeMode.START))
+
+    def on_factory_bind(self, factory, list_item) -> None:
+        list_item.get_child().set_label(list_item.get_item().get_string())
+
+
+# A line matching a project search.
+class SearchMatch(GObject.Object):
+    __gtype_name__ = "SearchMatch"
+
+    def __init__(self, path: str, line: int, text: str) -> None:
+        super().__init__()
+        self.path = path
+        self.line = line
+        self.text = text
+
+
+# Subclass Gtk.ListView to show the project search results as they stream in.
+class ProjectSearchView(Gtk.ListView):
+    def __init__(self, folder_path: str) -> Gtk.ListView:
+        # Paths are shown relative to the workspace folder
+        self.folder_path = folder_path
+        self.results = Gio.ListStore(item_type=SearchMatch)
+        self.selection = Gtk.SingleSelection(model=self.results, autoselect=False, can_unselect=True)
+
+        factory = Gtk.SignalListItemFactory()
+        factory.connect("setup", self.on_factory_setup)
+        factory.connect("bind", self.on_factory_bind)
+
+        super().__init__(model=self.selection, factory=factory)
+
+        self.get_style_context().add_class("navigation-sidebar")
+
+    def get_selection(self) -> Gtk.SingleSelection:
+        return self.selection
+
+    def clear(self) -> None:
+        self.results.remove_all()
+
+    def add_results(self, matches) -> None:
+        """Appends a batch of (path, line number, line) matches at once."""
+        items = [SearchMatch(path, line, text) for path, line, text in matches]
+        self.results.splice(self.results.get_n_items(), 0, items)
+
+    def on_factory_setup(self, factory, list_item) -> None:
+        location = Gtk.Label(xalign=0, ellipsize=Pango.EllipsizeMode.START)
+        location.get_style_context().add_class("caption")
+        location.get_style_context().add_class("dim-label")
+        text = Gtk.Label(xalign=0, ellipsize=Pango.EllipsizeMode.END)
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        box.append(location)
+        box.append(text)
+        list_item.set_child(box)
 
-        return True  # Search does not match
+    def on_factory_bind(self, factory, list_item) -> None:
+        match = list_item.get_item()
+        location = list_item.get_child().get_first_child()
+        location.set_label(f"{os.path.relpath(match.path, self.folder_path)}:{match.line}")
+        location.get_next_sibling().set_label(match.text)
@@ -15,12 +15,28 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import time
+import os
+import re
 from pathlib import Path
 
-from gi.repository import Adw, Gio, GLib, Gtk, GtkSource
+from gi.repository import Adw, Gio, GLib, Gtk
 
-from .widgets import Codeview, FileExplorerView
+from . import tracing
+from .config import get_config
+from .documents import ContentCache, DocumentRegistry, HibernatedDocument, get_file_stamp
+from .hibernation import TabHibernator
+from .ignore import WorkspaceIgnore
+from .loader import FileLoader
+from .recovery import DocumentJournal, list_journals, read_journal, remove_journal, replay_journal
+from .session import load_session, save_session
+from .widgets import CodePage, FileExplorerView, ProjectSearchView, QuickOpenView
+
+# Milliseconds to wait after a keystroke before searching the file index
+QUICK_OPEN_DELAY = 30
+# Number of results shown by the quick open finder
+QUICK_OPEN_RESULTS = 50
+# Quick open queries starting with this character search the workspace symbols
+SYMBOL_QUERY_PREFIX = "#"
 
 
 # Main window class
@@ -37,7 +53,18 @@ class CodeWindow(Adw.ApplicationWindow):
     open_folder_button = Gtk.Template.Child()
     sidebar_box = Gtk.Template.Child()
     file_explorer_search = Gtk.Template.Child()
+    file_explorer_scrolled_window = Gtk.Template.Child()
+    quick_open_scrolled_window = Gtk.Template.Child()
+    project_search_box = Gtk.Template.Child()
+    project_search_entry = Gtk.Template.Child()
+    project_search_regex_check = Gtk.Template.Child()
+    project_search_status = Gtk.Template.Child()
+    project_search_scrolled_window = Gtk.Template.Child()
     tree_view = None
+    file_index = None
+    symbol_index = None
+    workspace_ignore = None
+    workspace_folder = None
     # Greeter
     code_greeter = Gtk.Template.Child()
     # Tabs
@@ -78,24 +105,88 @@ class CodeWindow(Adw.ApplicationWindow):
         save_as_action.connect("activate", self.save_file_dialog)
         self.add_action(save_as_action)
 
+        # Create the 'quick_open' action
+        quick_open_action = Gio.SimpleAction(name="quick_open")
+        quick_open_action.connect("activate", self.on_quick_open)
+        self.add_action(quick_open_action)
+
+        # Create the 'project_search' action
+        project_search_action = Gio.SimpleAction(name="project_search")
+        project_search_action.connect("activate", self.on_project_search)
+        self.add_action(project_search_action)
+
+        # The project search entry searches the workspace files contents
+        self.project_search = None
+        self.project_search_view = None
+        self.project_search_entry.connect("search-changed", self.on_project_search_changed)
+        self.project_search_entry.connect("stop-search", self.on_project_search_stop)
+        self.project_search_regex_check.connect("toggled", lambda check: self.on_project_search_changed())
+
+        # Create the quick open finder results view
+        self.quick_open_view = QuickOpenView()
+        self.quick_open_view.get_selection().connect("selection-changed", self.on_quick_open_selection_changed)
+        self.quick_open_scrolled_window.set_child(self.quick_open_view)
+
+        # Create the 'go_to_symbol' action, it starts a symbol query in the quick open finder
+        go_to_symbol_action = Gio.SimpleAction(name="go_to_symbol")
+        go_to_symbol_action.connect("activate", self.on_go_to_symbol)
+        self.add_action(go_to_symbol_action)
+        self.symbol_view = None
+        self.quick_open_search = None
+        self.quick_open_timeout_id = 0
+
+        # Open documents by path, and the contents of recently closed files
+        self.documents = DocumentRegistry()
+        self.content_cache = ContentCache()
+        # Tab replaced by the next file previewed from the sidebar
+        self.preview_page = None
+
+        # The sidebar search entry drives the quick open finder
+        self.file_explorer_search.connect("changed", self.on_file_explorer_search_changed)
+        self.file_explorer_search.connect("activate", self.on_file_explorer_search_activate)
+        self.file_explorer_search.connect("stop-search", self.on_file_explorer_search_stop)
+
+        # Create the 'recover_documents' action, offered when unsaved edits were left by a crash
+        recover_documents_action = Gio.SimpleAction(name="recover_documents")
+        recover_documents_action.connect("activate", self.on_recover_documents)
+        self.add_action(recover_documents_action)
+        self.recovery_journals = []
+
+        # Create the 'find' action
+        find_action = Gio.SimpleAction(name="find")
+        find_action.connect("activate", self.on_find)
+        self.add_action(find_action)
+
+        # Create the 'save_all' action referenced in window.ui
+        save_all_action = Gio.SimpleAction(name="save_all")
+        save_all_action.connect("activate", self.on_save_all)
+        self.add_action(save_all_action)
+
         # Connect the tab bar close-page signal
         self.tab_view.connect("close-page", self.on_tab_close)
 
-        # Get the GSettings instance for the app schema id
-        self.settings = Gio.Settings(schema_id="dev.eglenelidgamaliel.code")
+        # Share the settings and the resolved resources with every other window and view
+        self.config = get_config()
+        self.settings = self.config.settings
 
         # Remember the window size
         self.settings.bind("window-width", self, "default-width", Gio.SettingsBindFlags.DEFAULT)
         self.settings.bind("window-height", self, "default-height", Gio.SettingsBindFlags.DEFAULT)
         self.settings.bind("window-maximized", self, "maximized", Gio.SettingsBindFlags.DEFAULT)
 
+        # Drop the code views of the tabs left unused when they take too much memory
+        self.hibernator = TabHibernator(self.tab_view, self.settings, self.content_cache, self.restore_page)
+
+        # Remember the open workspace and tabs
+        self.connect("close-request", self.on_close_request)
+
     # Callback for the sidebar toggle action
     def on_toggle_sidebar(self, action, _):
         self.flap.set_reveal_flap(not self.flap.get_reveal_flap())
 
     # Get current code view
     def get_current_code_view(self):
-        return self.tab_view.get_selected_page().get_child().get_child()
+        return self.tab_view.get_selected_page().get_child().code_view
 
     # New file action callback
     def on_new_file(self, action, parameter):
@@ -104,31 +195,43 @@ class CodeWindow(Adw.ApplicationWindow):
         self.tab_bar.set_visible(True)
 
         # Create a new editor widget
-        new_gtksource_view = Codeview()
-
-        # Create a new scrolled window to hold the editor
-        new_scrolleable_window = Gtk.ScrolledWindow()
-        new_scrolleable_window.set_child(new_gtksource_view)
-        new_scrolleable_window.set_vexpand(True)
+        new_gtksource_view = self.create_code_view(None)
 
-        # Create a new tab and add it to the tabview
-        newly_created_page = self.tab_view.append(new_scrolleable_window)
+        # Create a new tab and add it to the tabview, its edits are journaled from the start
+        code_page = CodePage(new_gtksource_view)
+        code_page.journal = DocumentJournal()
+        code_page.journal.attach(new_gtksource_view.get_buffer())
+        newly_created_page = self.tab_view.append(code_page)
         newly_created_page.set_title("Untitled")
         newly_created_page.set_tooltip("Untitled")
 
         new_gtksource_view.grab_focus()
 
+    # Find action callback, show the find bar of the current tab
+    def on_find(self, action, _):
+        page = self.tab_view.get_selected_page()
+        if page is not None and isinstance(page.get_child(), CodePage) and page.get_child().code_view is not None:
+            page.get_child().show_find_bar()
+
     # Save (step 1) write or overwrite the file
     def on_save(self, action, _):
         current_code_view = self.get_current_code_view()
+        # Read-only viewer tabs have nothing to save
+        if current_code_view is None:
+            return
         # If the code view has no file, call the save as dialog
         if current_code_view.file:
-            self.save_file(current_code_view.file)
+            self.save_file(current_code_view.file, self.tab_view.get_selected_page())
         else:
             self.save_file_dialog()
 
     # Save (step 2) open the file chooser dialog
     def save_file_dialog(self, action=None, _=None):
+        # Remember the tab to save, the selection may change while the dialog is open
+        page = self.tab_view.get_selected_page()
+        if page is None or page.get_child().code_view is None:
+            return
+
         self._native = Gtk.FileChooserNative(
             title="Save File As",
             transient_for=self,
@@ -137,52 +240,119 @@ class CodeWindow(Adw.ApplicationWindow):
             cancel_label="_Cancel",
         )
         self._native.props.modal = True
-        self._native.connect("response", self.on_save_response)
+        self._native.connect("response", self.on_save_response, page)
         self._native.show()
 
     # Save (step 3) called when the file chooser dialog is closed
-    def on_save_response(self, native, response):
+    def on_save_response(self, native, response, page):
         if response == Gtk.ResponseType.ACCEPT:
-            self.save_file(native.get_file())
+            self.save_file(native.get_file(), page)
         self._native = None
 
-    # Save (step 4) called when the file contents are saved
-    def save_file(self, file):
-        # Get the current code view
-        buffer = self.get_current_code_view().get_buffer()
-        # Retrieve the iterator at the start of the buffer
-        start = buffer.get_start_iter()
-        # Retrieve the iterator at the end of the buffer
-        end = buffer.get_end_iter()
-        # Retrieve all the visible text between the two bounds
-        text = buffer.get_text(start, end, False)
-
-        # If there is nothing to save, return early
-        if not text:
-            return
-
-        bytes = GLib.Bytes.new(text.encode("utf-8"))
-
-        # Start the asynchronous operation to save the data into the file
-        file.replace_contents_bytes_async(bytes, None, False, Gio.FileCreateFlags.NONE, None, self.save_file_complete)
-
-    # Save (step 5) called when the file contents finish saving
-    def save_file_complete(self, file: Gio.File, result):
-        # Keep a reference to the file so we can use it later
-        code_view = self.get_current_code_view()
-        code_view.file = file
-
-        # Update the code view language
-        code_buffer = code_view.get_buffer()
-        code_buffer.set_language(GtkSource.LanguageManager.get_default().guess_language(file.get_path()))
-
-        # Update the title of the code view tab
-        current_page = self.tab_view.get_selected_page()
-        current_page.set_title(file.get_basename())
-        current_page.set_tooltip(file.get_path())
-
-        # Show a toast for the successful save
-        self.toast_overlay.add_toast(Adw.Toast(title="File saved successfully", timeout=1))
+    # Save (step 4) queue the tab to be streamed into the file
+    def save_file(self, file, page, batch=None):
+        code_page = page.get_child()
+        if code_page.hibernated is not None:
+            self.restore_page(page)
+        # Saving a partially loaded file would truncate it
+        if code_page.loader is not None:
+            return False
+
+        # Two tabs of the same file would overwrite each other's edits
+        other_page = self.documents.get(file.get_path())
+        if other_page is not None and other_page is not page:
+            self.toast_overlay.add_toast(Adw.Toast(title="The file is open in another tab", timeout=2))
+            return False
+
+        page.set_loading(True)
+
+        # Saves of the same tab are coalesced, saves of different tabs run in parallel
+        code_page.get_save_queue().save(
+            file,
+            self.settings.get_boolean("save-create-backups"),
+            lambda file, error: self.save_file_complete(page, file, error, batch),
+        )
+        return True
+
+    # Save (step 5) called when the file contents finish saving, for the tab that started it
+    def save_file_complete(self, page, file: Gio.File, error, batch=None):
+        code_page = page.get_child()
+        page.set_loading(code_page.get_save_queue().is_saving())
+
+        # The tab was closed while saving, it is no longer registered nor shown
+        if error is None and not code_page.closed:
+            # Keep a reference to the file so we can use it later
+            code_view = code_page.code_view
+            code_view.file = file
+            code_page.file_stamp = get_file_stamp(file.get_path())
+            self.documents.register(file.get_path(), page)
+
+            # The file holds the edits now, the journal starts over from it
+            if code_page.journal is not None:
+                code_page.journal.reset(file.get_path(), code_page.file_stamp)
+
+            # Extract the definitions of the saved file again
+            if self.symbol_index:
+                self.symbol_index.update([file.get_path()], [])
+
+            # The saved file may change its git status
+            if self.tree_view:
+                self.tree_view.git_status.refresh()
+
+            # Update the code view language
+            code_buffer = code_view.get_buffer()
+            code_buffer.set_modified(False)
+            code_buffer.set_language(self.config.guess_language(file.get_path()))
+
+            # Update the title of the code view tab
+            page.set_title(file.get_basename())
+            page.set_tooltip(file.get_path())
+
+        # Save all shows a single toast once every tab is written
+        if batch is not None:
+            batch["remaining"] -= 1
+            if error is not None:
+                batch["failed"] += 1
+            if batch["remaining"] == 0:
+                self.save_all_complete(batch)
+        elif error is not None:
+            self.toast_overlay.add_toast(Adw.Toast(title="The file could not be saved", timeout=2))
+        else:
+            # Show a toast for the successful save
+            self.toast_overlay.add_toast(Adw.Toast(title="File saved successfully", timeout=1))
+
+    # Save all (step 1) action callback, save every modified tab at once
+    def on_save_all(self, action, _):
+        pages = []
+        for position in range(self.tab_view.get_n_pages()):
+            page = self.tab_view.get_nth_page(position)
+            child = page.get_child()
+            code_view = child.code_view
+            # Untitled tabs need a file name, they are left to save as
+            if code_view is not None and code_view.file and code_view.get_buffer().get_modified():
+                pages.append(page)
+            elif (
+                isinstance(child, CodePage) and child.hibernated and child.hibernated.path and child.hibernated.modified
+            ):
+                pages.append(page)
+
+        batch = {"remaining": len(pages), "failed": 0}
+        for page in pages:
+            code_page = page.get_child()
+            if code_page.hibernated is not None:
+                self.restore_page(page)
+            if not self.save_file(code_page.code_view.file, page, batch):
+                batch["remaining"] -= 1
+
+        if batch["remaining"] == 0:
+            self.save_all_complete(batch)
+
+    # Save all (step 2) called when every tab finished saving
+    def save_all_complete(self, batch):
+        if batch["failed"]:
+            self.toast_overlay.add_toast(Adw.Toast(title=f"{batch['failed']} files could not be saved", timeout=2))
+        else:
+            self.toast_overlay.add_toast(Adw.Toast(title="All files saved", timeout=1))
 
     # Open (step 1) file action callback
     def open_file_dialog(self, action, parameter):
@@ -213,61 +383,253 @@ class CodeWindow(Adw.ApplicationWindow):
         # do not need it any more
         self._native = None
 
-    # Open (step 3) function to open a file asynchronously
-    def open_file(self, file):
+    # Open (step 3) function to open a file asynchronously, in a new tab shown right away.
+    # Preview tabs are replaced by the next preview until they are edited.
+    # Returns the tab of the file
+    def open_file(self, file, preview=False):
         file_path = Path(file.get_path())
         if file_path.is_dir():
-            start = time.perf_counter()
-            self.open_folder(file_path)
-            print(f"Completed Execution in {time.perf_counter() - start} seconds")
+            self.open_folder(file)
+            return None
+
+        # Focus the tab of an already open file instead of reading it again
+        page = self.documents.get(file.get_path())
+        if page is not None:
+            if not preview and page is self.preview_page:
+                self.preview_page = None
+            self.tab_view.set_selected_page(page)
+            return page
+
+        # Reuse the position of the previous preview tab
+        position = None
+        if preview and self.preview_page is not None:
+            position = self.tab_view.get_page_position(self.preview_page)
+            self.tab_view.close_page(self.preview_page)
+
+        if self.is_viewer_file(file_path):
+            # Too big for a text buffer, map it into a read-only viewer instead
+            page = self.open_viewer(file, position)
         else:
-            # Load the file contents asynchronously
-            file.load_contents_async(None, self.open_file_complete)
-
-    # Open (step 4) called when the file contents finish loading
-    def open_file_complete(self, file, result):
-        contents = file.load_contents_finish(result)
+            page = self.open_code_page(file, position)
 
-        # Try to open the file
-        if not contents[0]:
-            path = file.peek_path()
-
-        # Check if the file is a text file and UTF-8 encoding
-        try:
-            text = contents[1].decode("utf-8")
-        except UnicodeError as err:
-            path = file.peek_path()
-            return
+        if preview:
+            self.preview_page = page
+        return page
 
+    # Open (step 4) create the tab and fill it from the cache or stream the file
+    def open_code_page(self, file, position=None):
         # Hide the greeter
         self.code_greeter.set_visible(False)
         self.tab_bar.set_visible(True)
 
-        # Create a new editor widget
+        # Create a new tab and show it right away, the contents stream in
+        code_page = CodePage(self.create_code_view(file))
+        if position is None:
+            newly_created_page = self.tab_view.append(code_page)
+        else:
+            newly_created_page = self.tab_view.insert(code_page, position)
+        newly_created_page.set_title(file.get_basename())
+        newly_created_page.set_tooltip(file.get_path())
+        self.tab_view.set_selected_page(newly_created_page)
+        self.documents.register(file.get_path(), newly_created_page)
+        code_page.cancel_button.connect("clicked", self.on_open_file_cancel, newly_created_page)
+
+        self.load_code_page(newly_created_page)
+        return newly_created_page
+
+    # Create a new editor widget for a file.
+    # GtkSource is only loaded once the first editor is shown, not for the greeter
+    def create_code_view(self, file):
+        from .codeview import Codeview
+
         new_gtksource_view = Codeview()
         new_gtksource_view.file = file
-        new_gtksource_view.grab_focus()
-
-        # Load the file contents into the editor instance
         buffer = new_gtksource_view.get_buffer()
-        buffer.set_text(text)
-        buffer.set_language(GtkSource.LanguageManager.get_default().guess_language(file.get_path()))
+        if file:
+            with tracing.span("Guess language"):
+                buffer.set_language(self.config.guess_language(file.get_path()))
+        buffer.connect("modified-changed", self.on_buffer_modified_changed)
+        return new_gtksource_view
+
+    # Fill the code view of a tab with the contents of its file
+    def load_code_page(self, page, document=None):
+        code_page = page.get_child()
+        code_view = code_page.code_view
+        buffer = code_view.get_buffer()
+        file = code_view.file
+        code_page.file_stamp = get_file_stamp(file.get_path())
+
+        # Recently read files skip the disk and the decoding
+        cached = self.content_cache.get(file.get_path(), code_page.file_stamp)
+        if cached is not None:
+            text, code_page.longest_line = cached
+            if code_view.is_large_file(code_page.file_stamp[1], code_page.longest_line):
+                code_page.enable_large_file_mode()
+            with tracing.span("Set text", source="cache", characters=len(text)):
+                buffer.begin_irreversible_action()
+                buffer.set_text(text)
+                buffer.end_irreversible_action()
+            self.open_file_complete(page, None, document)
+            return
 
-        # Place the cursor at the beginning of the file
-        start = buffer.get_start_iter()
-        buffer.place_cursor(start)
+        page.set_loading(True)
 
-        # Create a new scrolled window to hold the editor
-        new_scrolleable_window = Gtk.ScrolledWindow()
-        new_scrolleable_window.set_child(new_gtksource_view)
-        new_scrolleable_window.set_vexpand(True)
+        # Load the file contents asynchronously in chunks
+        loader = FileLoader(
+            file,
+            buffer,
+            code_page.show_progress,
+            lambda error: self.open_file_complete(page, error, document),
+        )
+        code_page.start_loading(loader)
+
+    # Rebuild the code view of a hibernated tab
+    def restore_page(self, page):
+        code_page = page.get_child()
+        document = code_page.hibernated
+        file = Gio.File.new_for_path(document.path) if document.path else None
+
+        # Restored sessions may point to files that grew too big for a text buffer
+        if file and document.compressed_text is None and self.is_viewer_file(Path(document.path)):
+            # Show the viewer first, so closing the placeholder does not select another tab
+            self.open_viewer(file, self.tab_view.get_page_position(page))
+            self.tab_view.close_page(page)
+            return
+
+        code_page.restore(self.create_code_view(file))
+
+        # Modified buffers kept their text, clean files are read again
+        text = document.get_text()
+        if text is None:
+            self.load_code_page(page, document)
+            return
+
+        buffer = code_page.code_view.get_buffer()
+        if code_page.code_view.is_large_file(document.size, code_page.longest_line):
+            code_page.enable_large_file_mode()
+        with tracing.span("Set text", source="hibernation", characters=len(text)):
+            buffer.begin_irreversible_action()
+            buffer.set_text(text)
+            buffer.end_irreversible_action()
+        buffer.set_modified(document.modified)
+        if code_page.journal is not None:
+            code_page.journal.attach(buffer)
+        code_page.place_cursor(document.cursor, document.top)
+        code_page.go_to_pending_line()
+        if page.get_selected():
+            code_page.code_view.grab_focus()
+
+    # Open (step 5) called when the file contents finish loading
+    def open_file_complete(self, page, error, document=None):
+        code_page = page.get_child()
+        code_page.finish_loading()
+        page.set_loading(False)
+
+        # The buffer only holds part of the file, never cache it
+        if error is not None:
+            code_page.file_stamp = None
+
+        # Files that are not valid UTF-8 text are shown in the read-only viewer
+        if isinstance(error, UnicodeError):
+            position = self.tab_view.get_page_position(page)
+            is_preview = page is self.preview_page
+            self.tab_view.close_page(page)
+            viewer_page = self.open_viewer(code_page.code_view.file, position)
+            if is_preview:
+                self.preview_page = viewer_page
+            return
+
+        # Check if the file could be read
+        if error is not None:
+            self.tab_view.close_page(page)
+            self.toast_overlay.add_toast(Adw.Toast(title="The file could not be opened", timeout=2))
+            return
 
-        # Create a new tab and add it to the tabview
-        newly_created_page = self.tab_view.append(new_scrolleable_window)
+        # Place the cursor at the beginning of the file, or where it was before hibernating
+        buffer = code_page.code_view.get_buffer()
+        buffer.set_modified(False)
+
+        # Journal the edits made from the text read
+        if code_page.journal is None:
+            code_page.journal = DocumentJournal()
+        code_page.journal.reset(code_page.code_view.file.get_path(), code_page.file_stamp)
+        code_page.journal.attach(buffer)
+        if document is None:
+            buffer.place_cursor(buffer.get_start_iter())
+        else:
+            code_page.place_cursor(document.cursor, document.top)
+        code_page.go_to_pending_line()
+
+        if page.get_selected():
+            code_page.code_view.grab_focus()
+
+    # Called when a buffer is modified or saved, editing a preview tab keeps it open
+    def on_buffer_modified_changed(self, buffer):
+        if (
+            buffer.get_modified()
+            and self.preview_page is not None
+            and self.preview_page.get_child().code_view is not None
+            and self.preview_page.get_child().code_view.get_buffer() is buffer
+        ):
+            self.preview_page = None
+
+    # Open many files at once, like the files given on the command line.
+    # Only the last file is read, the others get tabs read when first selected
+    def open_files(self, files):
+        folders = [file for file in files if Path(file.get_path()).is_dir()]
+        if folders:
+            self.open_folder(folders[0])
+
+        files = [file for file in files if not Path(file.get_path()).is_dir()]
+        if not files:
+            return
+
+        self.code_greeter.set_visible(False)
+        self.tab_bar.set_visible(True)
+
+        # The file to show is opened first, so no placeholder is ever selected and read
+        position = self.tab_view.get_n_pages()
+        self.open_file(files[-1])
+        for file in files[:-1]:
+            if self.documents.get(file.get_path()) is None:
+                self.add_placeholder_page(file.get_path(), position=position)
+                position += 1
+
+    # Check if a file is over the size from which it is opened in the viewer
+    def is_viewer_file(self, file_path):
+        threshold = self.settings.get_uint("viewer-size-threshold") * 1024 * 1024
+        try:
+            return 0 < threshold <= file_path.stat().st_size
+        except OSError:
+            return False
+
+    # Open a file in a read-only memory mapped viewer tab
+    def open_viewer(self, file, position=None):
+        from .viewer import LargeFileViewer
+
+        try:
+            viewer = LargeFileViewer(file)
+        except OSError:
+            self.toast_overlay.add_toast(Adw.Toast(title="The file could not be opened", timeout=2))
+            return None
+
+        # Hide the greeter
+        self.code_greeter.set_visible(False)
+        self.tab_bar.set_visible(True)
+
+        if position is None:
+            newly_created_page = self.tab_view.append(viewer)
+        else:
+            newly_created_page = self.tab_view.insert(viewer, position)
         newly_created_page.set_title(file.get_basename())
         newly_created_page.set_tooltip(file.get_path())
+        self.tab_view.set_selected_page(newly_created_page)
+        self.documents.register(file.get_path(), newly_created_page)
+        return newly_created_page
 
-        new_gtksource_view.grab_focus()
+    # Called when the user cancels loading a file
+    def on_open_file_cancel(self, button, page):
+        self.tab_view.close_page(page)
 
     # Open folder (step 1) action callback
     def open_folder_dialog(self, action, parameter):
@@ -286,84 +648,482 @@ class CodeWindow(Adw.ApplicationWindow):
     def on_open_folder_response(self, dialog, response):
         # If the user selected a file...
         if response == Gtk.ResponseType.ACCEPT:
-            # Hide the folder chooser button
-            self.open_folder_button.set_visible(False)
+            self.open_folder(dialog.get_file())
 
-            # Set the window title to the folder name
-            self.window_title.set_title(dialog.get_file().get_basename())
+        # Release the reference on the file selection dialog now that we
+        # do not need it any more
+        self._native = None
 
-            # If there is already a folder open, remove it
-            if self.tree_view:
-                self.sidebar_box.remove(self.tree_view)
+    # Open folder (step 3) show the folder in the file explorer
+    def open_folder(self, folder):
+        with tracing.span("Open workspace", path=folder.get_path()):
+            self.show_folder(folder)
 
-            # Create the file explorer view
-            self.tree_view = FileExplorerView(dialog.get_file(), self.file_explorer_search)
+    # Open folder (step 4) replace the workspace shown in the sidebar
+    def show_folder(self, folder):
+        # Hide the folder chooser button
+        self.open_folder_button.set_visible(False)
 
-            # Connect the selection "changed" signal of the file explorer view
-            select = self.tree_view.get_selection()
-            select.connect("changed", self.on_tree_selection_changed)
+        # Set the window title to the folder name
+        self.window_title.set_title(folder.get_basename())
 
-            # Add the file explorer view to the sidebar
-            self.sidebar_box.append(self.tree_view)
+        self.workspace_folder = folder
 
-            # Reveal the search entry
-            self.file_explorer_search.set_visible(True)
+        # If there is already a folder open, remove it
+        if self.tree_view:
+            self.tree_view.close()
+        if self.file_index:
+            self.file_index.cancel()
+        if self.symbol_index:
+            self.symbol_index.cancel()
+        self.file_explorer_search.set_text("")
 
-            # Reveal the sidebar
-            self.flap.set_reveal_flap(True)
+        # Ignore rules shared by every walker of the workspace
+        workspace_ignore = WorkspaceIgnore.new_from_settings(folder.get_path(), self.settings)
+        self.workspace_ignore = workspace_ignore
 
-        # Release the reference on the file selection dialog now that we
-        # do not need it any more
-        self._native = None
+        # Drop the results of the previous workspace
+        if self.project_search:
+            self.project_search.cancel()
+            self.project_search = None
+        self.project_search_view = ProjectSearchView(folder.get_path())
+        self.project_search_view.get_selection().connect("selection-changed", self.on_match_selection_changed)
+        self.project_search_scrolled_window.set_child(self.project_search_view)
+        self.project_search_entry.set_text("")
+
+        # Create the file explorer view
+        self.tree_view = FileExplorerView(folder, workspace_ignore)
+
+        # Index the folder files for the quick open finder in the background
+        from .file_index import FileIndex
+
+        self.file_index = FileIndex(workspace_ignore)
+        self.file_index.build(self.on_file_index_ready)
+
+        # Extract the workspace definitions, only the files changed since the last time are parsed
+        from .symbols import SymbolIndex
+
+        self.symbol_index = SymbolIndex(workspace_ignore)
+        self.symbol_index.build()
+        self.symbol_view = ProjectSearchView(folder.get_path())
+        self.symbol_view.get_selection().connect("selection-changed", self.on_match_selection_changed)
+
+        # Keep the file index in sync with the changes seen by the file explorer
+        self.tree_view.connect("files-changed", self.on_explorer_files_changed)
+        self.tree_view.connect("contents-changed", self.on_explorer_contents_changed)
+
+        # Connect the selection "changed" signal of the file explorer view
+        select = self.tree_view.get_selection()
+        select.connect("selection-changed", self.on_tree_selection_changed)
+
+        # Activating a file row keeps it open instead of previewing it
+        self.tree_view.connect("activate", self.on_tree_activate)
+
+        # Add the file explorer view to the sidebar, replacing the previous one
+        self.file_explorer_scrolled_window.set_child(self.tree_view)
+
+        # Reveal the search entry
+        self.file_explorer_search.set_visible(True)
+
+        # Reveal the sidebar
+        self.flap.set_reveal_flap(True)
 
     # Called when the user selects a file in the file explorer view
-    def on_tree_selection_changed(self, selection):
-        model, treeiter = selection.get_selected()
-        if treeiter is not None:
-            path = Path(model[treeiter][1])
-            if not path.is_dir():
-                gfile = Gio.File.new_for_path(model[treeiter][1])
-                self.open_file(gfile)
+    def on_tree_selection_changed(self, selection, position, n_items):
+        row = selection.get_selected_item()
+        if row is not None:
+            node = row.get_item()
+            if not node.is_folder:
+                gfile = Gio.File.new_for_path(node.get_path())
+                self.open_file(gfile, preview=True)
+
+    # Quick open (step 1) action callback, focus the sidebar search entry
+    def on_quick_open(self, action, parameter):
+        if self.file_explorer_search.get_visible():
+            self.flap.set_reveal_flap(True)
+            self.file_explorer_search.grab_focus()
+
+    # Quick open (step 2) called on every keystroke in the search entry
+    def on_file_explorer_search_changed(self, entry):
+        tracing.instant("Quick open keystroke")
+
+        # Drop the pending and the running searches, only the last query matters
+        if self.quick_open_timeout_id:
+            GLib.source_remove(self.quick_open_timeout_id)
+            self.quick_open_timeout_id = 0
+        if self.quick_open_search:
+            self.quick_open_search.cancel()
+            self.quick_open_search = None
+
+        # Show the results instead of the file explorer while there is a query
+        query = entry.get_text().strip()
+        self.quick_open_scrolled_window.set_visible(bool(query))
+        self.file_explorer_scrolled_window.set_visible(not query)
+
+        # Symbol queries show their results in their own list
+        is_symbol_query = query.startswith(SYMBOL_QUERY_PREFIX) and self.symbol_view is not None
+        results_view = self.symbol_view if is_symbol_query else self.quick_open_view
+        if self.quick_open_scrolled_window.get_child() is not results_view:
+            self.quick_open_scrolled_window.set_child(results_view)
+
+        if is_symbol_query:
+            symbol_query = query[len(SYMBOL_QUERY_PREFIX) :].strip()
+            if symbol_query:
+                self.quick_open_timeout_id = GLib.timeout_add(
+                    QUICK_OPEN_DELAY, self.on_symbol_query_timeout, symbol_query
+                )
+            else:
+                self.symbol_view.clear()
+        elif query:
+            self.quick_open_timeout_id = GLib.timeout_add(QUICK_OPEN_DELAY, self.on_quick_open_timeout, query)
+        else:
+            self.quick_open_view.set_results([])
+
+    # Quick open (step 3) called once the keystrokes settle
+    def on_quick_open_timeout(self, query):
+        self.quick_open_timeout_id = 0
+        # The search is started again once the index is ready
+        if self.file_index and self.file_index.ready:
+            self.quick_open_search = self.file_index.search(query, QUICK_OPEN_RESULTS, self.on_quick_open_results)
+        return GLib.SOURCE_REMOVE
+
+    # Go to symbol (step 1) action callback, start a symbol query in the sidebar search entry
+    def on_go_to_symbol(self, action, parameter):
+        if self.file_explorer_search.get_visible():
+            self.flap.set_reveal_flap(True)
+            self.file_explorer_search.set_text(SYMBOL_QUERY_PREFIX)
+            self.file_explorer_search.grab_focus()
+            self.file_explorer_search.set_position(-1)
+
+    # Go to symbol (step 2) called once the keystrokes settle
+    def on_symbol_query_timeout(self, query):
+        self.quick_open_timeout_id = 0
+        self.symbol_index.search(query, QUICK_OPEN_RESULTS, self.on_symbol_results)
+        return GLib.SOURCE_REMOVE
+
+    # Go to symbol (step 3) called with the matching definitions
+    def on_symbol_results(self, symbols):
+        self.symbol_view.clear()
+        self.symbol_view.add_results((path, line, f"{name}  ({kind})") for path, line, name, kind in symbols)
+
+    # Quick open (step 4) called with the best results found so far
+    def on_quick_open_results(self, relative_paths, finished):
+        self.quick_open_view.set_results(relative_paths)
+        if finished:
+            self.quick_open_search = None
+
+    # Called when the file index finishes building
+    def on_file_index_ready(self, file_index):
+        if self.file_explorer_search.get_text().strip():
+            self.on_file_explorer_search_changed(self.file_explorer_search)
+
+    # Called when the file explorer applies a batch of folder changes
+    def on_explorer_files_changed(self, tree_view, added_files, removed_paths):
+        self.file_index.update(added_files, removed_paths)
+        self.symbol_index.update(added_files, removed_paths)
+
+    # Called when the file explorer sees files written, by the editor or other programs
+    def on_explorer_contents_changed(self, tree_view, changed_paths):
+        self.symbol_index.update(changed_paths, [])
+
+    # Called when the user presses enter on the search entry
+    def on_file_explorer_search_activate(self, entry):
+        if self.quick_open_scrolled_window.get_child() is self.symbol_view:
+            match = self.symbol_view.get_selection().get_model().get_item(0)
+            if match is not None:
+                page = self.open_file(Gio.File.new_for_path(match.path))
+                if page is not None and isinstance(page.get_child(), CodePage):
+                    page.get_child().go_to_line(match.line)
+            return
 
-    # Called when the user closes a tab
-    def on_tab_close(self, tab_view, tab_page):
-        if self.tab_view.get_n_pages() == 1:
-            self.code_greeter.set_visible(True)
-            self.tab_bar.set_visible(False)
+        relative_path = self.quick_open_view.get_first_result()
+        if relative_path is not None:
+            self.open_file(Gio.File.new_for_path(self.file_index.get_absolute_path(relative_path)))
+
+    # Called when the user presses escape on the search entry
+    def on_file_explorer_search_stop(self, entry):
+        entry.set_text("")
+
+    # Called when the user selects a quick open result
+    def on_quick_open_selection_changed(self, selection, position, n_items):
+        item = selection.get_selected_item()
+        if item is not None:
+            self.open_file(Gio.File.new_for_path(self.file_index.get_absolute_path(item.get_string())), preview=True)
+
+    # Project search (step 1) action callback, show the search in the sidebar
+    def on_project_search(self, action, parameter):
+        if self.workspace_ignore is None:
+            self.toast_overlay.add_toast(Adw.Toast(title="Open a folder to search in its files", timeout=2))
+            return
+
+        self.sidebar_box.set_visible(False)
+        self.file_explorer_scrolled_window.set_visible(False)
+        self.quick_open_scrolled_window.set_visible(False)
+        self.project_search_box.set_visible(True)
+        self.flap.set_reveal_flap(True)
+        self.project_search_entry.grab_focus()
+
+    # Project search (step 2) called when the query or its options change,
+    # a new query cancels the running search
+    def on_project_search_changed(self, entry=None):
+        from .search import WorkspaceSearch, compile_query
+
+        if self.project_search:
+            self.project_search.cancel()
+            self.project_search = None
+        self.project_search_view.clear()
+
+        query = self.project_search_entry.get_text()
+        if len(query) < 2:
+            self.project_search_status.set_label("")
+            return
 
+        try:
+            regex = compile_query(query, self.project_search_regex_check.get_active())
+        except re.error as err:
+            self.project_search_status.set_label(f"Invalid regular expression: {err}")
+            return
 
-# About dialog
-class AboutDialog(Gtk.AboutDialog):
-    def __init__(self, parent):
-        Gtk.AboutDialog.__init__(self)
-        self.props.program_name = "Code"
-        self.props.version = "0.0.1"
-        self.props.authors = ["Eglenelid Gamaliel Gutierrez Hernandez"]
-        self.props.copyright = "2022 Eglenelid Gamaliel Gutierrez Hernandez"
-        self.props.logo_icon_name = "dev.eglenelidgamaliel.code"
-        self.props.modal = True
-        self.set_transient_for(parent)
+        self.project_search_status.set_label("Searching...")
+        self.project_search = WorkspaceSearch(
+            self.workspace_ignore, regex, self.on_project_search_results, self.on_project_search_finished
+        )
+        self.project_search.start()
+
+    # Project search (step 3) called with each batch of matches
+    def on_project_search_results(self, matches):
+        self.project_search_view.add_results(matches)
+        self.project_search_status.set_label(f"Searching... {self.project_search.match_count} matches")
+
+    # Project search (step 4) called once every file is searched
+    def on_project_search_finished(self, match_count, truncated):
+        self.project_search = None
+        if truncated:
+            self.project_search_status.set_label(f"Showing the first {match_count} matches")
+        else:
+            self.project_search_status.set_label(f"{match_count} matches")
 
+    # Called when the user selects a project search or symbol result, open the file at the line
+    def on_match_selection_changed(self, selection, position, n_items):
+        match = selection.get_selected_item()
+        if match is None:
+            return
 
-# Preferences dialog
-@Gtk.Template(resource_path="/dev/eglenelidgamaliel/code/gtk/preferences_window.ui")
-class PreferencesWindow(Adw.PreferencesWindow):
-    __gtype_name__ = "PreferencesWindow"
+        page = self.open_file(Gio.File.new_for_path(match.path), preview=True)
+        if page is not None and isinstance(page.get_child(), CodePage):
+            page.get_child().go_to_line(match.line)
+
+    # Called when the user leaves the project search, show the file explorer back
+    def on_project_search_stop(self, entry):
+        self.project_search_box.set_visible(False)
+        self.sidebar_box.set_visible(True)
+        self.on_file_explorer_search_changed(self.file_explorer_search)
+
+    # Session (step 1) reopen the workspace and tabs of the previous session.
+    # Only the selected tab is read, the others are hibernated placeholders
+    # rebuilt when they are first selected
+    def restore_session(self):
+        session = load_session()
+        if session is None:
+            return
 
-    preferences_style_group = Gtk.Template.Child()
+        workspace = session.get("workspace")
+        if workspace and os.path.isdir(workspace):
+            self.open_folder(Gio.File.new_for_path(workspace))
+
+        # Files removed since the session was saved are skipped
+        tabs = []
+        selected = 0
+        for index, tab in enumerate(session.get("tabs", [])):
+            if os.path.isfile(tab["path"]):
+                if index == session.get("selected"):
+                    selected = len(tabs)
+                tabs.append(tab)
+        if not tabs:
+            return
 
-    def __init__(self, window):
-        Adw.PreferencesWindow.__init__(self)
+        self.code_greeter.set_visible(False)
+        self.tab_bar.set_visible(True)
 
-        self.props.modal = True
-        self.set_transient_for(window)
+        # The selected tab is added first, so no other tab is ever selected and read
+        first_position = self.tab_view.get_n_pages()
+        selected_page = self.add_placeholder_page(**tabs[selected])
+        for index, tab in enumerate(tabs):
+            if index < selected:
+                self.add_placeholder_page(**tab, position=first_position + index)
+            elif index > selected:
+                self.add_placeholder_page(**tab)
+
+        self.tab_view.set_selected_page(selected_page)
+        if selected_page.get_child().hibernated is not None:
+            self.restore_page(selected_page)
+
+    # Session (step 2) add a tab that reads its file when selected
+    def add_placeholder_page(self, path, cursor=0, top=0, position=None):
+        code_page = CodePage(None)
+        code_page.hibernated = HibernatedDocument(path, cursor, top)
+        if position is None:
+            page = self.tab_view.append(code_page)
+        else:
+            page = self.tab_view.insert(code_page, position)
+        page.set_title(os.path.basename(path))
+        page.set_tooltip(path)
+        self.documents.register(path, page)
+        code_page.cancel_button.connect("clicked", self.on_open_file_cancel, page)
+        return page
+
+    # Session (step 3) write the workspace and the tabs with a file
+    def save_session(self):
+        tabs = []
+        selected = 0
+        for position in range(self.tab_view.get_n_pages()):
+            page = self.tab_view.get_nth_page(position)
+            child = page.get_child()
+            if isinstance(child, CodePage) and child.hibernated is not None:
+                document = child.hibernated
+                tab = {"path": document.path, "cursor": document.cursor, "top": document.top}
+            elif child.code_view is not None:
+                buffer = child.code_view.get_buffer()
+                tab = {
+                    "path": child.code_view.file.get_path() if child.code_view.file else None,
+                    "cursor": buffer.get_iter_at_mark(buffer.get_insert()).get_offset(),
+                    "top": child.get_top_offset(),
+                }
+            else:
+                tab = {"path": child.file.get_path(), "cursor": 0, "top": 0}
+
+            # Untitled tabs have nothing to reopen
+            if tab["path"] is None:
+                continue
+            if page.get_selected():
+                selected = len(tabs)
+            tabs.append(tab)
+
+        workspace = self.workspace_folder.get_path() if self.workspace_folder else None
+        save_session(workspace, tabs, selected)
+
+    # Called when the window is closed
+    def on_close_request(self, window):
+        self.save_session()
+        self.discard_journals()
+        return False
+
+    # Recovery (step 1) offer to rebuild the unsaved documents left by a crash
+    def offer_recovery(self):
+        self.recovery_journals = list_journals()
+        if not self.recovery_journals:
+            return
 
-        self.settings = Gio.Settings(schema_id="dev.eglenelidgamaliel.code")
+        count = len(self.recovery_journals)
+        toast = Adw.Toast(
+            title=(
+                f"{count} unsaved documents can be recovered" if count > 1 else "An unsaved document can be recovered"
+            ),
+            button_label="Recover",
+            action_name="win.recover_documents",
+            timeout=0,
+        )
+        toast.connect("dismissed", self.on_recovery_toast_dismissed)
+        self.toast_overlay.add_toast(toast)
+
+    # Recovery (step 2) the toast may be dismissed before its action runs, decide on idle
+    def on_recovery_toast_dismissed(self, toast):
+        GLib.idle_add(self.forget_recovery_journals)
+
+    def forget_recovery_journals(self):
+        # The journals the user did not recover are dropped
+        for journal_path in self.recovery_journals:
+            remove_journal(journal_path)
+        self.recovery_journals = []
+        return GLib.SOURCE_REMOVE
+
+    # Recovery (step 3) rebuild every document in its own tab
+    def on_recover_documents(self, action, _):
+        journal_paths, self.recovery_journals = self.recovery_journals, []
+        failed = 0
+        for journal_path in journal_paths:
+            try:
+                self.recover_document(journal_path)
+            except ValueError:
+                remove_journal(journal_path)
+                failed += 1
+
+        if failed:
+            self.toast_overlay.add_toast(Adw.Toast(title=f"{failed} documents could not be recovered", timeout=2))
+
+    # Recovery (step 4) replay the journal onto its file and show the modified buffer
+    def recover_document(self, journal_path):
+        header, records = read_journal(journal_path)
+        path = header["path"]
+        file = Gio.File.new_for_path(path) if path else None
+
+        code_page = CodePage(self.create_code_view(file))
+        buffer = code_page.code_view.get_buffer()
+        buffer.begin_irreversible_action()
+        replay_journal(header, records, buffer)
+        buffer.end_irreversible_action()
+        buffer.set_modified(True)
+        buffer.place_cursor(buffer.get_start_iter())
+
+        # The recovered text takes the place of the tab of its file, like a restored session tab
+        position = None
+        existing_page = self.documents.get(path) if path else None
+        if existing_page is not None:
+            position = self.tab_view.get_page_position(existing_page)
+            self.tab_view.close_page(existing_page)
 
-        style_chooser = GtkSource.StyleSchemeChooserWidget()
-        style_chooser.connect("notify::style-scheme", self.on_scheme_changed)
+        self.code_greeter.set_visible(False)
+        self.tab_bar.set_visible(True)
+        if position is None:
+            page = self.tab_view.append(code_page)
+        else:
+            page = self.tab_view.insert(code_page, position)
+        page.set_title(file.get_basename() if file else "Untitled")
+        page.set_tooltip(path if path else "Untitled")
+        if path:
+            self.documents.register(path, page)
+            code_page.file_stamp = get_file_stamp(path)
+        code_page.cancel_button.connect("clicked", self.on_open_file_cancel, page)
+
+        # The journal of the crashed run goes on recording the new edits
+        code_page.journal = DocumentJournal.resume(journal_path, header, records)
+        code_page.journal.attach(buffer)
+        self.tab_view.set_selected_page(page)
+
+    # Drop the journals when the window is closed on purpose
+    def discard_journals(self):
+        for position in range(self.tab_view.get_n_pages()):
+            child = self.tab_view.get_nth_page(position).get_child()
+            if isinstance(child, CodePage) and child.journal is not None:
+                child.journal.discard()
+
+    # Called when the user activates a row in the file explorer view
+    def on_tree_activate(self, tree_view, position):
+        node = tree_view.get_selection().get_item(position).get_item()
+        if not node.is_folder:
+            self.open_file(Gio.File.new_for_path(node.get_path()))
 
-        self.preferences_style_group.add(style_chooser)
+    # Called when the user closes a tab
+    def on_tab_close(self, tab_view, tab_page):
+        # Forget the document and keep the contents of a clean file for a quick reopen
+        child = tab_page.get_child()
+        self.documents.unregister(tab_page)
+        if tab_page is self.preview_page:
+            self.preview_page = None
+        code_view = child.code_view
+        if code_view is not None and code_view.file and child.file_stamp and child.is_clean():
+            buffer = code_view.get_buffer()
+            if buffer.get_char_count() <= self.content_cache.max_entry_size:
+                self.content_cache.put(
+                    code_view.file.get_path(),
+                    child.file_stamp,
+                    buffer.get_text(buffer.get_start_iter(), buffer.get_end_iter(), False),
+                    child.longest_line,
+                )
+
+        # Stop streaming the file if it is still loading, or release the viewer map
+        child.close()
 
-    def on_scheme_changed(self, widget, param):
-        self.settings.set_string("code-view-style-scheme", widget.get_style_scheme().get_id())
+        if self.tab_view.get_n_pages() == 1:
+            self.code_greeter.set_visible(True)
+            self.tab_bar.set_visible(False)
@@ -0,0 +1,77 @@
+import pytest
+
+pytest.importorskip("gi")
+
+from src.git_status import (  # noqa: E402
+    STATUS_ADDED,
+    STATUS_CONFLICTED,
+    STATUS_DELETED,
+    STATUS_MODIFIED,
+    STATUS_RENAMED,
+    STATUS_UNTRACKED,
+    parse_porcelain_v2,
+)
+
+
+def ordinary(change: bytes, path: bytes) -> bytes:
+    return b"1 " + change + b" N... 100644 100644 100644 " + b"a" * 40 + b" " + b"b" * 40 + b" " + path
+
+
+def renamed(change: bytes, path: bytes, original_path: bytes) -> bytes:
+    header = b"2 " + change + b" N... 100644 100644 100644 " + b"a" * 40 + b" " + b"b" * 40 + b" R100 "
+    return header + path + b"\0" + original_path
+
+
+def unmerged(path: bytes) -> bytes:
+    modes = b"100644 100644 100644 100644 "
+    return b"u UU N... " + modes + b"a" * 40 + b" " + b"b" * 40 + b" " + b"c" * 40 + b" " + path
+
+
+def join(*records) -> bytes:
+    return b"".join(record + b"\0" for record in records)
+
+
+def test_empty_output():
+    assert parse_porcelain_v2(b"") == {}
+
+
+def test_ordinary_changes():
+    data = join(ordinary(b".M", b"src/main.py"), ordinary(b"A.", b"new.py"), ordinary(b"D.", b"old.py"))
+    assert parse_porcelain_v2(data) == {
+        "src/main.py": STATUS_MODIFIED,
+        "new.py": STATUS_ADDED,
+        "old.py": STATUS_DELETED,
+    }
+
+
+def test_work_tree_change_wins_over_staged_one():
+    assert parse_porcelain_v2(join(ordinary(b"AM", b"a.py"))) == {"a.py": STATUS_MODIFIED}
+    assert parse_porcelain_v2(join(ordinary(b".T", b"link"))) == {"link": STATUS_MODIFIED}
+
+
+def test_paths_with_spaces():
+    assert parse_porcelain_v2(join(ordinary(b".M", b"my notes/to do.txt"))) == {"my notes/to do.txt": STATUS_MODIFIED}
+
+
+def test_rename_original_path_is_skipped():
+    data = join(renamed(b"R.", b"new name.py", b"old name.py"), ordinary(b".M", b"other.py"))
+    assert parse_porcelain_v2(data) == {"new name.py": STATUS_RENAMED, "other.py": STATUS_MODIFIED}
+
+
+def test_copy_is_an_addition():
+    assert parse_porcelain_v2(join(renamed(b"C.", b"copy.py", b"source.py"))) == {"copy.py": STATUS_ADDED}
+
+
+def test_unmerged_and_untracked():
+    data = join(unmerged(b"conflict.py"), b"? untracked.py", b"? build dir/", b"! ignored.o")
+    assert parse_porcelain_v2(data) == {
+        "conflict.py": STATUS_CONFLICTED,
+        "untracked.py": STATUS_UNTRACKED,
+        "build dir/": STATUS_UNTRACKED,
+    }
+
+
+def test_undecodable_paths_are_kept():
+    path = parse_porcelain_v2(join(b"? caf\xe9.txt"))
+    assert list(path.values()) == [STATUS_UNTRACKED]
+    assert list(path)[0].encode("utf-8", "surrogateescape") == b"caf\xe9.txt"
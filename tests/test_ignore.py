@@ -0,0 +1,84 @@
+import re
+
+import pytest
+
+pytest.importorskip("gi")
+
+from src.ignore import compile_rules, match_rules, translate_glob  # noqa: E402
+
+
+def is_ignored(lines, relative_path: str, is_folder: bool = False):
+    return match_rules(compile_rules(lines), relative_path, is_folder)
+
+
+@pytest.mark.parametrize(
+    "glob, path, matches",
+    [
+        ("*.py", "main.py", True),
+        ("*.py", "src/main.py", False),
+        ("?.c", "a.c", True),
+        ("?.c", "ab.c", False),
+        ("[abc].txt", "b.txt", True),
+        ("[!abc].txt", "b.txt", False),
+        ("[!abc].txt", "d.txt", True),
+        ("\\*.txt", "*.txt", True),
+        ("\\*.txt", "a.txt", False),
+        ("**/build", "build", True),
+        ("**/build", "a/b/build", True),
+        ("docs/**/index.md", "docs/index.md", True),
+        ("docs/**/index.md", "docs/a/b/index.md", True),
+        ("docs/**", "docs/a/b", True),
+        ("docs/**", "docs", False),
+        ("a+b(c)", "a+b(c)", True),
+    ],
+)
+def test_translate_glob(glob, path, matches):
+    assert bool(re.fullmatch(translate_glob(glob), path)) is matches
+
+
+def test_comments_and_blank_lines_are_skipped():
+    assert compile_rules(["# comment", "", "   ", "/"]) == []
+
+
+def test_names_match_at_any_depth():
+    assert is_ignored(["*.log"], "debug.log") is True
+    assert is_ignored(["*.log"], "a/b/debug.log") is True
+    assert is_ignored(["*.log"], "debug.txt") is None
+
+
+def test_rules_with_a_slash_are_anchored():
+    assert is_ignored(["/build"], "build", True) is True
+    assert is_ignored(["/build"], "src/build", True) is None
+    assert is_ignored(["doc/*.txt"], "doc/notes.txt") is True
+    assert is_ignored(["doc/*.txt"], "src/doc/notes.txt") is None
+
+
+def test_folder_only_rules_skip_files():
+    assert is_ignored(["cache/"], "cache", True) is True
+    assert is_ignored(["cache/"], "a/cache", True) is True
+    assert is_ignored(["cache/"], "cache", False) is None
+
+
+def test_last_matching_rule_wins():
+    assert is_ignored(["*.log", "!keep.log"], "keep.log") is False
+    assert is_ignored(["*.log", "!keep.log"], "other.log") is True
+    assert is_ignored(["!keep.log", "*.log"], "keep.log") is True
+
+
+def test_negated_folder_only_rule():
+    assert is_ignored(["*", "!src/"], "src", True) is False
+    assert is_ignored(["*", "!src/"], "src", False) is True
+
+
+def test_escaped_leading_characters():
+    assert is_ignored(["\\!important"], "!important") is True
+    assert is_ignored(["\\#notes"], "#notes") is True
+
+
+def test_consecutive_rules_share_a_group():
+    rules = compile_rules(["*.o", "*.a", "!lib.a", "build/"])
+    assert [(negate, folder_only) for _regex, negate, folder_only in rules] == [
+        (False, False),
+        (True, False),
+        (False, True),
+    ]
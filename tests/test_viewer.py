@@ -0,0 +1,54 @@
+import pytest
+
+pytest.importorskip("gi")
+
+from src import viewer  # noqa: E402
+
+
+def build_index(data: bytes):
+    line_index = viewer.LineIndex(data)
+    # Build on the calling thread, the test checks the complete index
+    line_index._build_thread()
+    return line_index
+
+
+def get_line_starts(data: bytes) -> list:
+    return [0] + [offset + 1 for offset, byte in enumerate(data) if byte == ord("\n")]
+
+
+@pytest.mark.parametrize("block_size", [1, 2, 3, 4, 8])
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"",
+        b"abcdefghij\nkl\nmnop",
+        b"\n\n\nabc\n",
+        b"a\nbb\nccc\ndddd\neeeee\n",
+        b"no newline in the first block\nsecond\nthird",
+    ],
+)
+def test_line_offsets_are_line_starts(monkeypatch, block_size, data):
+    monkeypatch.setattr(viewer, "INDEX_BLOCK_SIZE", block_size)
+    line_index = build_index(data)
+
+    line_starts = get_line_starts(data)
+    assert line_index.get_line_count() == len(line_starts)
+    for line, line_start in enumerate(line_starts):
+        assert line_index.get_line_offset(line) == line_start
+
+
+def test_line_past_the_end_is_the_last_line(monkeypatch):
+    monkeypatch.setattr(viewer, "INDEX_BLOCK_SIZE", 4)
+    data = b"first line\nsecond\nlast"
+    line_index = build_index(data)
+
+    assert line_index.get_line_offset(10) == get_line_starts(data)[-1]
+
+
+def test_line_numbers_of_offsets(monkeypatch):
+    monkeypatch.setattr(viewer, "INDEX_BLOCK_SIZE", 3)
+    data = b"ab\ncdefg\n\nh"
+    line_index = build_index(data)
+
+    for offset in range(len(data)):
+        assert line_index.get_line_number(offset) == data[:offset].count(b"\n")